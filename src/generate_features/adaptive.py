@@ -0,0 +1,259 @@
+"""Adaptive (event driven) sampling of the own features instead of the fixed analysis grid.
+
+This includes:
+    - Private Methods:
+        _segment_starts(): Grid rows that start a new segment (traj_id change or time gap)
+
+    + Public Methods:
+        sample_indices(): Greedy selection of the rows that are needed within the tolerances
+        thin_own_features(): Keep the selected rows and add their validity interval
+        validity_grid(): Grid steps covered by samples with validity intervals
+        expand_to_grid(): Reconstruct the fixed grid from rows with validity intervals
+        event_steps(): Grid steps at which any ship has a new sample
+
+    + Classes:
+        AdaptiveSampling: Tolerances of the adaptive sampling
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import sys
+sys.path.append("../")
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.macros.macros import ANALYSIS_STEP_SIZE, ACTION_RANGE
+from src.utils.geo_calc.geo import get_geo_distances
+
+
+@dataclass
+class AdaptiveSampling:
+    """Tolerances of the adaptive sampling.
+
+    A sample of a ship stays valid as long as the ship moved less than position_tolerance,
+    turned less than course_tolerance and changed its speed by less than speed_tolerance
+    since the sample, and at most max_interval grid steps. Ships within dense_range of
+    another ship are sampled on every grid step.
+
+    Args:
+        position_tolerance (float, optional): meters. Defaults to 25 (distance_tolerance of the cpa).
+        course_tolerance (float, optional): degrees. Defaults to 5.
+        speed_tolerance (float, optional): knots, also the speed below which course changes
+            are ignored. Defaults to 0.5.
+        max_interval (int, optional): grid steps. Defaults to 100 (10 minutes).
+        dense_range (float, optional): nautical miles, None disables the proximity
+            criterion. Defaults to ACTION_RANGE.
+    """
+
+    position_tolerance: float = 25.0
+    course_tolerance: float = 5.0
+    speed_tolerance: float = 0.5
+    max_interval: int = 100
+    dense_range: float = ACTION_RANGE
+
+
+def _segment_starts(t: np.ndarray, segment_ids: np.ndarray, step: np.timedelta64) -> np.ndarray:
+    """Rows that start a new segment: the first row, traj_id changes and gaps in the grid."""
+    return np.r_[True, (segment_ids[1:] != segment_ids[:-1]) | (np.diff(t) != step)]
+
+
+def sample_indices(lat: np.ndarray,
+                   lon: np.ndarray,
+                   speed: np.ndarray,
+                   angular_difference: np.ndarray,
+                   starts: np.ndarray,
+                   dense: np.ndarray,
+                   sampling: AdaptiveSampling) -> np.ndarray:
+    """Rows of one ship's grid that have to be sampled.
+
+    Distance travelled, course change (while moving) and speed change are accumulated
+    along the rows, the next sample is the first row where one of them exceeds its
+    tolerance since the last sample. Segment starts and dense rows are always sampled.
+
+    Args:
+        lat (np.ndarray): latitudes in degrees
+        lon (np.ndarray): longitudes in degrees
+        speed (np.ndarray): speed in knots
+        angular_difference (np.ndarray): change of direction to the previous row in degrees
+        starts (np.ndarray): bool, rows that start a segment
+        dense (np.ndarray): bool, rows that are sampled in any case
+        sampling (AdaptiveSampling): tolerances
+
+    Returns:
+        np.ndarray: sorted row indices
+    """
+    n = len(lat)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    step_distance = np.zeros(n)
+    step_distance[1:] = get_geo_distances(lat[:-1], lon[:-1], lat[1:], lon[1:],
+                                          distance_method="equirectangular", distance_unit="m")
+    moving = np.nan_to_num(speed) >= sampling.speed_tolerance
+    step_course = np.where(moving, np.nan_to_num(angular_difference), 0)
+    step_speed = np.zeros(n)
+    step_speed[1:] = np.abs(np.diff(np.nan_to_num(speed)))
+
+    # nothing accumulates across segment starts, they are sampled anyway
+    travelled = np.cumsum(np.where(starts, 0, np.nan_to_num(step_distance)))
+    turned = np.cumsum(np.where(starts, 0, step_course))
+    accelerated = np.cumsum(np.where(starts, 0, step_speed))
+
+    forced = np.flatnonzero(starts | dense)
+
+    keep = []
+    k = 0
+    while k < n:
+        keep.append(k)
+        following = np.searchsorted(forced, k, side="right")
+        k = max(k + 1, min(k + sampling.max_interval,
+                           forced[following] if following < len(forced) else n,
+                           np.searchsorted(travelled, travelled[k] + sampling.position_tolerance),
+                           np.searchsorted(turned, turned[k] + sampling.course_tolerance),
+                           np.searchsorted(accelerated, accelerated[k] + sampling.speed_tolerance)))
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def thin_own_features(own: DataFrame,
+                      sampling: AdaptiveSampling,
+                      dense: np.ndarray = None,
+                      step_size: timedelta = ANALYSIS_STEP_SIZE) -> DataFrame:
+    """Keep the rows of sample_indices() of one ship's own features (indexed by t on the grid).
+
+    Every kept row gets the column valid_until: it represents all grid steps
+    t <= t' < valid_until, which never extend over a segment start.
+
+    Args:
+        own (DataFrame): own features with inter_lat, inter_lon, calc_speed, angular_difference, traj_id
+        sampling (AdaptiveSampling): tolerances
+        dense (np.ndarray, optional): bool per row, rows that are kept in any case. Defaults to None.
+        step_size (timedelta, optional): grid step. Defaults to ANALYSIS_STEP_SIZE.
+
+    Returns:
+        DataFrame: the kept rows with valid_until
+    """
+    step = np.timedelta64(step_size)
+    t = own.index.values.astype("datetime64[ns]")
+    starts = _segment_starts(t, own["traj_id"].to_numpy(), step)
+
+    keep = sample_indices(lat=own["inter_lat"].to_numpy(dtype=np.float64),
+                          lon=own["inter_lon"].to_numpy(dtype=np.float64),
+                          speed=own["calc_speed"].to_numpy(dtype=np.float64),
+                          angular_difference=own["angular_difference"].to_numpy(dtype=np.float64),
+                          starts=starts,
+                          dense=np.zeros(len(own), dtype=bool) if dense is None else dense,
+                          sampling=sampling)
+
+    # a sample covers the rows up to the next sample or the end of its segment
+    segment_ends = np.r_[np.flatnonzero(starts)[1:], len(own)]
+    segment_end = segment_ends[np.searchsorted(np.flatnonzero(starts), keep, side="right") - 1]
+    last_row = np.minimum(np.r_[keep[1:], len(own)], segment_end) - 1
+
+    thinned = own.iloc[keep].copy()
+    thinned["valid_until"] = t[last_row] + step
+
+    return thinned
+
+
+def validity_grid(t: np.ndarray,
+                  valid_until: np.ndarray,
+                  step_size: timedelta = ANALYSIS_STEP_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """Grid steps covered by samples that are valid for t <= t' < valid_until.
+
+    Args:
+        t (np.ndarray): sample times, datetime64
+        valid_until (np.ndarray): end of the validity per sample, datetime64
+        step_size (timedelta, optional): grid step. Defaults to ANALYSIS_STEP_SIZE.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: sample index and time (datetime64[ns]) per covered grid step,
+            every sample covers at least its own time step
+    """
+    step = np.timedelta64(step_size)
+    t = np.asarray(t, dtype="datetime64[ns]")
+    valid_until = np.asarray(valid_until, dtype="datetime64[ns]")
+
+    counts = np.maximum(-(-(valid_until - t) // step), 1).astype(np.int64)
+    samples = np.repeat(np.arange(len(t)), counts)
+    offsets = np.arange(len(samples)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return samples, t[samples] + offsets * step
+
+
+def expand_to_grid(thinned: DataFrame,
+                   step_size: timedelta = ANALYSIS_STEP_SIZE) -> DataFrame:
+    """Reconstruct the fixed grid from rows with validity intervals (indexed by t, column valid_until).
+
+    Every row is repeated for each grid step of [t, valid_until), the values are held.
+
+    Args:
+        thinned (DataFrame): result of thin_own_features() or any DataFrame with valid_until
+        step_size (timedelta, optional): grid step. Defaults to ANALYSIS_STEP_SIZE.
+
+    Returns:
+        DataFrame: one row per grid step (indexed by t), without valid_until
+    """
+    samples, t = validity_grid(thinned.index.values, thinned["valid_until"].values, step_size)
+
+    grid = thinned.iloc[samples].drop(columns="valid_until")
+    grid.index = pd.DatetimeIndex(t, name=thinned.index.name)
+
+    return grid
+
+
+def event_steps(own_features: dict,
+                times: np.ndarray,
+                step_size: timedelta = ANALYSIS_STEP_SIZE) -> np.ndarray:
+    """Steps of the time grid at which any ship starts a sample or its last sample expires.
+
+    Between two event steps all states of the ships are held, own features
+    without valid_until are valid for one step (every step of the fixed grid is an event).
+
+    Args:
+        own_features (dict): mmsi -> own features (indexed by t), e.g. of thin_own_features()
+        times (np.ndarray): sorted time grid
+        step_size (timedelta, optional): grid step. Defaults to ANALYSIS_STEP_SIZE.
+
+    Returns:
+        np.ndarray: sorted unique steps of times
+    """
+    times = np.asarray(times, dtype="datetime64[ns]")
+    step = np.timedelta64(step_size)
+
+    events = [np.empty(0, dtype="datetime64[ns]")]
+    for df in own_features.values():
+        if df.empty:
+            continue
+        t = df.index.values.astype("datetime64[ns]")
+        until = df["valid_until"].values.astype("datetime64[ns]") if "valid_until" in df.columns else t + step
+        events.extend([t, until])
+
+    # events off the grid fall on the next step
+    steps = np.unique(np.searchsorted(times, np.concatenate(events)))
+
+    return steps[steps < len(times)]
@@ -0,0 +1,235 @@
+"""Encounter events of ship pairs extracted from the long format s2s table.
+
+This includes:
+    - Private Methods:
+        _hold(): Forward fill of a hysteresis signal
+
+    + Public Methods:
+        encounter_states(): State and encounter id of every record of a PairTable
+        detect_encounters(): One event record per encounter
+
+    + Classes:
+        EncounterThresholds: Hysteresis thresholds of the encounter detection
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+    Replaces the search for close quarters situations in the wide s2s csv files.
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import sys
+sys.path.append("../")
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from pandas import DataFrame
+
+from src.generate_features.pair_table import PairTable
+
+
+##> States of the records in encounter_states()
+ENCOUNTER_STATES = {"none": 0,          # no encounter
+                    "approaching": 1,   # converging, the cpa is close, not yet within range
+                    "in_range": 2,      # within range
+                    "cpa_passed": 3,    # within the encounter, not converging anymore
+                    "departed": 4}      # first record after the encounter
+
+##> Schema of one encounter event (mmsi1 encounters mmsi2)
+ENCOUNTER_DTYPES = {
+    "mmsi1": np.int64,
+    "mmsi2": np.int64,
+    "start": "datetime64[ns]",          # first record of the encounter
+    "end": "datetime64[ns]",            # departure, or the end of the validity of the last record
+    "departed": bool,                   # False if the records end within the encounter
+    "records": np.int64,
+    "t_cpa": "datetime64[ns]",          # record with the minimal ships_distance
+    "min_distance": np.float64,         # nm
+    "min_cpa_distance": np.float64,     # minimal predicted distance at the cpa in nm
+    "lat": np.float64,                  # geometry of mmsi1 at t_cpa
+    "lon": np.float64,
+    "cog": np.float64,
+    "sog": np.float64,
+    "abs_bearing": np.float64,
+    "rel_bearing": np.float64,
+    "rel_speed": np.float64,
+    "start_distance": np.float64,       # geometry at the start
+    "start_abs_bearing": np.float64,
+    "start_rel_bearing": np.float64,
+}
+
+
+@dataclass
+class EncounterThresholds:
+    """Hysteresis thresholds of the encounter detection.
+
+    A pair enters an encounter when the ships are within enter_distance, or when
+    they converge to a cpa within enter_cpa_distance in at most enter_tcpa, and
+    their relative speed is at least min_rel_speed (no encounters of moored ships).
+    The encounter lasts as long as the same holds for the exit thresholds
+    (without the relative speed).
+
+    Args:
+        enter_distance (float, optional): nm. Defaults to 1.0 (ACTION_RANGE).
+        exit_distance (float, optional): nm. Defaults to 1.2.
+        enter_cpa_distance (float, optional): nm. Defaults to 0.25.
+        exit_cpa_distance (float, optional): nm. Defaults to 0.3.
+        enter_tcpa (float, optional): seconds. Defaults to 600.
+        exit_tcpa (float, optional): seconds. Defaults to 900.
+        min_rel_speed (float, optional): knots. Defaults to 0.5.
+        max_gap (timedelta, optional): records of a pair further apart (e.g. the
+            pair was not among the nearest ships) end an encounter. Defaults to 1 minute.
+    """
+
+    enter_distance: float = 1.0
+    exit_distance: float = 1.2
+    enter_cpa_distance: float = 0.25
+    exit_cpa_distance: float = 0.3
+    enter_tcpa: float = 600
+    exit_tcpa: float = 900
+    min_rel_speed: float = 0.5
+    max_gap: timedelta = timedelta(minutes=1)
+
+
+def _hold(signal: np.ndarray) -> np.ndarray:
+    """Forward fill of the NaN entries of signal, signal[0] must be set."""
+    set_at = np.where(np.isnan(signal), 0, np.arange(len(signal)))
+    return signal[np.maximum.accumulate(set_at)]
+
+
+def encounter_states(table: PairTable,
+                     thresholds: EncounterThresholds = None) -> tuple[np.ndarray, np.ndarray]:
+    """State and encounter id of every record of table (in the order of table.df).
+
+    Args:
+        table (PairTable): s2s records
+        thresholds (EncounterThresholds, optional): hysteresis. Defaults to None (EncounterThresholds()).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: ENCOUNTER_STATES per record and encounter id
+            (0, 1, ...) per record, -1 outside of encounters
+    """
+    if thresholds is None:
+        thresholds = EncounterThresholds()
+
+    df = table.df
+    n = len(df)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    distance = df["ships_distance"].to_numpy()
+    cpa_distance = df["cpa_distance"].to_numpy()
+    tcpa = df["tcpa"].to_numpy()
+    t = df["t"].to_numpy()
+
+    # records are sorted by (mmsi1, mmsi2, t), segments break at new pairs and gaps
+    mmsi1, mmsi2 = df["mmsi1"].to_numpy(), df["mmsi2"].to_numpy()
+    new_segment = np.r_[True, (mmsi1[1:] != mmsi1[:-1]) | (mmsi2[1:] != mmsi2[:-1])
+                        | (t[1:] > df["valid_until"].to_numpy()[:-1] + np.timedelta64(thresholds.max_gap))]
+
+    converging = tcpa > 0
+    enter = ((distance <= thresholds.enter_distance)
+             | (converging & (tcpa <= thresholds.enter_tcpa) & (cpa_distance <= thresholds.enter_cpa_distance))) \
+        & (df["rel_speed"].to_numpy() >= thresholds.min_rel_speed)
+    stay = (distance <= thresholds.exit_distance) \
+        | (converging & (tcpa <= thresholds.exit_tcpa) & (cpa_distance <= thresholds.exit_cpa_distance))
+
+    # hysteresis: set on enter, reset when the exit thresholds are left or a segment starts
+    signal = np.where(enter, 1.0, np.where(stay, np.nan, 0.0))
+    signal[new_segment & ~enter] = 0.0
+    active = _hold(signal) == 1.0
+
+    starts = active & (new_segment | ~np.r_[False, active[:-1]])
+    ids = np.where(active, np.cumsum(starts) - 1, -1)
+
+    # converging at any record of the encounter so far
+    was_converging = np.zeros(n, dtype=bool)
+    if starts.any():
+        seen = np.maximum.accumulate(np.where(active & converging, ids, -1))
+        was_converging = active & (seen == ids)
+
+    states = np.full(n, ENCOUNTER_STATES["none"], dtype=np.int64)
+    states[active] = ENCOUNTER_STATES["approaching"]
+    states[active & (distance <= thresholds.enter_distance)] = ENCOUNTER_STATES["in_range"]
+    states[active & ~converging & was_converging] = ENCOUNTER_STATES["cpa_passed"]
+    states[~active & ~new_segment & np.r_[False, active[:-1]]] = ENCOUNTER_STATES["departed"]
+
+    return states, ids
+
+
+def detect_encounters(table: PairTable,
+                      thresholds: EncounterThresholds = None) -> DataFrame:
+    """One event record per encounter of the directed pairs of table.
+
+    The records of mmsi1 -> mmsi2 and mmsi2 -> mmsi1 are tracked separately, as
+    either ship may not be among the nearest ships of the other. The geometry
+    is given as seen from mmsi1, e.g. for the COLREG situation.
+
+    Args:
+        table (PairTable): s2s records, e.g. of calculate_s2s_metrics()
+        thresholds (EncounterThresholds, optional): hysteresis. Defaults to None (EncounterThresholds()).
+
+    Returns:
+        DataFrame: encounter events with the columns of ENCOUNTER_DTYPES, ordered by (mmsi1, mmsi2, start)
+    """
+    states, ids = encounter_states(table, thresholds)
+    in_encounter = np.flatnonzero(ids >= 0)
+    if len(in_encounter) == 0:
+        return DataFrame({c: np.empty(0, dtype=d) for c, d in ENCOUNTER_DTYPES.items()})
+
+    df = table.df
+    ids = ids[in_encounter]
+    first = in_encounter[np.r_[True, ids[1:] != ids[:-1]]]
+    last = in_encounter[np.r_[ids[1:] != ids[:-1], True]]
+
+    # record of the minimal distance per encounter, the first one of ties
+    distance = df["ships_distance"].to_numpy()[in_encounter]
+    order = np.lexsort((in_encounter, distance, ids))
+    closest = in_encounter[order[np.r_[True, ids[order][1:] != ids[order][:-1]]]]
+
+    # the departure record follows the last record of the encounter
+    after = np.minimum(last + 1, len(df) - 1)
+    departed = (last + 1 < len(df)) & (states[after] == ENCOUNTER_STATES["departed"])
+    end = np.where(departed, df["t"].to_numpy()[after], df["valid_until"].to_numpy()[last])
+
+    def _at(rows: np.ndarray, column: str) -> np.ndarray:
+        return df[column].to_numpy()[rows]
+
+    return DataFrame({"mmsi1": _at(first, "mmsi1"),
+                      "mmsi2": _at(first, "mmsi2"),
+                      "start": _at(first, "t"),
+                      "end": end,
+                      "departed": departed,
+                      "records": last - first + 1,
+                      "t_cpa": _at(closest, "t"),
+                      "min_distance": _at(closest, "ships_distance"),
+                      "min_cpa_distance": np.fmin.reduceat(df["cpa_distance"].to_numpy()[in_encounter],
+                                                              np.searchsorted(in_encounter, first)),
+                      "lat": _at(closest, "lat"),
+                      "lon": _at(closest, "lon"),
+                      "cog": _at(closest, "cog"),
+                      "sog": _at(closest, "sog"),
+                      "abs_bearing": _at(closest, "abs_bearing"),
+                      "rel_bearing": _at(closest, "rel_bearing"),
+                      "rel_speed": _at(closest, "rel_speed"),
+                      "start_distance": _at(first, "ships_distance"),
+                      "start_abs_bearing": _at(first, "abs_bearing"),
+                      "start_rel_bearing": _at(first, "rel_bearing")}).astype(ENCOUNTER_DTYPES)
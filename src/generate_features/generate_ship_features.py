@@ -7,27 +7,37 @@ from dataclasses import dataclass
 from itertools import combinations
 from time import sleep
 import multiprocessing
+from multiprocessing import shared_memory
 
 import ast
+import math
 import numpy as np
 import pandas as pd
 from pandas import concat, DataFrame
 
 from geopandas import points_from_xy, GeoDataFrame, GeoSeries
 from movingpandas import Trajectory, TrajectoryCollection, ObservationGapSplitter
-from shapely import Point, Polygon
+from shapely import Point, Polygon, contains_xy
 from shapely.ops import nearest_points
 
 from src.macros.macros import ANALYSIS_STEP_SIZE, ASSESSMENT_RANGE, ACTION_RANGE, NUM_NEAREST_SHIPS, COLUMNS_NEAREST_SHIPS
+from src.macros.macros import COLUMNS_DTYPES
 
-from src.utils.geo_calc.interpolate import pchip_traj_interpolate_at
+from src.utils.geo_calc.interpolate import pchip_traj_interpolate
+from src.utils.geo_calc.kinematics import calc_kinematics
+from src.utils.geo_calc.raster import GeoRaster
+from src.utils.geo_calc.coastline import CoastlineIndex
 from src.utils.geo_calc.geo import _point_to_tuple
 from src.assemble.assemble import ShipTrip
 from src.utils.metrics import abs_bearing_and_distance, rel_bearing
-from src.utils.geo_calc.geo import _point_to_tuple, get_geo_distance
-from src.utils.metrics import get_abs_bearings, get_rel_bearings, relative_speed
-from src.utils.geo_calc.ship import Ship, CAPTN_POINT
-from src.utils.geo_calc.cpa import itterative_cpa
+from src.utils.geo_calc.geo import _point_to_tuple
+from src.utils.metrics import get_pair_metrics, get_colreg_situations
+from src.utils.geo_calc.cpa import cpa_batch, CPACache
+from src.utils.geo_calc.neighbours import nearest_neighbour_pairs
+from src.utils.geo_calc.envelopes import candidate_mask, default_bin_size
+from src.generate_features.pair_table import PairTableBuffer, COLREG_DTYPES, LAND_DTYPES
+from src.generate_features.state_tensor import StateTensor
+from src.generate_features.adaptive import AdaptiveSampling, thin_own_features, event_steps
 
 from src.assemble.assemble import *
 
@@ -77,6 +87,25 @@ def get_active_trajectory(dt: datetime, ship_trip):
     return (id, active)
 
 
+# column layout of the own features as sampled on the time grid
+OWN_FEATURE_DTYPES = {
+    "t": "datetime64[ns]",
+    "epoch": COLUMNS_DTYPES["epoch"],
+    "status": COLUMNS_DTYPES["status"],
+    "heading": COLUMNS_DTYPES["heading"],
+    "course": COLUMNS_DTYPES["course"],
+    "speed": COLUMNS_DTYPES["speed"],
+    "turn": COLUMNS_DTYPES["turn"],
+    "maneuver": COLUMNS_DTYPES["maneuver"],
+    "roa": np.int64,
+    "inter_lat": np.float64,
+    "inter_lon": np.float64,
+    "inter_speed": np.float64,
+    "inter_turn": np.float64,
+    "traj_id": np.int64,
+}
+
+
 ### helper function for converting [str ...] to np.array [mmsi ...]
 def str_to_nparray(array_string):
             array_string = ','.join(array_string.replace('[ ', '[').split())
@@ -130,98 +159,213 @@ class ShipFeatures:
         return rep_str
 
 
+class _OwnFeatureColumns:
+    """Preallocated column arrays for the own features of one ship.
+
+    Slices of rows are written in place and the DataFrame is built once by 
+    to_dataframe(), instead of concatenating one row DataFrame per time step.
+    """
+
+    def __init__(self, size: int, extra_dtypes: dict = None) -> None:
+        self.size = size
+        self.n = 0
+        self.columns = {c: np.empty(size, dtype=d) 
+                        for c, d in {**OWN_FEATURE_DTYPES, **(extra_dtypes or {})}.items()}
+
+    def extend(self, length: int, **values) -> None:
+        for c, v in values.items():
+            self.columns[c][self.n:self.n + length] = v
+        self.n += length
+
+    def to_dataframe(self) -> DataFrame:
+        df = DataFrame({c: a[:self.n] for c, a in self.columns.items()})
+        df.set_index('t', inplace=True)
+
+        return df
+
+
+def get_time_grid(current_date: date,
+                  step_size: timedelta = ANALYSIS_STEP_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the time grid of timerange(current_date) as datetime64 and epoch arrays.
+
+    Naive datetimes are treated as UTC, as are the trajectory timestamps
+    (see preprocess.segment.create_base_trajectory).
+    """
+    grid_times = np.array(list(timerange(current_date, step_size)),
+                          dtype="datetime64[ns]")
+    grid_epochs = grid_times.astype("datetime64[s]").astype(np.int64)
+
+    return grid_times, grid_epochs
+
+
+def get_grid_slice(start: datetime,
+                   end: datetime,
+                   current_date: date,
+                   step_size: timedelta = ANALYSIS_STEP_SIZE) -> tuple[int, int]:
+    """Returns the first and last (inclusive) grid index on current_date within [start, end].
+
+    The slice is empty if first > last.
+    """
+    day_start = datetime.combine(current_date, time())
+    num_steps = int(timedelta(days=1) / step_size) + 1
+
+    first = max(0, math.ceil((start - day_start) / step_size))
+    last = min(num_steps - 1, math.floor((end - day_start) / step_size))
+
+    return first, last
+
+
+def rate_of_ais(epochs: np.ndarray,
+                grid_epochs: np.ndarray,
+                window: timedelta = ANALYSIS_STEP_SIZE) -> np.ndarray:
+    """Number of AIS messages within (t - window, t] for every grid epoch t.
+
+    Two binary searches of the window edges into the sorted message epochs, 
+    O((n + g) log n) for n messages and g grid points.
+
+    Args:
+        epochs (np.ndarray): Epochs of the messages of one trajectory
+        grid_epochs (np.ndarray): Epochs of the grid points to count for
+        window (timedelta, optional): Length of the counting window. Defaults to ANALYSIS_STEP_SIZE.
+
+    Returns:
+        np.ndarray: message count per grid point
+    """
+    epochs = np.sort(np.asarray(epochs, dtype=np.float64))
+    grid_epochs = np.asarray(grid_epochs, dtype=np.float64)
+
+    upper = np.searchsorted(epochs, grid_epochs, side="right")
+    lower = np.searchsorted(epochs, grid_epochs - window.total_seconds(), side="right")
+
+    return upper - lower
+
+
+def _rows_at(trajectory: Trajectory, times: np.ndarray) -> DataFrame:
+    """Vectorized Trajectory.get_row_at(t) (nearest row) for an array of times."""
+    df = trajectory.df
+    df = df[~df.index.duplicated(keep="first")].sort_index()
+    positions = df.index.get_indexer(times, method="nearest")
+
+    return df.iloc[positions]
+
+
+def _calc_trip_own_features(trip,
+                            current_date,
+                            roa_windows: dict = None) -> DataFrame:
+    """Samples the own features of a single ship trip on the time grid of current_date.
+
+    roa_windows optionally maps additional column names to counting windows,
+    e.g. {"roa_1min": timedelta(minutes=1)} for the messages per minute.
+    """
+    roa_windows = roa_windows or {}
+
+    grid_times, grid_epochs = get_time_grid(current_date)
+
+    # grid indices per trajectory, a grid point belongs to the first 
+    # trajectory that contains it
+    claimed = np.zeros(len(grid_times), dtype=bool)
+    slices = []
+    for active_id, trajectory in enumerate(trip.trajectories):
+        first, last = get_grid_slice(trajectory.get_start_time(),
+                                     trajectory.get_end_time(),
+                                     current_date)
+        if first > last:
+            continue
+
+        idx = np.arange(first, last + 1)
+        idx = idx[~claimed[idx]]
+        claimed[idx] = True
+
+        if idx.size > 0:
+            slices.append((active_id, trajectory, idx))
+
+    columns = _OwnFeatureColumns(sum(idx.size for _, _, idx in slices),
+                                 extra_dtypes={c: np.int64 for c in roa_windows})
+
+    for active_id, trajectory, idx in slices:
+        times = grid_times[idx]
+
+        ### get own ship features ###
+        data = _rows_at(trajectory, times)
+
+        # t is discrete time step
+        # number of rows (i.e. AIS signals) in the interval from t-1 to t
+        epochs = trajectory.df["epoch"].to_numpy()
+        roa = rate_of_ais(epochs, grid_epochs[idx])
+        roa_extra = {c: rate_of_ais(epochs, grid_epochs[idx], w) 
+                     for c, w in roa_windows.items()}
+
+        ### get interpolated values for position, speed etc.
+        ### these are the calculated values for heading, speed and so on, as in the papers
+        inter_values = pchip_traj_interpolate(trajectory, grid_epochs[idx])
+
+        columns.extend(idx.size,
+                       t=times,
+                       epoch=data["epoch"].to_numpy(),
+                       status=data["status"].to_numpy(),
+                       heading=data["heading"].to_numpy(),
+                       course=data["course"].to_numpy(),
+                       speed=data["speed"].to_numpy(),
+                       turn=data["turn"].to_numpy(),
+                       maneuver=data["maneuver"].to_numpy(),
+                       roa=roa,
+                       inter_lat=inter_values["lat"],
+                       inter_lon=inter_values["lon"],
+                       inter_speed=inter_values["speed"],
+                       inter_turn=inter_values["turn"],
+                       # increasing id for each subtrajectory i: 0 <= i <= n
+                       traj_id=active_id,
+                       **roa_extra)
+
+    return columns.to_dataframe()
+
+
+def get_active_ships_table(ship_features, current_date) -> DataFrame:
+    """Returns the mmsi of all ships with own features per time step of current_date."""
+
+    grid_times, _ = get_time_grid(current_date)
+
+    frames = [DataFrame({"t": sf.own.index, "mmsi": mmsi}) 
+              for mmsi, sf in ship_features.items() if not sf.own.empty]
+
+    active = pd.Series([np.array([]) for _ in grid_times],
+                       index=pd.DatetimeIndex(grid_times, name="t"),
+                       dtype=object)
+
+    if frames:
+        # group the (t, mmsi) records by t, keeping the order of the ships
+        records = concat(frames).sort_values("t", kind="stable")
+        times, starts = np.unique(records["t"].to_numpy(), return_index=True)
+        groups = np.split(records["mmsi"].to_numpy(), starts[1:])
+
+        active.loc[times] = pd.Series(groups, index=times, dtype=object)
+
+    return DataFrame({"active_ships": active})
+
+
 def _calc_own_features(ship_trips,
                        ship_features,
-                       current_date):
+                       current_date,
+                       num_workers: int = 1,
+                       roa_windows: dict = None):
     
-    # initial time step at 00:00:00 on current_date
-    t_prev = datetime(current_date.year,
-                        current_date.month,
-                        current_date.day)
-
-    active_ships_df = DataFrame()
-
-    ########################################################
-    ### Main Loop: sample the data in discrete time steps ###
-    #########################################################
-    for t in timerange(current_date):
-
-        active = get_active_ships(t, ship_trips)
-
-        # collect the mmsi of all active ships at t
-        active_ships_df = concat([
-            active_ships_df,
-            DataFrame(data={"t": [t], 
-                            "active_ships": [np.array([a.mmsi for a in active])]
-                            }).set_index("t")
-        ])
-        # save those as a column in s2s csv later
-
-        ### iterate through active ships at time t ###
-        for sample in active:
-
-            active_id, active_trajectory = get_active_trajectory(t, sample)
-
-            if active_trajectory is None:
-                continue
-
-            ### get own ship features ###
-            data = active_trajectory.get_row_at(t)
-
-            features = {}
-            features["t"] = [t]    
-            features["epoch"] = [data["epoch"]]
-            features["status"] = [data["status"]]
-            features["heading"] = [data["heading"]]
-            features["course"] = [data["course"]]
-            features["speed"] = [data["speed"]]
-            features["turn"] = [data["turn"]]
-            features["maneuver"] = [data["maneuver"]]
-            
-            # t is discrete time step
-            # create time interval inter from t-1 to t, 
-            # and extract the namuber of rows (i.e. AIS signals) in inter
-            mask = active_trajectory.df.index.indexer_between_time(
-                t_prev.time(),
-                t.time(),
-                include_start=True,
-                include_end=True)
-
-            roa = len(active_trajectory.df.iloc[mask].index)
-            features["roa"] = [roa]
-
-            ### 2. get interpolated values for position, speed etc.
-            ### these are the calculated values for heading, speed and so on, as in the papers
-            
-            # interp. Position
-            t_epoch = int(t.timestamp())
-            inter_values = pchip_traj_interpolate_at(active_trajectory,
-            # interpolated_pos = active_trajectory.interpolate_position_at(t)
-                                                        t_epoch)
-            features["inter_lat"] = inter_values["lat"]
-            features["inter_lon"] = inter_values["lon"]
-            features["inter_speed"] = inter_values["speed"]
-            features["inter_turn"] = inter_values["turn"]
-
-            ### trajectory point features ###
-
-            # increasing id for each subtrajectory i: 0 <= i <= n
-            features["traj_id"] = active_id
-            
-            df = DataFrame.from_dict(features, 
-                                        orient='columns',
-                                    #  dtype=None, 
-                                    #  columns=None
-                                    )
-            df.set_index('t', inplace=True)
-
-
-            ship_features[sample.mmsi].own = concat(
-                [ship_features[sample.mmsi].own, df]
-                )  
-            
-            # update t-1 time step
-            t_prev = t
+    #######################################################
+    ### Main Loop: sample each ship on its grid slices ###
+    #######################################################
+    if num_workers > 1:
+        with multiprocessing.Pool(num_workers) as pool:
+            own = pool.starmap(_calc_trip_own_features,
+                               [(trip, current_date, roa_windows) for trip in ship_trips])
+    else:
+        own = [_calc_trip_own_features(trip, current_date, roa_windows) 
+               for trip in ship_trips]
+
+    for trip, own_df in zip(ship_trips, own):
+        ship_features[trip.mmsi].own = own_df
+
+    # collect the mmsi of all active ships per t
+    # save those as a column in s2s csv later
+    active_ships_df = get_active_ships_table(ship_features, current_date)
 
     return ship_features, active_ships_df
 
@@ -236,88 +380,94 @@ def _add_calculated_features(ship_list):
         # add mmsi column
         s_features.own['mmsi']= s_mmsi
 
-        # setup
-        results = []
-        s_features.own[["calc_speed", 
-                        "direction", 
-                        "angular_difference", 
-                        "calc_acc"]] = np.NaN
-        
-        # Group by "traj_id" and create Trajectory objects
-        by_group = s_features.own.groupby("traj_id")
-        for traj_id, group in by_group:
-
-            # base trajectory for mpd functions
-            traj = Trajectory(group,
-                            traj_id=traj_id,
-                            obj_id=s_mmsi,
-                            t="t", 
-                            x="inter_lat",
-                            y="inter_lon",
-                            crs="epsg:4326")
-            
-            # calculated SOG
-            traj.add_speed(overwrite=True,
-                        name="calc_speed",
-                        units=("nm", "h")
-                        )
-            
-            # calculated COG
-            traj.add_direction(overwrite=True,
-                            name="direction"
-                        )        
-            
-            # calculated ROT
-            traj.add_angular_difference(overwrite=True)
-            
-            # calculated acceleration
-            traj.add_acceleration(overwrite=True,
-                                name="calc_acc",
-                                units=("nm", "h", "h")
-                                )
-
-            # add interpolated positions            
-            traj.df["inter_lat"] = traj.df.geometry.x
-            traj.df["inter_lon"] = traj.df.geometry.y
-
-            # buffer to be concatenated next
-            results.append(traj.df)
-
-        # collect the new data frames from grouping and overwrite
-        s_features.own = concat(results)
+        if s_features.own.empty:
+            continue
+
+        # calculated SOG, COG, ROT and acceleration for all trajectories
+        # of the ship at once, values are not taken across traj_id boundaries
+        kinematics = calc_kinematics(
+            lat=s_features.own["inter_lat"].to_numpy(),
+            lon=s_features.own["inter_lon"].to_numpy(),
+            t=s_features.own.index.to_numpy().astype("datetime64[ns]").astype(np.int64) / 1e9,
+            segment_ids=s_features.own["traj_id"].to_numpy())
+
+        for column, values in kinematics.items():
+            s_features.own[column] = values
 
     return ship_list
 
 
+def _own_lat_lon(gdf: DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Interpolated positions of the own features, or the (lon, lat) geometry."""
+    if ("inter_lat" in gdf.columns) and ("inter_lon" in gdf.columns):
+        return gdf["inter_lat"].to_numpy(), gdf["inter_lon"].to_numpy()
+
+    return gdf.geometry.y.to_numpy(), gdf.geometry.x.to_numpy()
+
+
 def add_within_waterways(gdf: GeoDataFrame,
-                         geom: Polygon):
+                         geom: Polygon,
+                         raster: GeoRaster = None):
     ### working within_waterways feature ###
-    gdf['in_waterways'] = gdf.geometry.apply(lambda x: x.within(geom)).astype(int)
+    lat, lon = _own_lat_lon(gdf)
+
+    if raster is None:
+        gdf['in_waterways'] = contains_xy(geom, lon, lat).astype(int)
+    else:
+        # exact test only close to the polygon's boundary
+        gdf['in_waterways'] = raster.contains(lat, lon, polygon=geom).astype(int)
 
     return gdf
 
 
 def add_distance_shoreline(gdf: GeoDataFrame,
-                           geom: Polygon):
-    
-    # get polygon's nearest point for each point in geometry
-    n = gdf.geometry.apply(lambda x: nearest_points(geom, x)[0])
-    n.columns = ["geometry"]
+                           geom: Polygon | CoastlineIndex,
+                           raster: GeoRaster = None):
+    """Adds the column distance_shore in kilometers, 0 for positions inside a land polygon."""
+    lat, lon = _own_lat_lon(gdf)
 
+    # nearest coastline segment from the STRtree, build the index once
+    # and pass it instead of the geometry when called per ship
+    if not isinstance(geom, CoastlineIndex):
+        geom = CoastlineIndex(geom)
 
-    pts = DataFrame(gdf.geometry)
-    pts['n_pts'] = pts["geometry"].apply(
-        lambda x: nearest_points(geom, x)[0])    
+    if raster is None:
+        distance = geom.distance(lat, lon)
+    else:
+        # exact distance only close to the coastline
+        distance = raster.distance_at(lat, lon, geometry=geom)
 
-    # get geo distance returns in kilometer
-    gdf["distance_shore"] = pts.apply(lambda x:
-                        get_geo_distance(x["geometry"], 
-                                         x["n_pts"]),
-                        axis=1)
+    # distance in kilometer
+    gdf["distance_shore"] = distance / 1000
 
     return gdf
 
 
+def _thin_own_features(ship_features,
+                       current_date,
+                       sampling: AdaptiveSampling):
+    """Thins the own features of all ships, dense where a ship can be within sampling.dense_range of another."""
+    own = {mmsi: sf.own for mmsi, sf in ship_features.items()}
+
+    dense = None
+    if sampling.dense_range is not None:
+        tensor = StateTensor.from_own_features(own, np.array(list(timerange(current_date)), dtype="datetime64[ns]"))
+        dense = candidate_mask(tensor.lat, tensor.lon, tensor.valid, max_distance=sampling.dense_range)
+
+    for mmsi, sf in ship_features.items():
+        if sf.own.empty:
+            continue
+
+        ship_dense = None
+        if dense is not None:
+            steps = np.searchsorted(tensor.times, sf.own.index.values.astype("datetime64[ns]"))
+            ship_dense = dense[tensor.rows([mmsi])[0], np.minimum(steps, len(tensor.times) - 1)]
+
+        sf.own = thin_own_features(sf.own, sampling, dense=ship_dense)
+
+    return ship_features
+
+
 def dump_own_features(src, trg, ship_features, active_ships, dt):
 
     #####################################
@@ -354,7 +504,7 @@ def dump_own_features(src, trg, ship_features, active_ships, dt):
         static_df.to_csv(ship_path + "_static.csv", index=True)
 
         # own fearures
-        own_df = sf.own.drop(columns='geometry')
+        own_df = sf.own.drop(columns='geometry', errors='ignore')
         own_df.to_csv(ship_path + "_own.csv", index=True)
 
     # s2s features (per full day)
@@ -370,7 +520,24 @@ def calculate_own_features(ship_trips,
                            trg, 
                            current_date,
                            waterways: Polygon = None,
-                           shoreline: Polygon = None):
+                           shoreline: Polygon | CoastlineIndex = None,
+                           waterways_raster: GeoRaster = None,
+                           shoreline_raster: GeoRaster = None,
+                           sampling: AdaptiveSampling = None,
+                           num_workers: int = 1,
+                           roa_windows: dict = None):
+    """Own features of all ships of current_date, dumped to trg.
+
+    With num_workers > 1 the ship trips are sampled by a process pool.
+    roa_windows adds message count columns, e.g. {"roa_1min": timedelta(minutes=1)}
+    (see _calc_trip_own_features).
+
+    With sampling, the own features are calculated on the fixed grid and then
+    thinned to the samples that are needed within the tolerances of sampling
+    (see thin_own_features), every dumped row gets a valid_until column. Ships
+    within sampling.dense_range of another ship keep every grid step. The geo
+    features are only calculated for the kept rows.
+    """
     
     ### create dictionary of ship features, indexed by mmsi
     ship_features = {}
@@ -381,15 +548,30 @@ def calculate_own_features(ship_trips,
 
     ship_features, active_ships = _calc_own_features(ship_trips, 
                                                      ship_features, 
-                                                     current_date)
+                                                     current_date,
+                                                     num_workers=num_workers,
+                                                     roa_windows=roa_windows)
 
     # add the interpolated features from the mpd calculations
     ship_features = _add_calculated_features(ship_features)
 
+    # keep only the rows needed within the sampling tolerances
+    if sampling is not None:
+        ship_features = _thin_own_features(ship_features, current_date, sampling)
+
     # add ship to geo features
-    for gdf in ship_features.items():
-        gdf = add_within_waterways(gdf, waterways)
-        gdf = add_distance_shoreline(gdf, shoreline)
+    if shoreline is not None and not isinstance(shoreline, CoastlineIndex):
+        shoreline = CoastlineIndex(shoreline)
+
+    # precomputed rasters (see utils.geo_calc.raster.get_geo_raster) replace
+    # the exact geometry tests away from the polygon boundaries
+    for sf in ship_features.values():
+        if sf.own.empty:
+            continue
+        if waterways is not None:
+            sf.own = add_within_waterways(sf.own, waterways, waterways_raster)
+        if shoreline is not None:
+            sf.own = add_distance_shoreline(sf.own, shoreline, shoreline_raster)
 
     # save the calculated features on disc
     rc = dump_own_features(src, trg, ship_features, active_ships, current_date)
@@ -397,226 +579,403 @@ def calculate_own_features(ship_trips,
     return 0
 
 
+##> Time chunks per worker of the parallel s2s metrics (load balancing)
+S2S_CHUNKS_PER_WORKER = 4
+
+##> Arrays of the StateTensor of the s2s time chunks
+S2S_TENSOR_ARRAYS = ("times", "mmsis", "lat", "lon", "cog", "sog", "valid")
+##> Arrays of the s2s time chunks: evaluated steps with their validity (see event_steps), 
+##> active ships (see get_active_rows) and StateTensor
+S2S_ARRAYS = ("steps", "until", "offsets", "rows") + S2S_TENSOR_ARRAYS
+
+##> Handling of the pairs separated by land in calculate_s2s_metrics()
+S2S_LAND_MODES = ("drop", "flag")
+
+##> Extra neighbours and relative range of the KD-tree query (spherical chord distance)
+##> over the WGS84 distances that rank the pairs and limit them to max_range
+S2S_NEIGHBOUR_MARGIN = 2
+S2S_RANGE_TOLERANCE = 1.01
+
+# arrays of the s2s worker processes, attached to shared memory by _init_s2s_worker()
+_s2s_shared = {}
+
+
+def get_active_rows(s2s_df, 
+                    tensor: StateTensor) -> tuple[np.ndarray, np.ndarray]:
+    """Rows of the state tensor of the active ships of all time steps of the tensor.
+
+    Args:
+        s2s_df (DataFrame): active ships per time step, list-likes of mmsis (e.g. np.ndarray 
+            or list), NaN or None for no active ships
+        tensor (StateTensor): states of the day
+
+    Raises:
+        ValueError: Entries that are no list-like of mmsis, e.g. strings of a csv file 
+            that were not converted with str_to_nparray
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 
+            offsets (T + 1): rows[offsets[k]:offsets[k + 1]] are active at tensor.times[k]
+            rows: tensor row per active ship in the order of s2s_df (-1 for unknown mmsis)
+    """
+    active = s2s_df['active_ships'].reindex(pd.DatetimeIndex(tensor.times))
+    # any list-like of mmsis, only missing time steps (NaN, None) are empty
+    active = [np.empty(0, dtype=np.int64) if a is None or (np.ndim(a) == 0 and pd.isna(a))
+              else np.atleast_1d(np.asarray(a, dtype=np.int64)) for a in active]
+
+    offsets = np.concatenate([[0], np.cumsum([len(a) for a in active])]).astype(np.int64)
+    rows = tensor.rows(np.concatenate(active)) if active else np.empty(0, dtype=np.int64)
+
+    return offsets, rows
+
+
+def _s2s_time_step(buffer: PairTableBuffer,
+                   t,
+                   valid_until,
+                   mmsis: np.ndarray,
+                   states: np.ndarray,
+                   ITERATION_STEP_SIZE,
+                   max_range: float = None,
+                   cpa_method: str = "analytic",
+                   cpa_cache: CPACache = None,
+                   colreg: bool = False,
+                   coastline: CoastlineIndex = None,
+                   land_mode: str = "drop") -> None:
+    """Appends the s2s records of one time step to buffer, states as of StateTensor.states().
+
+    The records hold for t <= t' < valid_until. With colreg, the COLREG_DTYPES 
+    columns are added, with coastline and land_mode "flag" the LAND_DTYPES columns 
+    (the buffer must have been created with them, see _s2s_extra_dtypes()).
+    """
+
+    # candidate pairs of the KD-tree, with a margin over the spherical distance of the tree
+    pairs = nearest_neighbour_pairs(lat=states[:, 0],
+                                    lon=states[:, 1],
+                                    k=NUM_NEAREST_SHIPS + S2S_NEIGHBOUR_MARGIN,
+                                    max_distance=None if max_range is None else max_range * S2S_RANGE_TOLERANCE)
+    if len(pairs) == 0:
+        return
+
+    # bearings, distance (vicinity formula) and relative speed of all pairs at once
+    s1, s2 = states[pairs[:, 0]], states[pairs[:, 1]]
+    pair_metrics = get_pair_metrics(lat1=s1[:, 0], lon1=s1[:, 1], heading1=s1[:, 2], speed1=s1[:, 3],
+                                    lat2=s2[:, 0], lon2=s2[:, 1], heading2=s2[:, 2], speed2=s2[:, 3])
+
+    def _subset(keep: np.ndarray):
+        return pairs[keep], s1[keep], s2[keep], {c: v[keep] for c, v in pair_metrics.items()}
+
+    # max_range on the WGS84 distance, before the pairs are ranked
+    if max_range is not None:
+        pairs, s1, s2, pair_metrics = _subset(pair_metrics["distance"] <= max_range)
+        if len(pairs) == 0:
+            return
+
+    # pairs on opposite sides of a pier or peninsula, no encounter is possible
+    separated = np.zeros(len(pairs), dtype=bool)
+    if coastline is not None:
+        separated = coastline.crosses(lat1=s1[:, 0], lon1=s1[:, 1], lat2=s2[:, 0], lon2=s2[:, 1])
+        if land_mode == "drop":
+            pairs, s1, s2, pair_metrics = _subset(~separated)
+            separated = separated[~separated]
+            if len(pairs) == 0:
+                return
+
+    ########################################
+    ### calculate the s2s metrics values ###
+    ########################################
+
+    # CPA of all pairs in sight of each other at once, unchanged pairs from the cache
+    visible = ~separated
+    cpa = (cpa_batch if cpa_cache is None else cpa_cache.cpa_batch)(
+        lat1=s1[visible, 0], lon1=s1[visible, 1], sog1=s1[visible, 3], cog1=s1[visible, 2],
+        lat2=s2[visible, 0], lon2=s2[visible, 1], sog2=s2[visible, 3], cog2=s2[visible, 2],
+        method=cpa_method,
+        time_step_size=ITERATION_STEP_SIZE)
+
+    # flagged pairs have no cpa
+    if not visible.all():
+        flagged = {}
+        for c in ("tcpa", "distance", "dcpa1", "dcpa2", "c_lat1", "c_lon1", "c_lat2", "c_lon2"):
+            flagged[c] = np.full(len(pairs), np.nan)
+            flagged[c][visible] = cpa[c]
+        cpa = flagged
+
+    ###########################################
+    ### prepare the output per mmsi in pair ###
+    ###########################################
+
+    # every pair as two records: mmsi_1 -> mmsi_2 and mmsi_2 -> mmsi_1
+    src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    trg = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    ships_distance = np.tile(pair_metrics["distance"], 2)
+
+    # NUM_NEAREST_SHIPS nearest ships per src ship, ties in pair order
+    order = np.lexsort((np.tile(np.arange(len(pairs)), 2), ships_distance, src))
+    src, trg = src[order], trg[order]
+    counts = np.bincount(src, minlength=len(mmsis))
+    rank = np.arange(len(src)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keep = rank < NUM_NEAREST_SHIPS
+    order, src, trg, rank = order[keep], src[keep], trg[keep], rank[keep]
+
+    def _both(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.concatenate([a, b])[order]
+
+    # situation and role of both ships of all pairs at once
+    colreg_columns = {}
+    if colreg:
+        situations = get_colreg_situations(rel_bearing_12=pair_metrics["rel_bearing_12"], 
+                                           rel_bearing_21=pair_metrics["rel_bearing_21"],
+                                           course1=s1[:, 2], course2=s2[:, 2],
+                                           speed1=s1[:, 3], speed2=s2[:, 3],
+                                           tcpa=cpa["tcpa"])
+        colreg_columns = {"colreg_situation": _both(situations["situation"], situations["situation"]),
+                          "colreg_role": _both(situations["role_1"], situations["role_2"])}
+
+    land_columns = {}
+    if coastline is not None and land_mode == "flag":
+        land_columns = {"land_separated": _both(separated, separated)}
+
+    buffer.append(t=t,
+                  valid_until=valid_until,
+                  mmsi1=mmsis[src],
+                  mmsi2=mmsis[trg],
+                  rank=rank,
+                  lat=states[src, 0],
+                  lon=states[src, 1],
+                  cog=states[src, 2],
+                  sog=states[src, 3],
+                  abs_bearing=_both(pair_metrics["abs_bearing_12"], pair_metrics["abs_bearing_21"]),
+                  rel_bearing=_both(pair_metrics["rel_bearing_12"], pair_metrics["rel_bearing_21"]),
+                  tcpa=_both(cpa["tcpa"], cpa["tcpa"]),
+                  dcpa=_both(cpa["dcpa1"], cpa["dcpa2"]),
+                  c_lat=_both(cpa["c_lat1"], cpa["c_lat2"]), # crash position
+                  c_lon=_both(cpa["c_lon1"], cpa["c_lon2"]), # crash position
+                  ships_distance=ships_distance[order],
+                  rel_speed=_both(pair_metrics["rel_speed"], pair_metrics["rel_speed"]),
+                  cpa_distance=_both(cpa["distance"], cpa["distance"]),
+                  **colreg_columns,
+                  **land_columns)
+
+
+def _s2s_extra_dtypes(colreg: bool,
+                      coastline: CoastlineIndex = None,
+                      land_mode: str = "drop") -> dict:
+    """Optional columns of the s2s records."""
+    return {**(COLREG_DTYPES if colreg else {}),
+            **(LAND_DTYPES if coastline is not None and land_mode == "flag" else {})}
+
+
+def _s2s_time_chunk(first: int,
+                    last: int,
+                    ITERATION_STEP_SIZE,
+                    max_range: float = None,
+                    cpa_method: str = "analytic",
+                    colreg: bool = False,
+                    land_mode: str = "drop",
+                    arrays: dict = None,
+                    cpa_cache: CPACache = None,
+                    coastline: CoastlineIndex = None) -> PairTableBuffer:
+    """s2s records of the evaluated steps first:last (arrays["steps"][first:last]).
+
+    arrays (S2S_ARRAYS), cpa_cache and coastline default to the shared memory 
+    arrays, the CPA cache and the coastline of the worker process.
+    """
+    if arrays is None:
+        arrays, cpa_cache, coastline = _s2s_shared, _s2s_shared.get("cpa_cache"), _s2s_shared.get("coastline")
+    steps, until, offsets, rows = arrays["steps"], arrays["until"], arrays["offsets"], arrays["rows"]
+    tensor = StateTensor(**{key: arrays[key] for key in S2S_TENSOR_ARRAYS})
+
+    buffer = PairTableBuffer(_s2s_extra_dtypes(colreg, coastline, land_mode))
+    for i in range(first, last):
+        k = steps[i]
+        # phantom active ships have no valid state and are dropped
+        mmsis, states = tensor.states(k, rows[offsets[k]:offsets[k + 1]])
+        _s2s_time_step(buffer, tensor.times[k], until[i], mmsis, states,
+                       ITERATION_STEP_SIZE, max_range, cpa_method, cpa_cache, colreg,
+                       coastline, land_mode)
+
+    return buffer
+
+
+def _s2s_worker_chunk(*args) -> tuple[PairTableBuffer, tuple]:
+    """_s2s_time_chunk() in a worker process, returns the records and the 
+    (hits, misses, evictions) of the worker's CPA cache during this chunk."""
+    cache = _s2s_shared.get("cpa_cache")
+    if cache is None:
+        return _s2s_time_chunk(*args), (0, 0, 0)
+
+    before = (cache.hits, cache.misses, cache.evictions)
+    buffer = _s2s_time_chunk(*args)
+
+    return buffer, (cache.hits - before[0], cache.misses - before[1], cache.evictions - before[2])
+
+
+def _to_shared_memory(array: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple]:
+    """Copies array into a new shared memory block, returns the block and (name, shape, dtype)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _init_s2s_worker(specs: dict, 
+                     cpa_cache_config: dict = None, 
+                     coastline: CoastlineIndex = None) -> None:
+    """Pool initializer, attaches the arrays of calculate_s2s_metrics() without copying
+    and creates the CPA cache of the worker. The coastline is sent once per worker."""
+    if cpa_cache_config is not None:
+        _s2s_shared["cpa_cache"] = CPACache(**cpa_cache_config)
+    if coastline is not None:
+        _s2s_shared["coastline"] = coastline
+
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        # keep the block referenced as long as the view is in use
+        _s2s_shared[key + "_shm"] = shm
+        _s2s_shared[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
 def calculate_s2s_metrics(s2s_df,
                           own_features,
                           current_date,
                           all_mmsis,
-                          ITERATION_STEP_SIZE):
+                          ITERATION_STEP_SIZE,
+                          max_range: float = None,
+                          cpa_method: str = "analytic",
+                          num_workers: int = 1,
+                          cpa_cache: CPACache = None,
+                          colreg: bool = False,
+                          coastline: Polygon | CoastlineIndex = None,
+                          land_mode: str = "drop"):
+    """Ship to ship metrics of the NUM_NEAREST_SHIPS nearest ships of every active ship.
+
+    Per time step, the candidate pairs are selected with a KD-tree over the ship
+    positions before any pairwise metric is calculated: only pairs where one ship
+    is among the NUM_NEAREST_SHIPS + S2S_NEIGHBOUR_MARGIN nearest neighbours of the
+    other are evaluated. The tree ranks by the spherical distance, the records by
+    the WGS84 distance (ships_distance); the margin covers the difference between
+    both, except for near ties of ships far apart from each other. Pairs beyond
+    max_range (WGS84) are dropped before they are ranked.
+
+    The states of all ships are scattered once into a dense ships x time grid
+    StateTensor, the states of the active ships per time step are fancy indexed.
+    With max_range, a pre-pass over time-binned envelopes of the ships removes
+    the ships that are not within max_range of any other ship during a bin.
+
+    The time steps are independent: with num_workers > 1 the day is split into
+    time chunks that are processed by a process pool. The workers read the state
+    tensor from shared memory, the own feature DataFrames are not sent to them.
+    The chunks are merged in time order.
+
+    With a cpa_cache, the CPA of pairs with unchanged kinematics (e.g. moored
+    ships) is taken from the cache. Worker processes keep their own caches with
+    the same settings, their hit statistics are added to cpa_cache.
+
+    Own features of the adaptive sampling (valid_until, see calculate_own_features)
+    are held over their validity, only the time steps at which any ship has a new
+    sample are evaluated (event_steps). Every record holds until the next evaluated
+    step (column valid_until), PairTable.to_grid() restores the fixed grid.
+
+    With colreg, every record gets the COLREG situation of the pair and the role
+    of mmsi1 (COLREG_DTYPES, see utils.metrics.get_colreg_situations).
+
+    With a coastline, pairs whose line of sight crosses land (e.g. on opposite
+    sides of a pier) are tested in one STRtree query per time step before the 
+    CPA. They are dropped, so they do not take a rank, or flagged (LAND_DTYPES) 
+    and kept without CPA.
+
+    Args:
+        s2s_df (DataFrame): active ships per time step
+        own_features (dict): mmsi -> own features (indexed by t), optionally with valid_until
+        current_date (date): analysed day
+        all_mmsis (list): mmsis of the analysed day (kept for the call signature, see PairTable.to_wide())
+        ITERATION_STEP_SIZE (int): time step size of the iterative cpa in seconds
+        max_range (float, optional): ignore pairs with a ships_distance (WGS84) above
+            this distance in nautical miles, e.g. ASSESSMENT_RANGE. Defaults to None (no limit).
+        cpa_method (str, optional): method of cpa_batch, "analytic" (closed form),
+            "iterative" (ITERATION_STEP_SIZE steps) or "adaptive" (first step
+            ITERATION_STEP_SIZE, bracketing search). Defaults to "analytic".
+        num_workers (int, optional): number of worker processes. Defaults to 1.
+        cpa_cache (CPACache, optional): cache of the CPA results, see CPACache.stats
+            for the hit rate. Defaults to None (no caching).
+        colreg (bool, optional): add the COLREG_DTYPES columns. Defaults to False.
+        coastline (Polygon | CoastlineIndex, optional): coastline or land/water polygon 
+            of the line of sight test. Defaults to None (no test).
+        land_mode (str, optional): "drop" or "flag" the pairs separated by land. Defaults to "drop".
+
+    Returns:
+        PairTable: long format s2s table, one row per (t, mmsi1, mmsi2) with rank and 
+            metrics, PairTable.to_wide(all_mmsis) gives mmsi -> wide s2s dataframe (indexed by t)
+    """
     
-    ## big dataframes! 
-    ## mmsi -> df (indexes t)
-    s2s_dataframes_to_dump = {}
-    for mmsi in all_mmsis:
-        s2s_dataframes_to_dump[mmsi] = DataFrame()
+    if land_mode not in S2S_LAND_MODES:
+        raise ValueError(f"Accepted land modes are {S2S_LAND_MODES}")
+
+    # build the STRtree of the coastline once
+    if coastline is not None and not isinstance(coastline, CoastlineIndex):
+        coastline = CoastlineIndex(coastline)
+
+    ### discrete time steps t of the analysis ###
+    times = np.array(list(timerange(current_date)), dtype="datetime64[ns]")
+
+    # interpolated position, COG and speed of all ships and t
+    tensor = StateTensor.from_own_features(own_features, times)
+
+    # skip the ships that do not come within max_range of any other ship 
+    # in a time bin, they have no neighbours to rank
+    if max_range is not None:
+        tensor.valid = candidate_mask(tensor.lat, tensor.lon, tensor.valid, 
+                                      max_distance=max_range)
+    offsets, rows = get_active_rows(s2s_df, tensor)
+
+    # the states only change at the event steps (every step without adaptive sampling)
+    # and, with max_range, at the bins of the envelopes
+    steps = event_steps(own_features, times)
+    if max_range is not None:
+        steps = np.union1d(steps, np.arange(0, len(times), default_bin_size))
+    until = np.r_[times[steps[1:]], times[-1:] + np.timedelta64(ANALYSIS_STEP_SIZE)][:len(steps)]
+
+    arrays = {"steps": steps, "until": until, "offsets": offsets, "rows": rows,
+              **{key: getattr(tensor, key) for key in S2S_TENSOR_ARRAYS}}
 
-    ### main analysis loop in discrete time steps t ###
     ################### s2s features ##################
-    for t in timerange(current_date):
-
-        # #TODO remove before parallel
-        # if t > datetime.combine(current_date,
-        #                         time(hour=0, minute=10, second=0)):
-        #     break
-        # pprint(str(t))
-
-        active_ships = s2s_df.loc[t]['active_ships']
-
-        #TODO fix the bandaid code
-        # there are phantom active ships in s2s_base df!!!!!!!!!!!!!!!!
-        for mmsi in active_ships:
-            if own_features[mmsi][own_features[mmsi].index == t].empty:
-                # remove erranously 'active' mmsis
-                active_ships = np.delete(active_ships, 
-                                         np.where(active_ships == mmsi)
-                                         )
-                continue
-
-        # buffers the calculated features per mmsi 
-        # (all combinations with mmsi_1 occurring)
-        buffer = {}
-        for a_mmsi in active_ships:
-            buffer[a_mmsi] = []
-
-        #TODO implement additional combinations loop to filter out NUM
-        # nearest ships by distance first
-
-        for mmsi_1, mmsi_2 in list(combinations(active_ships, 2)):
-            # pprint("calculate s2s metrics for: ")
-            # pprint("pair: ", mmsi_1, mmsi_2)
-
-            ### get interpolated values ###
-            lat1 = own_features[mmsi_1].loc[t]['inter_lat']
-            lon1 = own_features[mmsi_1].loc[t]['inter_lon']
-
-            lat2 = own_features[mmsi_2].loc[t]['inter_lat']
-            lon2 = own_features[mmsi_2].loc[t]['inter_lon']
-
-            # COG from interpolation
-            cog1 = own_features[mmsi_1].loc[t]['direction']    
-            cog2 = own_features[mmsi_2].loc[t]['direction']
-            
-            # speed from interpolation
-            sog1 = own_features[mmsi_1].loc[t]['calc_speed']    
-            sog2 = own_features[mmsi_2].loc[t]['calc_speed']
-    
-            ########################################
-            ### calculate the s2s metrics values ###
-            ########################################
-
-            ### absolute bearings, distance ###
-            # return {'abs_bearing_12':abs_bearing_12, 
-            #         'abs_bearing_21': abs_bearing_21}
-            r_dict = get_abs_bearings(lat1=lat1,
-                                    lon1=lon1, 
-                                    lat2=lat2, 
-                                    lon2=lon2)
-            
-            abs_bearing_12 = r_dict["abs_bearing_12"]
-            abs_bearing_21 = r_dict["abs_bearing_21"]
-
-
-            ### relative bearings ###
-            #     return {'rel_bearing_12': rel_bearing_12, 
-            #             'rel_bearing_21': rel_bearing_21}
-            r_dict = get_rel_bearings(lat1= lat1, 
-                                      lon1= lon1, 
-                                      heading1= cog1,   # interpolated cog
-                                      lat2= lat2, 
-                                      lon2= lon2, 
-                                      heading2= cog2    # interpolated cog
-                                    )
-            
-            rel_bearing_12 = r_dict["rel_bearing_12"]
-            rel_bearing_21 = r_dict["rel_bearing_21"]
-            
-            ### CPA ###
-            ship_1 = Ship(position=CAPTN_POINT(
-                latitude=lat1,
-                longitude=lon1),
-                speed= sog1,
-                course= cog1)
-
-            ship_2 = Ship(position=CAPTN_POINT(
-                latitude=lat2,
-                longitude=lon2),
-                speed=sog2,
-                course=cog2)
-
-            #TODO reduce 6h calculatoin max. depth
-            cpa_obj, _ = itterative_cpa(_ship1=ship_1,
-                                        _ship2=ship_2,
-                                        geo_fence=None,
-                                        time_step_size=ITERATION_STEP_SIZE)
-
-            # the interaction that ships are in (converging/diverging)
-            interaction = cpa_obj.interaction   
-
-            tcpa1 = cpa_obj.ship1.tcpa
-            dcpa1 = cpa_obj.ship1.dcpa
-            c_lat1, c_lon1 = cpa_obj.ship1.postion.as_tuple() # crash position
-            
-            tcpa2 = cpa_obj.ship2.tcpa
-            dcpa2 = cpa_obj.ship2.dcpa
-            c_lat2, c_lon2 = cpa_obj.ship2.postion.as_tuple() # crash position
-
-
-            ### distance ###
-            
-            # vicinity formula
-            ships_distance = get_geo_distance(a= (lat1,lon1),
-                                              b=(lat2, lon2),
-                                              distance_unit="nm" 
-                                              ) 
-
-            ### rel. speed ###
-            
-            rel_speed = relative_speed(speed1=sog1,
-                           course1=cog1,
-                           speed2=sog2,
-                           course2=cog2)
-
-            ###########################################
-            ### prepare the output per mmsi in pair ###
-            ###########################################
-
-            ## 1.
-            ## per mmsi_1 /mmsi_2 
-            ## 'data' dict
-            data_1 = {}
-            data_1["mmsi1"] = mmsi_1         # src ship
-            data_1["mmsi2"] = mmsi_2         # relative ship
-            data_1["lat"] = lat1
-            data_1["lon"] = lon1
-            data_1["cog"] = cog1
-            data_1["sog"] = sog1
-            data_1["abs_bearing"] = abs_bearing_12   # abs_bearing12
-            data_1["rel_bearing"] = rel_bearing_12
-            data_1["tcpa"] = tcpa1
-            data_1["dcpa"] = dcpa1
-            data_1["c_lat"] = c_lat1
-            data_1["c_lon"] = c_lon1
-            data_1["ships_distance"] = ships_distance
-            data_1["rel_speed"] = rel_speed
-
-            data_2 = {}
-            data_2["mmsi1"] = mmsi_2         # src ship
-            data_2["mmsi2"] = mmsi_1         # relative ship
-            data_2["lat"] = lat2
-            data_2["lon"] = lon2
-            data_2["cog"] = cog2
-            data_2["sog"] = sog2
-            data_2["abs_bearing"] = abs_bearing_21   # abs_bearing21
-            data_2["rel_bearing"] = rel_bearing_21
-            data_2["tcpa"] = tcpa2
-            data_2["dcpa"] = dcpa2
-            data_2["c_lat"] = c_lat2
-            data_2["c_lon"] = c_lon2
-            data_2["ships_distance"] = ships_distance
-            data_2["rel_speed"] = rel_speed
-            
-            ####################################################
-            ### append to appropriate buffer (with mmsi key) ###
-            ####################################################
-            ## 2. append 'data's to buffer[mmsi_1] (int key)
-
-            buffer[mmsi_1].append(data_1)
-            buffer[mmsi_2].append(data_2)
-
-        ### end combinations loop
-        
-        # calculate distances between nearest ships
-        for mmsi, buffered_dicts in buffer.items():
-
-            sorted_dicts = sorted(buffered_dicts, 
-                             key=lambda d: d['ships_distance'])
-            
-            if len(sorted_dicts) > NUM_NEAREST_SHIPS:
-                sorted_dicts = sorted_dicts[:NUM_NEAREST_SHIPS]
-
-            ## prepare df for row at index t
-            data_columns = {"t": [t],
-                            "mmsi": [mmsi]}
-            for i, d in enumerate(sorted_dicts):
-
-                # d.key + num in sorted -> data_columns key
-                for key, value in d.items():
-                    # drop the 'own' identity mmsi1 columns
-                    if key == "mmsi1":
-                        continue
-                    data_columns[key+"_"+str(i)] = [value]
-
-            ## prepare row df
-            row = DataFrame(data_columns)
-            row.set_index("t", inplace=True)
-
-            ## concat to 'big' mmsi_s2s dataframe for saving to disc
-            # s2s_dataframes_to_dump = big dict
-            s2s_dataframes_to_dump[mmsi] = concat(
-                [s2s_dataframes_to_dump[mmsi], row],
-                axis=0
-                )
-        ## end mmsi loop
-    ### end time loop
+    if num_workers <= 1:
+        buffer = _s2s_time_chunk(0, len(steps),
+                                 ITERATION_STEP_SIZE, max_range, cpa_method, colreg, land_mode,
+                                 arrays=arrays,
+                                 cpa_cache=cpa_cache,
+                                 coastline=coastline)
+        return buffer.to_table()
+
+    blocks = []
+    try:
+        specs = {}
+        for key, array in arrays.items():
+            shm, specs[key] = _to_shared_memory(array)
+            blocks.append(shm)
+
+        bounds = np.linspace(0, len(steps), 
+                             min(len(steps), num_workers * S2S_CHUNKS_PER_WORKER) + 1).astype(int)
+        chunks = [(first, last, ITERATION_STEP_SIZE, max_range, cpa_method, colreg, land_mode)
+                  for first, last in zip(bounds[:-1], bounds[1:])]
+
+        with multiprocessing.Pool(num_workers, 
+                                  initializer=_init_s2s_worker, 
+                                  initargs=(specs, 
+                                            cpa_cache.config if cpa_cache is not None else None,
+                                            coastline)) as pool:
+            results = pool.starmap(_s2s_worker_chunk, chunks)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    ### merge the time chunks in order ###
+    buffer = PairTableBuffer(_s2s_extra_dtypes(colreg, coastline, land_mode))
+    for chunk, cache_counts in results:
+        buffer.extend(chunk)
+        if cpa_cache is not None:
+            cpa_cache.add_stats(*cache_counts)
 
     # exit calculation successfully
-    return s2s_dataframes_to_dump
\ No newline at end of file
+    return buffer.to_table()
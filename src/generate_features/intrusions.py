@@ -0,0 +1,148 @@
+"""Ship domain intrusions of all ship pairs of a day.
+
+This includes:
+    - Private Methods:
+        _ship_dimensions(): Length and width per row of the state tensor
+
+    + Public Methods:
+        detect_domain_intrusions(): Intervals in which a ship is inside the domain of another ship
+
+    + Classes:
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import sys
+sys.path.append("../")
+
+import numpy as np
+from pandas import DataFrame
+
+from src.macros.macros import ANALYSIS_STEP_SIZE
+from src.utils.geo_calc.convert import meter_to_seamiles
+from src.utils.geo_calc.domain import ShipDomain, domain_axes, domain_ratio
+from src.utils.geo_calc.envelopes import time_binned_envelopes, candidate_pairs, default_bin_size
+from src.generate_features.state_tensor import StateTensor
+
+
+##> Schema of one intrusion interval: mmsi2 is inside the domain of mmsi1
+INTRUSION_DTYPES = {
+    "mmsi1": np.int64,              # owner of the domain
+    "mmsi2": np.int64,              # intruder
+    "start": "datetime64[ns]",      # first time step inside the domain
+    "end": "datetime64[ns]",        # end of the last time step inside the domain
+    "steps": np.int64,
+    "t_min": "datetime64[ns]",      # deepest intrusion
+    "min_ratio": np.float64,        # normalized distance to the center of the domain (< 1)
+}
+
+
+def _ship_dimensions(mmsis: np.ndarray, static_features: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Length and width per mmsi from the static features (NaN for unknown ships)."""
+    def _get(mmsi, key):
+        value = static_features.get(int(mmsi), {}).get(key)
+        return np.nan if value is None else value
+
+    length = np.array([_get(m, "length") for m in mmsis], dtype=np.float64)
+    width = np.array([_get(m, "width") for m in mmsis], dtype=np.float64)
+
+    return length, width
+
+
+def detect_domain_intrusions(tensor: StateTensor,
+                             static_features: dict,
+                             domain: ShipDomain = None,
+                             bin_size: int = default_bin_size) -> DataFrame:
+    """Intervals in which a ship is inside the elliptical domain of another ship.
+
+    The domains are scaled by the length, width and speed of their owner (see
+    ShipDomain). Only the ship pairs whose time-binned envelopes come within the
+    largest semi-major axis of the day are tested, on all time steps of the bin at once.
+
+    Args:
+        tensor (StateTensor): states of the day, e.g. StateTensor.from_own_features(own_features, times)
+        static_features (dict): mmsi -> static features with length and width
+            (ShipFeatures.static), unknown ships get the default dimensions of domain
+        domain (ShipDomain, optional): scaling of the domains. Defaults to None (ShipDomain()).
+        bin_size (int, optional): time steps per envelope. Defaults to default_bin_size.
+
+    Returns:
+        DataFrame: intrusion intervals with the columns of INTRUSION_DTYPES, ordered by (mmsi1, mmsi2, start)
+    """
+    n, T = tensor.valid.shape
+    length, width = _ship_dimensions(tensor.mmsis, static_features)
+    major, minor = domain_axes(length[:, None], width[:, None], tensor.sog, domain)
+    minor = np.broadcast_to(minor, major.shape)
+
+    empty = DataFrame({c: np.empty(0, dtype=d) for c, d in INTRUSION_DTYPES.items()})
+    if n < 2 or not tensor.valid.any():
+        return empty
+
+    # no domain reaches further than the largest semi-major axis
+    max_distance = meter_to_seamiles(np.nanmax(np.where(tensor.valid, major, np.nan)))
+    envelopes = time_binned_envelopes(tensor.lat, tensor.lon, tensor.valid, bin_size)
+
+    owners, intruders, steps, ratios = [], [], [], []
+    for b, pairs in enumerate(candidate_pairs(envelopes, max_distance)):
+        if len(pairs) == 0:
+            continue
+
+        # both directions of every pair on all time steps of the bin
+        i = np.r_[pairs[:, 0], pairs[:, 1]][:, None]
+        j = np.r_[pairs[:, 1], pairs[:, 0]][:, None]
+        k = np.arange(b * bin_size, min((b + 1) * bin_size, T))
+
+        ratio = domain_ratio(tensor.lat[i, k], tensor.lon[i, k], tensor.cog[i, k],
+                             major[i, k], minor[i, k],
+                             tensor.lat[j, k], tensor.lon[j, k])
+        inside = (ratio < 1) & tensor.valid[i, k] & tensor.valid[j, k]
+
+        p, s = np.nonzero(inside)
+        owners.append(i[p, 0])
+        intruders.append(j[p, 0])
+        steps.append(k[s])
+        ratios.append(ratio[p, s])
+
+    if sum(len(a) for a in steps) == 0:
+        return empty
+
+    order = np.lexsort((np.concatenate(steps), np.concatenate(intruders), np.concatenate(owners)))
+    owner, intruder = np.concatenate(owners)[order], np.concatenate(intruders)[order]
+    step, ratio = np.concatenate(steps)[order], np.concatenate(ratios)[order]
+
+    # intervals of consecutive time steps per (owner, intruder)
+    new_interval = np.r_[True, (owner[1:] != owner[:-1]) | (intruder[1:] != intruder[:-1]) | (step[1:] != step[:-1] + 1)]
+    first = np.flatnonzero(new_interval)
+    last = np.r_[first[1:], len(step)] - 1
+    interval = np.cumsum(new_interval) - 1
+
+    # deepest intrusion per interval, the first one of ties
+    deepest = np.lexsort((ratio, interval))
+    deepest = deepest[np.r_[True, interval[deepest][1:] != interval[deepest][:-1]]]
+
+    return DataFrame({"mmsi1": tensor.mmsis[owner[first]],
+                      "mmsi2": tensor.mmsis[intruder[first]],
+                      "start": tensor.times[step[first]],
+                      "end": tensor.times[step[last]] + np.timedelta64(ANALYSIS_STEP_SIZE),
+                      "steps": last - first + 1,
+                      "t_min": tensor.times[step[deepest]],
+                      "min_ratio": ratio[deepest]}).astype(INTRUSION_DTYPES)
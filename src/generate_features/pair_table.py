@@ -0,0 +1,235 @@
+"""Long format ship to ship (s2s) feature table.
+
+This includes:
+    - Private Methods:
+
+    + Public Methods:
+
+    + Classes:
+        PairTableBuffer: Chunked columnar buffer of s2s records
+        PairTable: Long format s2s table with an index from (mmsi1, mmsi2) to row ranges
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+    Replaces the wide per mmsi DataFrames (columns suffixed _0 .. _9) that were
+    built by concatenating one row per time step.
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import sys
+sys.path.append("../")
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.macros.macros import ANALYSIS_STEP_SIZE
+from src.generate_features.adaptive import validity_grid
+
+
+##> Schema of one s2s record: ship mmsi1 sees ship mmsi2 as its rank-th nearest ship at t
+PAIR_TABLE_DTYPES = {
+    "t": "datetime64[ns]",
+    "valid_until": "datetime64[ns]",  # the record holds for t <= t' < valid_until
+    "mmsi1": np.int64,           # src ship
+    "mmsi2": np.int64,           # relative ship
+    "rank": np.int64,            # 0 = nearest ship
+    "lat": np.float64,           # interpolated position of mmsi1
+    "lon": np.float64,
+    "cog": np.float64,
+    "sog": np.float64,
+    "abs_bearing": np.float64,   # mmsi1 -> mmsi2
+    "rel_bearing": np.float64,
+    "tcpa": np.float64,
+    "dcpa": np.float64,
+    "c_lat": np.float64,         # position of mmsi1 at the cpa
+    "c_lon": np.float64,
+    "ships_distance": np.float64,
+    "rel_speed": np.float64,
+    "cpa_distance": np.float64,  # distance between the ships at the cpa
+}
+
+##> Optional columns of the COLREG situation of mmsi1 with mmsi2 (see utils.metrics.get_colreg_situations)
+COLREG_DTYPES = {
+    "colreg_situation": np.int64,  # s_colreg_situations
+    "colreg_role": np.int64,       # s_colreg_roles of mmsi1
+}
+
+##> Optional column of pairs separated by land (see calculate_s2s_metrics(land_mode="flag"))
+LAND_DTYPES = {
+    "land_separated": bool,        # the line of sight crosses the coastline, no cpa
+}
+
+##> Columns per rank in the wide layout, in the order of the former s2s dataframes
+WIDE_COLUMNS = [c for c in PAIR_TABLE_DTYPES if c not in ("t", "valid_until", "mmsi1", "rank", "cpa_distance")]
+
+
+class PairTableBuffer:
+    """Columnar buffer that collects the s2s records chunk by chunk (e.g. one chunk per time step).
+
+    Every append() stores its arrays as one chunk, to_table() concatenates each
+    column once, instead of copying the accumulated rows on every time step.
+
+    Args:
+        extra_dtypes (dict, optional): optional columns in addition to PAIR_TABLE_DTYPES,
+            e.g. COLREG_DTYPES. Defaults to None.
+    """
+
+    def __init__(self, extra_dtypes: dict = None) -> None:
+        self.dtypes = {**PAIR_TABLE_DTYPES, **(extra_dtypes or {})}
+        self.chunks = {c: [] for c in self.dtypes}
+        self.n = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, **columns) -> None:
+        """Append one chunk of records, all columns of self.dtypes as equally long arrays (t may be a scalar)."""
+        missing = set(self.dtypes) - set(columns)
+        if missing:
+            raise KeyError(f"Missing pair table columns {sorted(missing)}")
+
+        length = len(columns["mmsi1"])
+        for c, d in self.dtypes.items():
+            self.chunks[c].append(np.broadcast_to(np.asarray(columns[c], dtype=d), (length,)))
+        self.n += length
+
+    def extend(self, other: "PairTableBuffer") -> None:
+        """Append all chunks of another buffer, e.g. of a later time chunk."""
+        for c in self.dtypes:
+            self.chunks[c].extend(other.chunks[c])
+        self.n += other.n
+
+    def to_table(self) -> "PairTable":
+        df = DataFrame({c: np.concatenate(a) if a else np.empty(0, dtype=self.dtypes[c])
+                        for c, a in self.chunks.items()})
+
+        return PairTable(df)
+
+
+class PairTable:
+    """Long format s2s table, one row per (t, mmsi1, mmsi2) with mmsi2 among the nearest ships of mmsi1.
+
+    The rows are sorted by (mmsi1, mmsi2, t), so all epochs of a pair are one
+    contiguous row range that is looked up in self.index.
+
+    Args:
+        df (DataFrame): records with the columns of PAIR_TABLE_DTYPES and optional columns (e.g. COLREG_DTYPES)
+
+    Examples:
+        table = calculate_s2s_metrics(...)
+        table.pair(mmsi_a, mmsi_b)                     # all records of a seen from b
+        table.epochs_within(mmsi_a, mmsi_b, 0.5)        # epochs where a and b were within 0.5 nm
+        wide = table.to_wide(all_mmsis)                 # mmsi -> wide dataframe (indexed by t)
+        grid = table.to_grid()                          # adaptive records on the fixed grid
+    """
+
+    def __init__(self, df: DataFrame) -> None:
+        self.df = df.sort_values(["mmsi1", "mmsi2", "t"], kind="stable").reset_index(drop=True)
+
+        mmsi1 = self.df["mmsi1"].to_numpy()
+        mmsi2 = self.df["mmsi2"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, (mmsi1[1:] != mmsi1[:-1]) | (mmsi2[1:] != mmsi2[:-1])]) \
+            if len(self.df) else np.empty(0, dtype=np.int64)
+        stops = np.r_[starts[1:], len(self.df)]
+
+        self.index = {(int(mmsi1[s]), int(mmsi2[s])): (int(s), int(e))
+                      for s, e in zip(starts, stops)}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @classmethod
+    def read_csv(cls, path: str) -> "PairTable":
+        """Load a table stored with to_csv()."""
+        times = ("t", "valid_until")
+        dtypes = {**PAIR_TABLE_DTYPES, **COLREG_DTYPES, **LAND_DTYPES}
+        df = pd.read_csv(path, dtype={c: d for c, d in dtypes.items() if c not in times})
+        for c in times:
+            df[c] = pd.to_datetime(df[c])
+
+        return cls(df)
+
+    def to_csv(self, path: str) -> None:
+        self.df.to_csv(path, index=False)
+
+    def pair(self, mmsi1: int, mmsi2: int) -> DataFrame:
+        """Records of mmsi1 with mmsi2 among its nearest ships, ordered by t (empty if there are none)."""
+        start, stop = self.index.get((mmsi1, mmsi2), (0, 0))
+        return self.df.iloc[start:stop]
+
+    def epochs_within(self, mmsi1: int, mmsi2: int, distance: float) -> np.ndarray:
+        """Time steps at which the two ships were within distance (nautical miles) of each other.
+
+        Both directions are looked up, as mmsi2 may be among the nearest ships of mmsi1 but not vice versa.
+        """
+        times = [rows["t"].to_numpy()[rows["ships_distance"].to_numpy() <= distance]
+                 for rows in (self.pair(mmsi1, mmsi2), self.pair(mmsi2, mmsi1))]
+
+        return np.unique(np.concatenate(times))
+
+    def ship(self, mmsi: int) -> DataFrame:
+        """Records of mmsi1 == mmsi, ordered by (mmsi2, t)."""
+        mmsi1 = self.df["mmsi1"].to_numpy()
+        start, stop = np.searchsorted(mmsi1, mmsi, side="left"), np.searchsorted(mmsi1, mmsi, side="right")
+        return self.df.iloc[start:stop]
+
+    def to_grid(self, step_size: timedelta = ANALYSIS_STEP_SIZE) -> "PairTable":
+        """Records repeated for every grid step of their validity, the fixed grid of an adaptive table."""
+        samples, t = validity_grid(self.df["t"].to_numpy(), self.df["valid_until"].to_numpy(), step_size)
+
+        df = self.df.iloc[samples].reset_index(drop=True)
+        df["t"] = t
+        df["valid_until"] = t + np.timedelta64(step_size)
+
+        return PairTable(df)
+
+    def to_wide(self, mmsis: list = None) -> dict:
+        """Wide layout of the former s2s dataframes: one row per (t, mmsi) with the columns
+        of WIDE_COLUMNS suffixed by the rank (_0 nearest ship, _1, ...).
+
+        Args:
+            mmsis (list, optional): mmsis of the output, mmsis without records get an empty
+                DataFrame. Defaults to None (all mmsi1 of the table).
+
+        Returns:
+            dict: mmsi -> wide s2s dataframe (indexed by t)
+        """
+        if mmsis is None:
+            mmsis = np.unique(self.df["mmsi1"].to_numpy()).tolist()
+
+        wide = {}
+        for mmsi in mmsis:
+            rows = self.ship(mmsi)
+            if rows.empty:
+                wide[mmsi] = DataFrame()
+                continue
+
+            df = rows.pivot(index="t", columns="rank", values=WIDE_COLUMNS)
+            ranks = sorted(df.columns.get_level_values("rank").unique())
+            df = df[[(c, r) for r in ranks for c in WIDE_COLUMNS]]
+            df.columns = [f"{c}_{r}" for c, r in df.columns]
+            df.insert(0, "mmsi", mmsi)
+
+            wide[mmsi] = df
+
+        return wide
@@ -0,0 +1,159 @@
+"""Dense ships x time grid tensor of the interpolated ship states.
+
+This includes:
+    - Private Methods:
+
+    + Public Methods:
+
+    + Classes:
+        StateTensor: lat, lon, cog, sog and a validity mask per (ship, time step)
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+    Replaces the own_features[mmsi].loc[t] lookups of the s2s metrics.
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.generate_features.adaptive import validity_grid
+
+
+##> Own feature columns of the state tensor, in the order of StateTensor.states()
+STATE_COLUMNS = {"lat": "inter_lat",
+                 "lon": "inter_lon",
+                 "cog": "direction",
+                 "sog": "calc_speed"}
+
+
+@dataclass
+class StateTensor:
+    """Interpolated states of all ships of a day on the time grid, built once per day.
+
+    Row i belongs to mmsis[i] (sorted), column k to times[k]. Entries without
+    own features (ship not active, phantom ships) are False in valid.
+
+    Args:
+        mmsis (np.ndarray): (n,) sorted mmsis
+        times (np.ndarray): (T,) time grid, datetime64[ns]
+        lat (np.ndarray): (n, T) interpolated latitude in degrees
+        lon (np.ndarray): (n, T) interpolated longitude in degrees
+        cog (np.ndarray): (n, T) course over ground in degrees
+        sog (np.ndarray): (n, T) speed over ground in knots
+        valid (np.ndarray): (n, T) True where the ship has own features
+
+    Examples:
+        tensor = StateTensor.from_own_features(own_features, times)
+        rows = tensor.rows(active_ships)
+        mmsis, states = tensor.states(k, rows)
+    """
+
+    mmsis: np.ndarray
+    times: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    cog: np.ndarray
+    sog: np.ndarray
+    valid: np.ndarray
+
+    @classmethod
+    def from_own_features(cls,
+                          own_features: dict,
+                          times: np.ndarray,
+                          dtype = np.float64) -> "StateTensor":
+        """Scatter the own features (mmsi -> DataFrame indexed by t) onto the time grid.
+
+        Own features with a valid_until column (adaptive sampling) are held
+        over [t, valid_until) of every row.
+
+        Args:
+            own_features (dict): mmsi -> own features (indexed by t)
+            times (np.ndarray): sorted time grid
+            dtype (optional): dtype of the states. np.float32 halves the memory, but
+                quantizes positions to ~0.5 m. Defaults to np.float64.
+
+        Returns:
+            StateTensor: the tensor, time steps of the own features off the grid are ignored
+        """
+        times = np.asarray(times, dtype="datetime64[ns]")
+        mmsis = np.array(sorted(own_features), dtype=np.int64)
+        shape = (len(mmsis), len(times))
+
+        columns = {c: np.full(shape, np.nan, dtype=dtype) for c in STATE_COLUMNS}
+        valid = np.zeros(shape, dtype=bool)
+
+        for i, mmsi in enumerate(mmsis):
+            df = own_features[mmsi]
+            if df.empty:
+                continue
+
+            # the first row of duplicated time steps, as .loc[t].iloc[0]
+            samples = np.flatnonzero(~df.index.duplicated(keep="first"))
+            t = df.index.values.astype("datetime64[ns]")[samples]
+            if "valid_until" in df.columns:
+                # adaptive samples (see thin_own_features) are held over their validity
+                held, t = validity_grid(t, df["valid_until"].values[samples])
+                samples = samples[held]
+
+            k = np.minimum(np.searchsorted(times, t), len(times) - 1)
+            on_grid = times[k] == t if len(times) else np.zeros(len(t), dtype=bool)
+            k, samples = k[on_grid], samples[on_grid]
+
+            for c, own_column in STATE_COLUMNS.items():
+                columns[c][i, k] = df[own_column].to_numpy()[samples]
+            valid[i, k] = True
+
+        return cls(mmsis=mmsis, times=times, valid=valid, **columns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.lat, self.lon, self.cog, self.sog, self.valid))
+
+    def rows(self, mmsis: np.ndarray) -> np.ndarray:
+        """Row index per mmsi, -1 for mmsis that are not part of the tensor."""
+        mmsis = np.asarray(mmsis, dtype=np.int64)
+        if len(self.mmsis) == 0:
+            return np.full(len(mmsis), -1, dtype=np.int64)
+
+        rows = np.minimum(np.searchsorted(self.mmsis, mmsis), len(self.mmsis) - 1)
+        return np.where(self.mmsis[rows] == mmsis, rows, -1)
+
+    def states(self, k: int, rows: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """Valid states at time step k.
+
+        Args:
+            k (int): time step (column)
+            rows (np.ndarray, optional): candidate rows, e.g. rows(active_ships); invalid
+                and -1 rows are dropped, the order is kept. Defaults to None (all rows).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: mmsis (m,) and states (m, 4) as float64 in
+                the order lat, lon, cog, sog
+        """
+        rows = np.arange(len(self.mmsis)) if rows is None else np.asarray(rows, dtype=np.int64)
+        rows = rows[rows >= 0]
+        rows = rows[self.valid[rows, k]]
+
+        states = np.column_stack([self.lat[rows, k], self.lon[rows, k],
+                                  self.cog[rows, k], self.sog[rows, k]]).astype(np.float64)
+
+        return self.mmsis[rows], states
@@ -124,6 +124,10 @@ def load_data_features_to_dataclass(base: str,
         own_df['t'] = to_datetime(own_df["t"])
         own_df.set_index('t', inplace=True)
 
+        # own features of the adaptive sampling
+        if 'valid_until' in own_df.columns:
+            own_df['valid_until'] = to_datetime(own_df['valid_until'])
+
     else:
         own_df = DataFrame()
 
@@ -0,0 +1,387 @@
+"""Incremental segmentation of live position report feeds.
+
+The splitters in src.preprocess.segment work on the complete position data
+of a day. For live feeds, StreamSegmenter keeps a small state per mmsi and
+applies the same steps message by message:
+
+    - speed hike filter (MAX_SPEED_HIKE_FILTER)
+    - online smoothing with a constant velocity Kalman filter
+    - time gap split (MAX_ALLOWED_GAP_DURATION)
+    - speed split (MIN_ACTIVE_SPEED, MIN_SPEED_DURATION)
+    - stop split (MAX_STOP_DIAMETER, MIN_STOP_DURATION)
+
+Closed segments are emitted as soon as they are final. Every message costs
+O(1) amortised and only the rows of the open segments are kept in memory.
+
+Differences to the batch pipeline:
+    - smoothing is a forward filter only, mpd.KalmanSmootherCV also runs
+      the backward pass over the full trajectory
+    - a stop is detected when all points stay within MAX_STOP_DIAMETER / 2
+      of the running centroid of the stop candidate, instead of computing
+      the exact diameter of the point set
+"""
+
+import math
+from typing import Dict, List
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from shapely import Point
+from pandas import DataFrame
+from geopandas import GeoDataFrame
+import movingpandas as mpd
+from movingpandas import Trajectory
+
+import sys
+sys.path.append("../")
+from src.macros.macros import (POS_REP_COLUMNS,
+                               MAX_SPEED_HIKE_FILTER,
+                               MAX_ALLOWED_GAP_DURATION,
+                               MIN_ACTIVE_SPEED,
+                               MIN_SPEED_DURATION,
+                               MAX_STOP_DIAMETER,
+                               MIN_STOP_DURATION)
+from src.preprocess.segment import create_position_report_dataframe
+
+# mean earth radius in meters, equirectangular distances are sufficient
+# between consecutive messages
+_EARTH_RADIUS = 6371009
+_METERS_PER_NM = 1852
+
+# same noise parameters as segment.smooth()
+PROCESS_NOISE_STD = 0.5
+MEASUREMENT_NOISE_STD = 1
+
+
+@dataclass
+class _AxisFilter:
+    """Constant velocity Kalman filter for one axis (position, velocity)."""
+
+    p: float
+    v: float = 0.0
+    p00: float = MEASUREMENT_NOISE_STD**2
+    p01: float = 0.0
+    p11: float = 100.0
+
+    def update(self, z: float, dt: float) -> float:
+        # predict
+        q = PROCESS_NOISE_STD**2
+        self.p = self.p + dt * self.v
+        p00 = self.p00 + 2 * dt * self.p01 + dt**2 * self.p11 + q * dt**3 / 3
+        p01 = self.p01 + dt * self.p11 + q * dt**2 / 2
+        p11 = self.p11 + q * dt
+
+        # correct
+        s = p00 + MEASUREMENT_NOISE_STD**2
+        k0 = p00 / s
+        k1 = p01 / s
+        residual = z - self.p
+        self.p = self.p + k0 * residual
+        self.v = self.v + k1 * residual
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p11 = p11 - k1 * p01
+
+        return self.p
+
+
+@dataclass
+class _Dwell:
+    """Candidate for a stop or a slow section within the open segment."""
+
+    start: int          # row index in the open segment
+    epoch: float        # epoch of the first row
+    x: float = 0.0      # running centroid (stop only)
+    y: float = 0.0
+    n: int = 1
+
+
+@dataclass
+class _MMSIState:
+    """Everything that is kept per mmsi between two batches."""
+
+    mmsi: int
+    lat0: float
+    lon0: float
+    rows: List[dict] = field(default_factory=list)
+    # last accepted raw message
+    last_epoch: float = None
+    last_x: float = None
+    last_y: float = None
+    # previous raw message, accepted or not (speed hike filter)
+    raw_epoch: float = None
+    raw_x: float = None
+    raw_y: float = None
+    # smoother
+    fx: _AxisFilter = None
+    fy: _AxisFilter = None
+    # last smoothed position
+    sx: float = None
+    sy: float = None
+    # split states
+    slow: _Dwell = None
+    stop: _Dwell = None
+    paused: bool = False        # True while inside a detected stop/slow section
+
+    def to_xy(self, lat: float, lon: float) -> tuple[float, float]:
+        x = math.radians(lon - self.lon0) * _EARTH_RADIUS * math.cos(math.radians(self.lat0))
+        y = math.radians(lat - self.lat0) * _EARTH_RADIUS
+        return x, y
+
+    def to_latlon(self, x: float, y: float) -> tuple[float, float]:
+        lat = self.lat0 + math.degrees(y / _EARTH_RADIUS)
+        lon = self.lon0 + math.degrees(x / (_EARTH_RADIUS * math.cos(math.radians(self.lat0))))
+        return lat, lon
+
+
+def _is_valid_position(lat: float, lon: float) -> bool:
+    return (-90 <= lat <= 90) and (-180 <= lon <= 180)
+
+
+def segment_to_trajectory(rows: List[dict], mmsi: int, traj_id: int) -> Trajectory:
+    """Create a movingpandas Trajectory from the buffered rows of a closed segment."""
+
+    pos = DataFrame(rows)
+    pos["date"] = pos.epoch.apply(datetime.utcfromtimestamp)
+    pos["geometry"] = [Point(xy) for xy in zip(pos['lon'], pos['lat'])]
+
+    pos_gdf = GeoDataFrame(pos)
+    pos_gdf.set_geometry("geometry", inplace=True)
+    pos_gdf.set_crs("epsg:4326", inplace=True)
+
+    return mpd.Trajectory(pos_gdf,
+                          traj_id=traj_id,
+                          obj_id=mmsi,
+                          t="date",
+                          crs="epsg:4326")
+
+
+class StreamSegmenter:
+    """Per mmsi incremental segmenter for live position report feeds.
+
+    Example:
+        segmenter = StreamSegmenter()
+        for batch in feed:
+            for traj in segmenter.update(batch):
+                ...
+        remaining = segmenter.flush()
+    """
+
+    def __init__(self,
+                 drop_speed_hike=True,
+                 split_by_time_gap=True,
+                 split_by_speed=True,
+                 split_by_stop=True,
+                 smoothing=True) -> None:
+        self.drop_speed_hike = drop_speed_hike
+        self.split_by_time_gap = split_by_time_gap
+        self.split_by_speed = split_by_speed
+        self.split_by_stop = split_by_stop
+        self.smoothing = smoothing
+
+        self.max_gap = MAX_ALLOWED_GAP_DURATION.total_seconds()
+        self.min_speed_duration = MIN_SPEED_DURATION.total_seconds()
+        self.min_stop_duration = MIN_STOP_DURATION.total_seconds()
+
+        self.states: Dict[int, _MMSIState] = {}
+        # emitted segments per mmsi, outlives the states (traj_id of the next segment)
+        self.num_segments: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        """Number of mmsis with open state."""
+        return len(self.states)
+
+    def update(self, data: List[dict] | DataFrame) -> List[Trajectory]:
+        """Consume a batch of position reports, return the segments closed by it.
+
+        A segment is also closed when its ship did not send a valid message
+        for longer than MAX_ALLOWED_GAP_DURATION before the newest message
+        of the batch.
+        """
+        if not isinstance(data, DataFrame):
+            data = create_position_report_dataframe(data)
+
+        if data.empty:
+            return []
+
+        closed = []
+        watermark = None
+        for row in data.sort_values(by="epoch").to_dict("records"):
+            closed.extend(self._push(row))
+            watermark = row["epoch"]
+
+        if self.split_by_time_gap and watermark is not None:
+            closed.extend(self.close_stale(watermark))
+
+        return closed
+
+    def close_stale(self, epoch: float) -> List[Trajectory]:
+        """Close and forget the state of all ships that are silent since epoch - gap."""
+        closed = []
+        for mmsi in [m for m, s in self.states.items()
+                     if epoch - s.last_epoch > self.max_gap]:
+            state = self.states.pop(mmsi)
+            closed.extend(self._close(state, len(state.rows)))
+
+        return closed
+
+    def flush(self) -> List[Trajectory]:
+        """Close all open segments, e.g. at the end of a feed."""
+        closed = []
+        for state in self.states.values():
+            closed.extend(self._close(state, len(state.rows)))
+        self.states = {}
+
+        return closed
+
+    ### internal state machine ###
+
+    def _close(self, state: _MMSIState, end: int) -> List[Trajectory]:
+        """Emit rows[:end] of the open segment (if valid) and drop all rows."""
+        rows = state.rows[:end]
+        state.rows = []
+        state.slow = None
+        state.stop = None
+
+        if len(rows) < 2:
+            return []
+
+        traj_id = self.num_segments.get(state.mmsi, 0)
+        traj = segment_to_trajectory(rows, state.mmsi, traj_id)
+        self.num_segments[state.mmsi] = traj_id + 1
+
+        return [traj]
+
+    def _reset_filter(self, state: _MMSIState, x: float, y: float) -> None:
+        state.fx = _AxisFilter(p=x)
+        state.fy = _AxisFilter(p=y)
+        state.sx, state.sy = x, y
+
+    def _push(self, row: dict) -> List[Trajectory]:
+        mmsi, epoch = row["mmsi"], row["epoch"]
+        lat, lon = row["lat"], row["lon"]
+
+        if not _is_valid_position(lat, lon):
+            return []
+
+        state = self.states.get(mmsi)
+        if state is None:
+            state = _MMSIState(mmsi=mmsi, lat0=lat, lon0=lon)
+            self.states[mmsi] = state
+
+        closed = []
+        x, y = state.to_xy(lat, lon)
+
+        if state.last_epoch is not None:
+            dt = epoch - state.last_epoch
+
+            # out of order or duplicate epochs
+            if dt <= 0:
+                return []
+
+            # time gap split, the new message starts a new segment
+            if self.split_by_time_gap and dt > self.max_gap:
+                closed.extend(self._close(state, len(state.rows)))
+                state.paused = False
+                state.last_epoch = None
+                state.raw_epoch = None
+
+        # speed hike filter against the previous raw message, as speed_hike_filter()
+        # on the raw speeds: a single outlier does not lock the track
+        if state.raw_epoch is not None:
+            if epoch <= state.raw_epoch:
+                return closed
+            d = math.hypot(x - state.raw_x, y - state.raw_y)
+            hike = (d / _METERS_PER_NM) / ((epoch - state.raw_epoch) / 3600) > MAX_SPEED_HIKE_FILTER
+        else:
+            hike = False
+        state.raw_epoch, state.raw_x, state.raw_y = epoch, x, y
+
+        if self.drop_speed_hike and hike:
+            return closed
+
+        # smoothing
+        if self.smoothing and (state.fx is not None) and (state.last_epoch is not None):
+            dt = epoch - state.last_epoch
+            sx_prev, sy_prev = state.sx, state.sy
+            state.sx = state.fx.update(x, dt)
+            state.sy = state.fy.update(y, dt)
+        else:
+            sx_prev, sy_prev = state.sx, state.sy
+            self._reset_filter(state, x, y)
+
+        prev_epoch = state.last_epoch
+        state.last_epoch, state.last_x, state.last_y = epoch, x, y
+
+        s_lat, s_lon = state.to_latlon(state.sx, state.sy)
+        out = {c: row.get(c) for c in POS_REP_COLUMNS}
+        out["lat"], out["lon"] = s_lat, s_lon
+
+        # first message of the ship or after a gap
+        if prev_epoch is None:
+            state.rows.append(out)
+            if self.split_by_stop:
+                state.stop = _Dwell(start=0, epoch=epoch, x=state.sx, y=state.sy)
+            return closed
+
+        # speed from smoothed positions in knots
+        speed = (math.hypot(state.sx - sx_prev, state.sy - sy_prev) / _METERS_PER_NM) / \
+                ((epoch - prev_epoch) / 3600)
+
+        is_slow = self.split_by_speed and speed < MIN_ACTIVE_SPEED
+
+        in_stop = False
+        if self.split_by_stop and state.stop is not None:
+            cx = state.stop.x / state.stop.n
+            cy = state.stop.y / state.stop.n
+            in_stop = math.hypot(state.sx - cx, state.sy - cy) <= MAX_STOP_DIAMETER / 2
+
+        ### inside a detected stop or slow section: drop rows until the ship moves again
+        if state.paused:
+            if (is_slow and state.slow is not None) or in_stop:
+                if in_stop:
+                    state.stop.x += state.sx
+                    state.stop.y += state.sy
+                    state.stop.n += 1
+                return closed
+
+            # ship moves again, start a new segment
+            state.paused = False
+            state.slow = None
+            state.rows = [out]
+            state.stop = _Dwell(start=0, epoch=epoch, x=state.sx, y=state.sy) \
+                if self.split_by_stop else None
+            return closed
+
+        state.rows.append(out)
+        idx = len(state.rows) - 1
+
+        ### speed split
+        if self.split_by_speed:
+            if is_slow:
+                if state.slow is None:
+                    state.slow = _Dwell(start=idx, epoch=epoch)
+                elif epoch - state.slow.epoch >= self.min_speed_duration:
+                    closed.extend(self._close(state, state.slow.start))
+                    state.paused = True
+                    state.slow = _Dwell(start=0, epoch=epoch)
+                    return closed
+            else:
+                state.slow = None
+
+        ### stop split
+        if self.split_by_stop:
+            if in_stop:
+                state.stop.x += state.sx
+                state.stop.y += state.sy
+                state.stop.n += 1
+                if epoch - state.stop.epoch >= self.min_stop_duration:
+                    stop = state.stop
+                    closed.extend(self._close(state, stop.start))
+                    state.paused = True
+                    state.stop = stop
+                    return closed
+            else:
+                state.stop = _Dwell(start=idx, epoch=epoch, x=state.sx, y=state.sy)
+
+        return closed
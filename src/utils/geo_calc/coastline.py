@@ -0,0 +1,203 @@
+"""Exact nearest distances of many points to a coastline and line of sight tests.
+
+This includes:
+    - Private Methods:
+        _segments(): Split a (projected) line geometry into two point segments
+
+    + Public Methods:
+        utm_crs(): UTM zone (EPSG code) of a geographical position
+
+    + Classes:
+        CoastlineIndex: STRtree over the coastline segments in a metric CRS
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from pyproj import Transformer
+
+
+##> Meters, land parts of a line of sight this close to a position contain the position
+endpoint_tolerance = 1e-3
+
+
+def utm_crs(latitude: float, longitude: float) -> str:
+    """EPSG code of the UTM zone containing the position, e.g. 'EPSG:32632' for Kiel."""
+    zone = int((longitude + 180) // 6) % 60 + 1
+    return f"EPSG:{(32600 if latitude >= 0 else 32700) + zone}"
+
+
+def _segments(geometry) -> np.ndarray:
+    """Split all lines of a geometry into an array of two point LineStrings."""
+    segments = []
+    for part in shapely.get_parts(geometry):
+        for line in shapely.get_parts(shapely.get_rings(part)) \
+                if part.geom_type == "Polygon" else [part]:
+            coords = shapely.get_coordinates(line)
+            if len(coords) < 2:
+                continue
+            segments.append(shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1)))
+
+    if not segments:
+        raise ValueError("geometry has no line segments")
+
+    return np.concatenate(segments)
+
+
+class CoastlineIndex:
+    """Exact point to coastline distances and line of sight tests for whole coordinate arrays.
+
+    The coastline is projected once into a metric CRS (UTM zone of its centroid
+    by default), split into its segments and indexed in an STRtree. A query
+    visits only the segments close to each point instead of all coastline
+    vertices. Polygons are measured to their boundary, points inside a polygon
+    have a distance of 0 (as shapely.distance() to the polygon).
+
+    Args:
+        geometry: coastline (LineString, MultiLineString) or land/water (Multi)Polygon in (longitude, latitude)
+        crs (str, optional): metric CRS of the calculations. Defaults to the UTM zone of the centroid.
+
+    Examples:
+        index = CoastlineIndex(coastline)
+        distance = index.distance(lat, lon)     # meters
+        blocked = index.crosses(lat1, lon1, lat2, lon2)
+    """
+
+    def __init__(self, geometry, crs: str = None) -> None:
+        if crs is None:
+            centroid = geometry.centroid
+            crs = utm_crs(centroid.y, centroid.x)
+
+        self.crs = crs
+        self._transformer = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+
+        projected = shapely.transform(geometry,
+                                      lambda coords: np.column_stack(
+                                          self._transformer.transform(coords[:, 0], coords[:, 1])))
+
+        self.segments = _segments(projected)
+        self.tree = STRtree(self.segments)
+
+        # points inside a land polygon are at distance 0, lines of sight may start on it
+        self.polygon = geometry if geometry.geom_type in ("Polygon", "MultiPolygon") else None
+        self._land = projected if self.polygon is not None else None
+        if self.polygon is not None:
+            shapely.prepare(self.polygon)
+            shapely.prepare(self._land)
+
+    def __len__(self) -> int:
+        """Number of indexed segments."""
+        return len(self.segments)
+
+    def query(self, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest coastline segment of each point.
+
+        Args:
+            lat (np.ndarray): latitudes in degrees
+            lon (np.ndarray): longitudes in degrees
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: distance in meters and index into self.segments
+                per point (NaN and -1 for invalid positions)
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+
+        distance = np.full(len(lat), np.nan)
+        segment = np.full(len(lat), -1, dtype=np.int64)
+
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        if not valid.any():
+            return distance, segment
+
+        x, y = self._transformer.transform(lon[valid], lat[valid])
+        (points, nearest), dist = self.tree.query_nearest(shapely.points(x, y),
+                                                          return_distance=True,
+                                                          all_matches=False)
+
+        rows = np.flatnonzero(valid)[points]
+        distance[rows] = dist
+        segment[rows] = nearest
+
+        return distance, segment
+
+    def distance(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Distance of each point to the coastline in meters, 0 inside a polygon."""
+        distance = self.query(lat, lon)[0]
+        if self.polygon is not None:
+            distance[shapely.contains_xy(self.polygon, np.atleast_1d(lon), np.atleast_1d(lat))] = 0
+
+        return distance
+
+    def crosses(self,
+                lat1: np.ndarray,
+                lon1: np.ndarray,
+                lat2: np.ndarray,
+                lon2: np.ndarray) -> np.ndarray:
+        """Line of sight test: does the straight line between two positions cross the coastline?
+
+        All lines are tested at once against the segments of the STRtree, e.g. for
+        ship pairs on opposite sides of a pier or a peninsula.
+
+        With a land polygon, the stretches of a line on land that contain one of its 
+        positions do not block the line: ships moored at a quay often report positions 
+        on land. Only land between the stretches of water blocks it.
+
+        Args:
+            lat1 (np.ndarray): latitudes of the first positions in degrees
+            lon1 (np.ndarray): longitudes of the first positions in degrees
+            lat2 (np.ndarray): latitudes of the second positions in degrees
+            lon2 (np.ndarray): longitudes of the second positions in degrees
+
+        Returns:
+            np.ndarray: True where the line crosses or touches the coastline, with a polygon the land
+                away from both positions (False for invalid positions)
+        """
+        lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+            *[np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2)])
+
+        crosses = np.zeros(len(lat1), dtype=bool)
+        valid = np.isfinite(lat1) & np.isfinite(lon1) & np.isfinite(lat2) & np.isfinite(lon2)
+        if not valid.any():
+            return crosses
+
+        x1, y1 = self._transformer.transform(lon1[valid], lat1[valid])
+        x2, y2 = self._transformer.transform(lon2[valid], lat2[valid])
+        lines = shapely.linestrings(np.stack([np.column_stack([x1, y1]), np.column_stack([x2, y2])], axis=1))
+
+        lines_hit, _ = self.tree.query(lines, predicate="intersects")
+        lines_hit = np.unique(lines_hit)
+
+        if self._land is not None and len(lines_hit):
+            # land parts of the lines that touch neither position
+            parts, line = shapely.get_parts(shapely.intersection(lines[lines_hit], self._land), return_index=True)
+            start = shapely.points(x1[lines_hit][line], y1[lines_hit][line])
+            end = shapely.points(x2[lines_hit][line], y2[lines_hit][line])
+            between = (shapely.distance(parts, start) > endpoint_tolerance) & \
+                (shapely.distance(parts, end) > endpoint_tolerance)
+            lines_hit = lines_hit[np.unique(line[between])]
+
+        crosses[np.flatnonzero(valid)[lines_hit]] = True
+
+        return crosses
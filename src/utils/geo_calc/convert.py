@@ -15,7 +15,9 @@ Last update:
 """
 
 import math
+import numpy as np
 import pyproj
+from .macros import earth_radius
 # from typing import Tuple
 
 
@@ -213,4 +215,38 @@ def cartesian_to_geographical(x: float, y: float) -> tuple[float, float]:
     """
     geod = pyproj.Geod(ellps='WGS84')
     lon, lat, _ = geod.inv(x, y, 0, 90)
-    return lat, lon
\ No newline at end of file
+    return lat, lon
+
+def geographical_to_local(latitude, longitude, latitude0: float, longitude0: float) -> tuple:
+    """Project geographical coordinates onto the local tangent plane around (latitude0, longitude0).
+    Equirectangular approximation, accurate for fjord scale distances.
+    Works on floats and numpy arrays.
+
+    Args:
+        latitude (float | np.ndarray): latitude in degrees
+        longitude (float | np.ndarray): longitude in degrees
+        latitude0 (float | np.ndarray): latitude of the origin in degrees
+        longitude0 (float | np.ndarray): longitude of the origin in degrees
+
+    Returns:
+        tuple: x (east), y (north) in meters
+    """
+    x = np.radians(np.subtract(longitude, longitude0)) * earth_radius * np.cos(np.radians(latitude0))
+    y = np.radians(np.subtract(latitude, latitude0)) * earth_radius
+    return x, y
+
+def local_to_geographical(x, y, latitude0: float, longitude0: float) -> tuple:
+    """Inverse of geographical_to_local()
+
+    Args:
+        x (float | np.ndarray): east in meters
+        y (float | np.ndarray): north in meters
+        latitude0 (float | np.ndarray): latitude of the origin in degrees
+        longitude0 (float | np.ndarray): longitude of the origin in degrees
+
+    Returns:
+        tuple: (latitude, longitude) in degrees
+    """
+    latitude = latitude0 + np.degrees(np.divide(y, earth_radius))
+    longitude = longitude0 + np.degrees(np.divide(x, earth_radius * np.cos(np.radians(latitude0))))
+    return latitude, longitude
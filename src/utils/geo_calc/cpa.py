@@ -2,13 +2,19 @@
 
 This includes:
     - Private Methods:
-        
+        _haversine(): Vectorized great circle distance
+        _refine_tcpa(): Golden section refinement of the TCPA on the sphere
+        _iterative_cpa_batch(): Fixed step CPA search of arrays of ship pairs
+        _adaptive_cpa_batch(): Bracketing and golden section CPA search of arrays of ship pairs
+        _geodesic_distance(): Vectorized ellipsoidal distance
         
     + Public Methods:
-        
+        itterative_cpa(): CPA of two ships by stepping both ships forward in time
+        analytic_cpa(): Closed form CPA/TCPA of arrays of ship pairs
+        cpa_batch(): CPA of arrays of ship pairs, returns structured arrays
         
     + Classes:
-        
+        CPACache: LRU cache of cpa_batch() results keyed by quantised pair kinematics
         
         
 Authors:
@@ -62,14 +68,16 @@ Source: https://github.com/nawre/arpaocalc/tree/master
 
 import math
 from math import sin,cos,asin,atan2
+import numpy as np
+import shapely
 from dataclasses import dataclass
-from .geo import get_geo_distance, exceeds_geo_fence
+from collections import OrderedDict
+from .geo import get_geo_distance, get_geo_distances, exceeds_geo_fence
 from .macros import *
 from .convert import *
 from .ship import CAPTN_POINT, Ship
+from .propagate import dead_reckoning
 
-import geopy
-from geopy.distance import distance, geodesic, great_circle
 
 
 
@@ -80,6 +88,26 @@ distance_tolerance = 0.0135 # Sea Miles (roughly 25m)
 course_tolerance = 0.1 # Degrees 
 max_cpa_time_steps = 6*(60*60) # Seconda => 6H
 max_unknown_interaction_count = 100 # Maximum number taking steps in cpa while interaction type is unkown
+parallel_speed_tolerance = 1e-3 # Knots, relative speed below which ships move in parallel (analytic_cpa)
+refinement_min_width = 60 # Seconds, minimal half width of the TCPA refinement interval (analytic_cpa)
+refinement_rel_width = 0.1 # Half width of the TCPA refinement interval relative to the planar TCPA (analytic_cpa)
+refinement_iterations = 30 # Golden section iterations of the TCPA refinement (analytic_cpa)
+cpa_methods = ("analytic", "iterative", "adaptive") # Accepted methods of cpa_batch()
+max_adaptive_iterations = 100 # Maximum number of golden section iterations of the adaptive cpa
+default_cache_size = 100_000 # Maximum number of cached pairs (CPACache)
+distance_precision = 1e-3 # Meters, the vincenty package rounds its distances to 1e-6 km (iterative cpa)
+
+##> Record of cpa_batch(), distances in nm, tcpa in seconds, positions in degrees
+CPA_DTYPE = np.dtype([("interaction", np.int64),
+                      ("tcpa", np.float64),
+                      ("distance", np.float64),
+                      ("dcpa1", np.float64),
+                      ("dcpa2", np.float64),
+                      ("c_lat1", np.float64),
+                      ("c_lon1", np.float64),
+                      ("c_lat2", np.float64),
+                      ("c_lon2", np.float64),
+                      ("iterations", np.int64)])
 
 @dataclass
 class _SHIP_CPA(object):
@@ -165,33 +193,9 @@ def __step(position: CAPTN_POINT, course: float, speed: float, time: int) -> CAP
     References:
         https://bit.ly/3RfSdQ3
     """
-    # Initialize result with None
-    result = None
-    
-    lat = position.latitude
-    lon = position.longitude
-
-    # Convert speed from knots to km/h
-    speed = knots_to_kmph(speed)
-
-    # Calculate the distance (in KM) covered in time
-    # Assuming speed is in km/h and time is in hours
-    d = speed * time/3600
+    lat_new, lon_new = dead_reckoning(position.latitude, position.longitude, speed, course, time)
 
-    # Radius of the Earth in km
-    R = earth_radius/1000
-    
-    # Calculate new position using geopy
-    origin = geopy.Point(lat, lon)
-    destination = great_circle(kilometers=d).destination(origin, course)
-
-    lat_new, lon_new = destination.latitude, destination.longitude
-
-    result = CAPTN_POINT(latitude=lat_new, longitude=lon_new)
-    
-    assert result is not None
-
-    return result
+    return CAPTN_POINT(latitude=float(lat_new), longitude=float(lon_new))
 
 
 def itterative_cpa_deprecated(_ship1: Ship, 
@@ -219,6 +223,10 @@ def itterative_cpa_deprecated(_ship1: Ship,
     steps_counter = max_steps
     tcpa = 0
     
+    #> Prepare the geofence once for the point in polygon tests of all steps
+    if geo_fence is not None:
+        shapely.prepare(geo_fence)
+
     #> Check ships mmsi, if any does not have one, follow the order they were passed with
     if _ship1.mmsi == default_mmsi: _ship1.mmsi = 1
     if _ship2.mmsi == default_mmsi: _ship2.mmsi = 2
@@ -384,137 +392,633 @@ def itterative_cpa(_ship1: Ship,
                    _ship2: Ship, 
                    geo_fence = None, 
                    time_step_size: int = 1,                   # Size of a time step -> 1 second               
-                   max_steps: int = max_cpa_time_steps) -> tuple[CPA_OUTPUT, int]:
-    """_summary_
+                   max_steps: int = max_cpa_time_steps,
+                   adaptive: bool = False) -> tuple[CPA_OUTPUT, int]:
+    """CPA of two ships by stepping both ships forward on their great circles until
+    their distance stops decreasing. Thin wrapper of cpa_batch(method="iterative")
+    or cpa_batch(method="adaptive").
 
     Args:
         _ship1 (Ship): First ship
         _ship2 (Ship): Second ship
-        geo_fence (_type_, optional): _description_. Defaults to None.
-        max_time_steps (int, optional): _description_. Defaults to 0.
+        geo_fence (Polygon, optional): Stop when a ship leaves the geo fence. Defaults to None.
+        time_step_size (int, optional): Size of a time step in seconds (first step when adaptive). Defaults to 1.
+        max_steps (int, optional): Maximal number of steps. Defaults to max_cpa_time_steps.
+        adaptive (bool, optional): Doubling steps while the ships converge, then a golden section 
+            search of the bracketed minimum to distance_tolerance. Defaults to False.
 
     Returns:
         CPA_OUTPUT: CPA calculation output
         int: Number of itterations till the itterations complete
     """
-    
-    #> Initialize the interaction type and the counter of repetition while the status is unknown
-    iterrations_counter = 0
-    interaction = s_interaction_types.diverging
-    unkown_coutner = max_unknown_interaction_count
-    steps_counter = max_steps
-    tcpa = 0
-    
     #> Check ships mmsi, if any does not have one, follow the order they were passed with
     if _ship1.mmsi == default_mmsi: _ship1.mmsi = 1
     if _ship2.mmsi == default_mmsi: _ship2.mmsi = 2
 
-    ### initial setup ###
-    
-    #> Get the initial distance between the two ships
-    initial_distance = get_geo_distance(a= _ship1.position, 
-                                        b= _ship2.position, 
-                                       distance_method= default_distance_method,
-                                       distance_unit= default_distance_unit)
-    
-    result = CPA_OUTPUT(interaction = interaction,
-                        ship1=_SHIP_CPA(tcpa= 0,
-                                         dcpa= 0,
-                                         postion= _ship1.position,
+    cpa = cpa_batch(lat1=_ship1.position.latitude, lon1=_ship1.position.longitude,
+                    sog1=_ship1.speed, cog1=_ship1.course,
+                    lat2=_ship2.position.latitude, lon2=_ship2.position.longitude,
+                    sog2=_ship2.speed, cog2=_ship2.course,
+                    method="adaptive" if adaptive else "iterative",
+                    geo_fence=geo_fence,
+                    time_step_size=time_step_size,
+                    max_time=max_steps * time_step_size)[0]
+
+    tcpa = int(round(cpa["tcpa"]))
+    result = CPA_OUTPUT(interaction = int(cpa["interaction"]),
+                        ship1=_SHIP_CPA(tcpa= tcpa,
+                                         dcpa= float(cpa["dcpa1"]),
+                                         postion= CAPTN_POINT(latitude=float(cpa["c_lat1"]),
+                                                              longitude=float(cpa["c_lon1"])),
                                          mmsi= _ship1.mmsi),
-                        ship2=_SHIP_CPA(tcpa= 0,
-                                         dcpa= 0,
-                                         postion= _ship2.position,
+                        ship2=_SHIP_CPA(tcpa= tcpa,
+                                         dcpa= float(cpa["dcpa2"]),
+                                         postion= CAPTN_POINT(latitude=float(cpa["c_lat2"]),
+                                                              longitude=float(cpa["c_lon2"])),
                                          mmsi= _ship2.mmsi),
-                        distance = initial_distance)
-    result_tcpa = tcpa
-    ### end initial ###
-    
-    
-    # initalise values for main loop
-    distance = initial_distance
-    ship1_position = _ship1.position
-    ship2_position = _ship2.position
-    new_tcpa = tcpa
-    
-    while(
-        (iterrations_counter < max_steps) and
-        (
-            (interaction == s_interaction_types.converging)
-            or
-            (interaction == s_interaction_types.diverging 
-            and (unkown_coutner>0))
-        )
-    ):
+                        distance = float(cpa["distance"]))
+
+    return result, int(cpa["iterations"])
+
+
+def cpa_batch(lat1: np.ndarray,
+              lon1: np.ndarray,
+              sog1: np.ndarray,
+              cog1: np.ndarray,
+              lat2: np.ndarray,
+              lon2: np.ndarray,
+              sog2: np.ndarray,
+              cog2: np.ndarray,
+              method: str = "analytic",
+              geo_fence = None,
+              time_step_size: int = 1,
+              max_time: float = max_cpa_time_steps,
+              refine: bool = False) -> np.ndarray:
+    """CPA of arrays of ship pairs without Ship/CAPTN_POINT objects.
+
+    Args:
+        lat1 (np.ndarray): latitude of ship 1 in degrees
+        lon1 (np.ndarray): longitude of ship 1 in degrees
+        sog1 (np.ndarray): speed over ground of ship 1 in knots
+        cog1 (np.ndarray): course over ground of ship 1 in degrees
+        lat2 (np.ndarray): latitude of ship 2 in degrees
+        lon2 (np.ndarray): longitude of ship 2 in degrees
+        sog2 (np.ndarray): speed over ground of ship 2 in knots
+        cog2 (np.ndarray): course over ground of ship 2 in degrees
+        method (str, optional): "analytic" (analytic_cpa), "iterative" (fixed time steps 
+            of all pairs at once, same results as the scalar itterative_cpa loop) or "adaptive" 
+            (bracketing and golden section search of the great circle motion). Defaults to "analytic".
+        geo_fence (Polygon, optional): (lon, lat) polygon, iterative pairs stop when a ship 
+            leaves it. Defaults to None.
+        time_step_size (int, optional): Size of a time step in seconds (iterative), 
+            size of the first step (adaptive). Defaults to 1.
+        max_time (float, optional): Look ahead in seconds. Defaults to max_cpa_time_steps.
+        refine (bool, optional): Geodesic TCPA refinement (analytic). Defaults to False.
+
+    Raises:
+        ValueError: Non recognized method
+
+    Returns:
+        np.ndarray: structured array of CPA_DTYPE, one record per pair
+    """
+    lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=np.float64))
+          for v in (lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2)])
+
+    result = np.zeros(len(lat1), dtype=CPA_DTYPE)
+
+    if method == "analytic":
+        cpa = analytic_cpa(lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2,
+                           max_time=max_time, refine=refine)
+        for field, values in cpa.items():
+            result[field] = values
+
+    elif method == "iterative":
+        _iterative_cpa_batch(result, lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2,
+                             geo_fence=geo_fence,
+                             time_step_size=time_step_size,
+                             max_steps=int(max_time // time_step_size))
+
+    elif method == "adaptive":
+        _adaptive_cpa_batch(result, lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2,
+                            geo_fence=geo_fence,
+                            first_step=time_step_size,
+                            max_time=max_time)
+    else:
+        raise ValueError(f"Accepted cpa methods are {cpa_methods}")
+
+    return result
+
+
+class CPACache:
+    """Bounded LRU cache of cpa_batch() results, keyed by quantised pair kinematics.
+
+    The key of a pair is its relative position (east, north in meters, quantised by
+    position_tolerance) and the speed and course of both ships (quantised by 
+    speed_tolerance and course_tolerance, the course of a ship slower than 
+    speed_tolerance is ignored). Pairs that keep their kinematics, e.g. moored or 
+    anchored ships, are computed once. With a geo fence, the absolute position of
+    ship 1 is part of the key as well.
+
+    A hit returns the result of a pair whose inputs differ by less than the tolerances,
+    so the position error of the result is bounded by position_tolerance plus the 
+    velocity tolerances times the tcpa. The tcpa of pairs with a relative speed close
+    to speed_tolerance is ill-conditioned and may be off by more. CPA positions are 
+    stored relative to the ship positions and moved along with them.
+
+    Args:
+        max_size (int, optional): Maximum number of cached pairs. Defaults to default_cache_size.
+        position_tolerance (float, optional): meters. Defaults to 1.
+        speed_tolerance (float, optional): knots. Defaults to 0.01.
+        course_tolerance (float, optional): degrees. Defaults to course_tolerance.
+
+    Examples:
+        cache = CPACache(max_size=100_000)
+        cpa = cache.cpa_batch(lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2, method="iterative")
+        cache.stats     # {'hits': ..., 'misses': ..., 'hit_rate': ..., ...}
+    """
+
+    def __init__(self,
+                 max_size: int = default_cache_size,
+                 position_tolerance: float = 1.0,
+                 speed_tolerance: float = 0.01,
+                 course_tolerance: float = course_tolerance) -> None:
+        self.max_size = max_size
+        self.position_tolerance = position_tolerance
+        self.speed_tolerance = speed_tolerance
+        self.course_tolerance = course_tolerance
+
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def config(self) -> dict:
+        """Arguments to create an empty cache with the same settings."""
+        return {"max_size": self.max_size,
+                "position_tolerance": self.position_tolerance,
+                "speed_tolerance": self.speed_tolerance,
+                "course_tolerance": self.course_tolerance}
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def add_stats(self, hits: int, misses: int, evictions: int) -> None:
+        """Add the counts of another cache, e.g. of a worker process."""
+        self.hits += hits
+        self.misses += misses
+        self.evictions += evictions
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def _keys(self, lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2, absolute: bool) -> list:
+        """Quantised kinematics per pair as hashable tuples."""
+        to_meter = np.radians(earth_radius)
+        east = (lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2)) * to_meter
+        north = (lat2 - lat1) * to_meter
+
+        course_cells = int(round(360 / self.course_tolerance))
+
+        def _velocity(sog, cog):
+            speed = np.rint(sog / self.speed_tolerance).astype(np.int64)
+            course = np.rint(cog / self.course_tolerance).astype(np.int64) % course_cells
+            return speed, np.where(speed == 0, 0, course)
+
+        columns = [np.rint(east / self.position_tolerance).astype(np.int64),
+                   np.rint(north / self.position_tolerance).astype(np.int64),
+                   *_velocity(sog1, cog1), *_velocity(sog2, cog2)]
+        if absolute:
+            cell = np.degrees(self.position_tolerance / earth_radius)
+            columns += [np.rint(lat1 / cell).astype(np.int64), np.rint(lon1 / cell).astype(np.int64)]
+
+        return list(zip(*[c.tolist() for c in columns]))
+
+    def cpa_batch(self,
+                  lat1: np.ndarray,
+                  lon1: np.ndarray,
+                  sog1: np.ndarray,
+                  cog1: np.ndarray,
+                  lat2: np.ndarray,
+                  lon2: np.ndarray,
+                  sog2: np.ndarray,
+                  cog2: np.ndarray,
+                  **kwargs) -> np.ndarray:
+        """cpa_batch() with the cached results of kinematically unchanged pairs, see cpa_batch() for the arguments."""
+        lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2 = np.broadcast_arrays(
+            *[np.atleast_1d(np.asarray(v, dtype=np.float64))
+              for v in (lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2)])
+
+        # the settings of the calculation are part of every key
+        geo_fence = kwargs.get("geo_fence")
+        settings = tuple(sorted((k, v) for k, v in kwargs.items() if k != "geo_fence")) + \
+            ((geo_fence.wkb,) if geo_fence is not None else ())
+
+        # pairs with unknown kinematics are computed, but never cached
+        finite = np.isfinite(lat1 + lon1 + sog1 + cog1 + lat2 + lon2 + sog2 + cog2)
+        cacheable = np.flatnonzero(finite)
+        keys = {p: (settings, key) for p, key in zip(cacheable.tolist(), 
+                                                     self._keys(lat1[finite], lon1[finite], sog1[finite], cog1[finite],
+                                                                lat2[finite], lon2[finite], sog2[finite], cog2[finite],
+                                                                absolute=geo_fence is not None))}
+
+        result = np.zeros(len(lat1), dtype=CPA_DTYPE)
+        hit = np.zeros(len(lat1), dtype=bool)
+        for p, key in keys.items():
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                result[p] = entry
+                hit[p] = True
+
+        missing = np.flatnonzero(~hit)
+        self.hits += int(hit.sum())
+        self.misses += len(missing)
+
+        # stored records hold the CPA positions relative to the ship positions
+        result["c_lat1"][hit] += lat1[hit]
+        result["c_lon1"][hit] += lon1[hit]
+        result["c_lat2"][hit] += lat2[hit]
+        result["c_lon2"][hit] += lon2[hit]
+
+        if len(missing):
+            computed = cpa_batch(lat1[missing], lon1[missing], sog1[missing], cog1[missing],
+                                 lat2[missing], lon2[missing], sog2[missing], cog2[missing],
+                                 **kwargs)
+            result[missing] = computed
+
+            computed["c_lat1"] -= lat1[missing]
+            computed["c_lon1"] -= lon1[missing]
+            computed["c_lat2"] -= lat2[missing]
+            computed["c_lon2"] -= lon2[missing]
+
+            for p, entry in zip(missing.tolist(), computed.tolist()):
+                if p in keys:
+                    self._entries[keys[p]] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return result
+
+
+def _iterative_cpa_batch(result: np.ndarray,
+                         lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2,
+                         geo_fence,
+                         time_step_size: int,
+                         max_steps: int) -> None:
+    """Fixed step CPA search of all pairs at once, fills result (CPA_DTYPE) in place.
+
+    Follows the scalar itterative_cpa loop: the ships step forward while their 
+    distance decreases, the reported CPA is the last accepted position before the 
+    final converging step, and the first converging step is reported as diverging.
+
+    The distances are compared at distance_precision, like the rounded distances of
+    the vincenty package in the scalar loop: near the CPA, steps that change the
+    distance by less than a millimeter end the search. The geodesic of pyproj and
+    vincenty can round to neighbouring millimeters, which changes the tcpa by one 
+    step in rare cases.
+    """
+    #> Accepted positions and distance (meters)
+    p_lat1, p_lon1, p_lat2, p_lon2 = lat1.copy(), lon1.copy(), lat2.copy(), lon2.copy()
+    distance = _geodesic_distance(lat1, lon1, lat2, lon2)
+    converging_steps = np.zeros(len(lat1), dtype=np.int64)
+
+    #> Initial result: CPA now
+    result["interaction"] = s_interaction_types.diverging
+    result["tcpa"] = 0
+    result["distance"] = distance
+    result["c_lat1"], result["c_lon1"] = lat1, lon1
+    result["c_lat2"], result["c_lon2"] = lat2, lon2
+
+    valid = np.isfinite(distance) & np.isfinite(sog1) & np.isfinite(sog2) & \
+        np.isfinite(cog1) & np.isfinite(cog2)
+    result["interaction"][~valid] = s_interaction_types.unknown
+    active = valid.copy()
+
+    if geo_fence is not None:
+        shapely.prepare(geo_fence)
+
+    for _ in range(max_steps):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
 
         #> Take a step for ships
-        ship1_new_position = __step(position= ship1_position, 
-                                    course= _ship1.course, 
-                                    speed= _ship1.speed, 
-                                    time= time_step_size)
-        ship2_new_position = __step(position= ship2_position, 
-                                    course= _ship2.course, 
-                                    speed= _ship2.speed, 
-                                    time= time_step_size)
-        
-        # If any of the ships exceeds the geofence: break
+        n_lat1, n_lon1 = dead_reckoning(p_lat1[idx], p_lon1[idx], sog1[idx], cog1[idx], time_step_size)
+        n_lat2, n_lon2 = dead_reckoning(p_lat2[idx], p_lon2[idx], sog2[idx], cog2[idx], time_step_size)
+
+        #> If any of the ships exceeds the geofence: stop
         if geo_fence is not None:
-            ships_2_geo_fence_list = [
-                exceeds_geo_fence(ship1_new_position, geo_fence),
-                exceeds_geo_fence(ship2_new_position, geo_fence)]
-            if any(ships_2_geo_fence_list):
-                # print(f"Taking step {iterrations_counter}:\n results with ship(s) {[i+1 for i, x in enumerate(ships_2_geo_fence_list) if x]} to exceed the geofence")
-                break
-        
-        #> Find the new distance and the interaction
-        new_distance = get_geo_distance(a= ship1_new_position, 
-                                        b= ship2_new_position, 
-                                        distance_method= default_distance_method,
-                                        distance_unit= default_distance_unit)
-        
-        # Update the result
-        new_tcpa = new_tcpa + time_step_size
-        new_result = CPA_OUTPUT(interaction = interaction,
-                                ship1=_SHIP_CPA(tcpa= new_tcpa,
-                                                 dcpa= get_geo_distance(
-                                                     a= ship1_position,
-                                                     b= _ship1.position,
-                                                     distance_method= default_distance_method,
-                                                     distance_unit= default_distance_unit),
-                                                 postion= ship1_position,
-                                                 mmsi= _ship1.mmsi),
-                                ship2=_SHIP_CPA(tcpa= new_tcpa,
-                                                 dcpa= get_geo_distance(
-                                                     a= ship2_position, 
-                                                     b= _ship2.position,
-                                                     distance_method= default_distance_method,
-                                                     distance_unit= default_distance_unit),
-                                                 postion= ship2_position,
-                                                 mmsi= _ship2.mmsi),
-                                distance = distance)
-        
-        
-        #> converging case
-        if new_distance < distance:
-            interaction = s_interaction_types.converging
-            # Update the values
-            distance = new_distance
-            ship1_position = ship1_new_position
-            ship2_position = ship2_new_position
+            inside = shapely.contains_xy(geo_fence, n_lon1, n_lat1) & \
+                shapely.contains_xy(geo_fence, n_lon2, n_lat2)
+            active[idx[~inside]] = False
+            idx = idx[inside]
+            n_lat1, n_lon1, n_lat2, n_lon2 = n_lat1[inside], n_lon1[inside], n_lat2[inside], n_lon2[inside]
 
-            result = new_result
-            result_tcpa = new_tcpa
-            
-        #> diverging (maybe parallel)
-        else:
-            interaction = s_interaction_types.diverging
-            unkown_coutner -= 1
-            
-        #> Update the counter
-        iterrations_counter += 1
-            
-        # END WHILE
-    return result, iterrations_counter
+        new_distance = _geodesic_distance(n_lat1, n_lon1, n_lat2, n_lon2)
+        converging = np.round(new_distance / distance_precision) < np.round(distance[idx] / distance_precision)
+
+        #> converging: report the previous positions with the new tcpa
+        c = idx[converging]
+        result["interaction"][c] = np.where(converging_steps[c] > 0,
+                                            s_interaction_types.converging,
+                                            s_interaction_types.diverging)
+        converging_steps[c] += 1
+        result["tcpa"][c] = converging_steps[c] * time_step_size
+        result["distance"][c] = distance[c]
+        result["c_lat1"][c], result["c_lon1"][c] = p_lat1[c], p_lon1[c]
+        result["c_lat2"][c], result["c_lon2"][c] = p_lat2[c], p_lon2[c]
+
+        p_lat1[c], p_lon1[c] = n_lat1[converging], n_lon1[converging]
+        p_lat2[c], p_lon2[c] = n_lat2[converging], n_lon2[converging]
+        distance[c] = new_distance[converging]
+
+        #> diverging: the scalar loop retries the same step max_unknown_interaction_count times
+        d = idx[~converging]
+        result["iterations"][d] = np.minimum(converging_steps[d] + max_unknown_interaction_count, max_steps)
+        active[d] = False
+
+    stopped = valid & (result["iterations"] == 0)
+    result["iterations"][stopped] = converging_steps[stopped]
+
+    #> Distances in nm
+    result["distance"] = meter_to_seamiles(result["distance"])
+    result["dcpa1"] = meter_to_seamiles(_geodesic_distance(lat1, lon1, result["c_lat1"], result["c_lon1"]))
+    result["dcpa2"] = meter_to_seamiles(_geodesic_distance(lat2, lon2, result["c_lat2"], result["c_lon2"]))
+
+
+def _adaptive_cpa_batch(result: np.ndarray,
+                        lat1, lon1, sog1, cog1, lat2, lon2, sog2, cog2,
+                        geo_fence,
+                        first_step: float,
+                        max_time: float) -> None:
+    """Adaptive CPA search of all pairs at once, fills result (CPA_DTYPE) in place.
+
+    The ships move on their great circles, the position at time t is evaluated
+    directly from the start position. While the ships converge, the step size
+    doubles (first_step, 2 * first_step, ...), until the distance grows again or
+    max_time is reached. The bracketed minimum is refined with a golden section
+    search until the distance can change less than distance_tolerance within
+    the bracket. Positions outside the geo fence count as infinitely far apart,
+    so the search stops at the fence like the fixed step loop.
+    """
+    v1 = knots_to_mps(sog1)
+    v2 = knots_to_mps(sog2)
+    # upper bound of the change of the distance in meters per second
+    max_rate = np.abs(v1) + np.abs(v2)
+    tolerance = seamiles_to_meter(distance_tolerance)
+
+    evaluations = np.zeros(len(lat1), dtype=np.int64)
+
+    if geo_fence is not None:
+        shapely.prepare(geo_fence)
+
+    def _distance(t, idx):
+        evaluations[idx] += 1
+        a_lat, a_lon = dead_reckoning(lat1[idx], lon1[idx], sog1[idx], cog1[idx], t)
+        b_lat, b_lon = dead_reckoning(lat2[idx], lon2[idx], sog2[idx], cog2[idx], t)
+        distance = _geodesic_distance(a_lat, a_lon, b_lat, b_lon)
+        if geo_fence is not None:
+            inside = shapely.contains_xy(geo_fence, a_lon, a_lat) & shapely.contains_xy(geo_fence, b_lon, b_lat)
+            distance = np.where(inside, distance, np.inf)
+        return distance
+
+    # the start positions are not tested against the geo fence
+    d0 = _geodesic_distance(lat1, lon1, lat2, lon2)
+    evaluations += 1
+    valid = np.isfinite(d0) & np.isfinite(v1) & np.isfinite(v2) & np.isfinite(cog1) & np.isfinite(cog2)
+
+    #> Bracketing: t_a < t_b < t_c with f(t_b) < f(t_a) and f(t_c) >= f(t_b)
+    t_a = np.zeros(len(lat1))
+    t_b = np.zeros(len(lat1))
+    f_b = d0.copy()
+    t_c = np.full(len(lat1), float(first_step))
+    step = np.full(len(lat1), float(first_step))
+    growing = valid & (max_rate > 0)
+
+    while growing.any():
+        idx = np.flatnonzero(growing)
+        t_c[idx] = np.minimum(t_c[idx], max_time)
+        f_c = _distance(t_c[idx], idx)
+
+        closer = f_c < f_b[idx]
+        at_limit = t_c[idx] >= max_time
+
+        # still converging: move the bracket forward and double the step
+        c = idx[closer & ~at_limit]
+        t_a[c], t_b[c], f_b[c] = t_b[c], t_c[c], f_c[closer & ~at_limit]
+        step[c] *= 2
+        t_c[c] = t_b[c] + step[c]
+
+        # converging up to the look ahead limit: CPA at max_time
+        m = idx[closer & at_limit]
+        t_a[m], t_b[m], t_c[m] = max_time, max_time, max_time
+        f_b[m] = f_c[closer & at_limit]
+
+        growing[idx[~closer | at_limit]] = False
+
+    #> Golden section search within [t_a, t_c]
+    ratio = (math.sqrt(5) - 1) / 2
+    refine = valid & (t_c > t_a) & (max_rate * (t_c - t_a) > tolerance)
+    idx = np.flatnonzero(refine)
+    a, b = t_a[idx], t_c[idx]
+    c = b - ratio * (b - a)
+    d = a + ratio * (b - a)
+    fc, fd = (_distance(c, idx), _distance(d, idx)) if len(idx) else (c, d)
+    for _ in range(max_adaptive_iterations if len(idx) else 0):
+        open_ = max_rate[idx] * (b - a) > tolerance
+        if not open_.any():
+            break
+        # ties (also both outside the geo fence) keep the earlier part
+        left = fc <= fd
+        new_a = np.where(left, a, c)
+        new_b = np.where(left, d, b)
+        new = np.where(left, new_b - ratio * (new_b - new_a), new_a + ratio * (new_b - new_a))
+        f_new = np.full(len(idx), np.nan)
+        f_new[open_] = _distance(new[open_], idx[open_])
+        a, b = np.where(open_, new_a, a), np.where(open_, new_b, b)
+        c, fc, d, fd = (np.where(open_ & left, new, np.where(open_, d, c)),
+                        np.where(open_ & left, f_new, np.where(open_, fd, fc)),
+                        np.where(open_ & left, c, np.where(open_, new, d)),
+                        np.where(open_ & left, fc, np.where(open_, f_new, fd)))
+
+    # best evaluated point of the final bracket
+    t_best = t_b.copy()
+    best = np.where(fc <= fd, c, d)
+    f_best = np.minimum(fc, fd)
+    better = f_best <= f_b[idx]
+    t_best[idx[better]] = best[better]
+
+    tcpa = np.where(valid, t_best, np.nan)
+
+    #> CPA positions and distances
+    c_lat1, c_lon1 = dead_reckoning(lat1, lon1, sog1, cog1, tcpa)
+    c_lat2, c_lon2 = dead_reckoning(lat2, lon2, sog2, cog2, tcpa)
+
+    result["interaction"] = np.where(tcpa > 0, s_interaction_types.converging, s_interaction_types.diverging)
+    result["interaction"][~valid] = s_interaction_types.unknown
+    result["tcpa"] = tcpa
+    result["distance"] = meter_to_seamiles(_geodesic_distance(c_lat1, c_lon1, c_lat2, c_lon2))
+    result["dcpa1"] = meter_to_seamiles(_geodesic_distance(lat1, lon1, c_lat1, c_lon1))
+    result["dcpa2"] = meter_to_seamiles(_geodesic_distance(lat2, lon2, c_lat2, c_lon2))
+    result["c_lat1"], result["c_lon1"] = c_lat1, c_lon1
+    result["c_lat2"], result["c_lon2"] = c_lat2, c_lon2
+    result["iterations"] = evaluations
+
+
+def _geodesic_distance(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vectorized ellipsoidal distance in meters (agrees with Vincenty's formulae to sub millimeters)."""
+    return get_geo_distances(lat1, lon1, lat2, lon2,
+                             distance_method=accepted_distance_methods.vicenty,
+                             distance_unit=accepted_distance_units.meter)
+
+
+def _haversine(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vectorized great circle distance in meters."""
+    return get_geo_distances(lat1, lon1, lat2, lon2,
+                             distance_method=accepted_distance_methods.haversine,
+                             distance_unit=accepted_distance_units.meter)
+
+
+def analytic_cpa(lat1: np.ndarray,
+                 lon1: np.ndarray,
+                 speed1: np.ndarray,
+                 course1: np.ndarray,
+                 lat2: np.ndarray,
+                 lon2: np.ndarray,
+                 speed2: np.ndarray,
+                 course2: np.ndarray,
+                 max_time: float = max_cpa_time_steps,
+                 refine: bool = False) -> dict:
+    """Closed form CPA/TCPA of arrays of ship pairs.
+
+    Both ships are placed on the local tangent plane around the midpoint of the pair
+    and keep their speed and course. With the relative position r and the relative
+    velocity v of ship 2 to ship 1:
+        TCPA = -(r . v) / |v|^2,  DCPA = |r + v * TCPA|
+    TCPA is limited to [0, max_time]. Diverging and parallel pairs have their CPA now.
+
+    Args:
+        lat1 (np.ndarray): latitude of ship 1 in degrees
+        lon1 (np.ndarray): longitude of ship 1 in degrees
+        speed1 (np.ndarray): speed over ground of ship 1 in knots
+        course1 (np.ndarray): course over ground of ship 1 in degrees
+        lat2 (np.ndarray): latitude of ship 2 in degrees
+        lon2 (np.ndarray): longitude of ship 2 in degrees
+        speed2 (np.ndarray): speed over ground of ship 2 in knots
+        course2 (np.ndarray): course over ground of ship 2 in degrees
+        max_time (float, optional): Look ahead in seconds. Defaults to max_cpa_time_steps.
+        refine (bool, optional): Refine TCPA of converging pairs by a golden section search
+            of the great circle distance of the ships moving on their great circles. Defaults to False.
+
+    Returns:
+        dict: one array per field, with one value per pair
+            interaction (np.ndarray): s_interaction_types (unknown for invalid inputs)
+            tcpa (np.ndarray): time to the CPA in seconds
+            distance (np.ndarray): distance between the ships at the CPA in nm
+            dcpa1, dcpa2 (np.ndarray): distance each ship travels to its CPA position in nm
+            c_lat1, c_lon1, c_lat2, c_lon2 (np.ndarray): CPA positions of the ships in degrees
+    """
+    lat1, lon1, speed1, course1, lat2, lon2, speed2, course2 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=np.float64))
+          for v in (lat1, lon1, speed1, course1, lat2, lon2, speed2, course2)])
+
+    #> Relative motion on the tangent plane around the midpoints
+    lat0 = (lat1 + lat2) / 2
+    lon0 = (lon1 + lon2) / 2
+    x1, y1 = geographical_to_local(lat1, lon1, lat0, lon0)
+    x2, y2 = geographical_to_local(lat2, lon2, lat0, lon0)
+
+    v1 = knots_to_mps(speed1)
+    v2 = knots_to_mps(speed2)
+    vx1, vy1 = v1 * np.sin(np.radians(course1)), v1 * np.cos(np.radians(course1))
+    vx2, vy2 = v2 * np.sin(np.radians(course2)), v2 * np.cos(np.radians(course2))
+
+    rx, ry = x2 - x1, y2 - y1
+    vx, vy = vx2 - vx1, vy2 - vy1
+    rv = rx * vx + ry * vy
+    vv = vx**2 + vy**2
+
+    #> Interaction types
+    moving = vv > knots_to_mps(parallel_speed_tolerance)**2
+    interaction = np.full(len(rv), s_interaction_types.unknown, dtype=np.int64)
+    interaction[~moving & np.isfinite(vv)] = s_interaction_types.parallel
+    interaction[moving & (rv < 0)] = s_interaction_types.converging
+    interaction[moving & (rv >= 0)] = s_interaction_types.diverging
+
+    converging = interaction == s_interaction_types.converging
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tcpa = np.where(converging, np.minimum(-rv / vv, max_time), 0.0)
+    tcpa[interaction == s_interaction_types.unknown] = np.nan
+
+    if refine and converging.any():
+        tcpa[converging] = _refine_tcpa(lat1[converging], lon1[converging], speed1[converging], course1[converging],
+                                        lat2[converging], lon2[converging], speed2[converging], course2[converging],
+                                        tcpa[converging], max_time)
+
+    #> CPA positions and distance
+    if refine:
+        c_lat1, c_lon1 = dead_reckoning(lat1, lon1, speed1, course1, tcpa)
+        c_lat2, c_lon2 = dead_reckoning(lat2, lon2, speed2, course2, tcpa)
+        distance = _haversine(c_lat1, c_lon1, c_lat2, c_lon2)
+    else:
+        c_x1, c_y1 = x1 + vx1 * tcpa, y1 + vy1 * tcpa
+        c_x2, c_y2 = x2 + vx2 * tcpa, y2 + vy2 * tcpa
+        c_lat1, c_lon1 = local_to_geographical(c_x1, c_y1, lat0, lon0)
+        c_lat2, c_lon2 = local_to_geographical(c_x2, c_y2, lat0, lon0)
+        distance = np.hypot(c_x2 - c_x1, c_y2 - c_y1)
+
+    return {"interaction": interaction,
+            "tcpa": tcpa,
+            "distance": meter_to_seamiles(distance),
+            "dcpa1": speed1 * tcpa / 3600,
+            "dcpa2": speed2 * tcpa / 3600,
+            "c_lat1": c_lat1,
+            "c_lon1": c_lon1,
+            "c_lat2": c_lat2,
+            "c_lon2": c_lon2}
+
+
+def _refine_tcpa(lat1, lon1, speed1, course1, lat2, lon2, speed2, course2,
+                 tcpa: np.ndarray, max_time: float) -> np.ndarray:
+    """Golden section search of the minimal great circle distance around the planar TCPA."""
+
+    def _distance(t):
+        a_lat, a_lon = dead_reckoning(lat1, lon1, speed1, course1, t)
+        b_lat, b_lon = dead_reckoning(lat2, lon2, speed2, course2, t)
+        return _haversine(a_lat, a_lon, b_lat, b_lon)
+
+    width = np.maximum(refinement_min_width, refinement_rel_width * tcpa)
+    a = np.maximum(tcpa - width, 0.0)
+    b = np.minimum(tcpa + width, max_time)
+
+    ratio = (math.sqrt(5) - 1) / 2
+    c = b - ratio * (b - a)
+    d = a + ratio * (b - a)
+    fc, fd = _distance(c), _distance(d)
+    for _ in range(refinement_iterations):
+        left = fc < fd
+        # minimum in [a, d]: d <- c, new c ; else minimum in [c, b]: c <- d, new d
+        a = np.where(left, a, c)
+        b = np.where(left, d, b)
+        new = np.where(left, b - ratio * (b - a), a + ratio * (b - a))
+        f_new = _distance(new)
+        c, d = np.where(left, new, d), np.where(left, c, new)
+        fc, fd = np.where(left, f_new, fd), np.where(left, fc, f_new)
+
+    return (a + b) / 2
     
         
         
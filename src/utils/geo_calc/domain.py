@@ -0,0 +1,129 @@
+"""Elliptical ship domains scaled by the ship dimensions and speed.
+
+This includes:
+    - Private Methods:
+
+    + Public Methods:
+        domain_axes(): Semi-axes of the domains of ships
+        domain_ratio(): Normalized distance of a position to the center of a domain
+
+    + Classes:
+        ShipDomain: Scaling of the elliptical domain
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+    + Off-center domains (Coldwell), the ellipse is centered on the ship (Fujii)
+
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .convert import geographical_to_local
+
+
+@dataclass
+class ShipDomain:
+    """Scaling of the elliptical domain (Fujii) around a ship, major axis along its course.
+
+    semi-major axis = length * (major_factor + speed_factor * sog)
+    semi-minor axis = max(length * minor_factor, width)
+
+    The defaults give the Fujii domain of 8 x 3.2 lengths (full axes) at 16 knots,
+    and half of its length for moored ships.
+
+    Args:
+        major_factor (float, optional): semi-major axis in lengths at 0 knots. Defaults to 2.0.
+        speed_factor (float, optional): semi-major axis in lengths per knot. Defaults to 0.125.
+        minor_factor (float, optional): semi-minor axis in lengths. Defaults to 1.6.
+        default_length (float, optional): meters, for unknown lengths (<= 0). Defaults to 20.
+        default_width (float, optional): meters, for unknown widths (<= 0). Defaults to 5.
+    """
+
+    major_factor: float = 2.0
+    speed_factor: float = 0.125
+    minor_factor: float = 1.6
+    default_length: float = 20.0
+    default_width: float = 5.0
+
+
+def domain_axes(length: np.ndarray,
+                width: np.ndarray,
+                sog: np.ndarray,
+                domain: ShipDomain = None) -> tuple[np.ndarray, np.ndarray]:
+    """Semi-axes of the domains of ships.
+
+    Args:
+        length (np.ndarray): length in meters, <= 0 or NaN for unknown
+        width (np.ndarray): width in meters, <= 0 or NaN for unknown
+        sog (np.ndarray): speed over ground in knots (NaN as 0), broadcast against length and width
+        domain (ShipDomain, optional): scaling. Defaults to None (ShipDomain()).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: semi-major and semi-minor axis in meters
+    """
+    if domain is None:
+        domain = ShipDomain()
+
+    length = np.asarray(length, dtype=np.float64)
+    width = np.asarray(width, dtype=np.float64)
+    length = np.where(length > 0, length, domain.default_length)
+    width = np.where(width > 0, width, domain.default_width)
+
+    major = length * (domain.major_factor + domain.speed_factor * np.maximum(np.nan_to_num(np.asarray(sog, dtype=np.float64)), 0))
+    minor = np.maximum(length * domain.minor_factor, width)
+
+    return major, minor
+
+
+def domain_ratio(lat1: np.ndarray,
+                 lon1: np.ndarray,
+                 cog1: np.ndarray,
+                 major1: np.ndarray,
+                 minor1: np.ndarray,
+                 lat2: np.ndarray,
+                 lon2: np.ndarray) -> np.ndarray:
+    """Normalized distance of the positions 2 to the centers of the domains of the ships 1.
+
+    Positions 2 with a ratio < 1 are inside the domain. Ships without a course
+    (NaN) get a circular domain with the semi-minor axis as radius.
+
+    Args:
+        lat1 (np.ndarray): latitude of the ships 1 in degrees
+        lon1 (np.ndarray): longitude of the ships 1 in degrees
+        cog1 (np.ndarray): course over ground of the ships 1 in degrees
+        major1 (np.ndarray): semi-major axis of the domains in meters
+        minor1 (np.ndarray): semi-minor axis of the domains in meters
+        lat2 (np.ndarray): latitude of the positions 2 in degrees
+        lon2 (np.ndarray): longitude of the positions 2 in degrees
+
+    Returns:
+        np.ndarray: sqrt((along / major)^2 + (across / minor)^2), NaN for invalid positions
+    """
+    x, y = geographical_to_local(lat2, lon2, lat1, lon1)
+
+    # position 2 in the frame of the ship 1 (along and across its course)
+    major1 = np.where(np.isfinite(cog1), major1, minor1)
+    course = np.radians(np.nan_to_num(cog1))
+    along = x * np.sin(course) + y * np.cos(course)
+    across = x * np.cos(course) - y * np.sin(course)
+
+    return np.hypot(along / major1, across / minor1)
@@ -0,0 +1,205 @@
+"""Spatiotemporal envelopes to prune ship pairs that never come within range.
+
+This includes:
+    - Private Methods:
+        _expand(): Grow envelopes by a distance in nautical miles
+        _hash_pairs(): Pairs of envelopes that share a spatial hash cell
+
+    + Public Methods:
+        time_binned_envelopes(): Bounding box of every ship per time bin
+        candidate_pairs(): Ship pairs per time bin whose envelopes come within range
+        candidate_mask(): Ships x time steps that have at least one candidate pair
+
+    + Classes:
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+    + Envelopes do not wrap around the antimeridian
+
+ToDos:
+
+"""
+
+import numpy as np
+
+from .macros import earth_radius
+from .convert import seamiles_to_meter
+
+
+##> Time steps per envelope (100 steps of 6 seconds = 10 minutes)
+default_bin_size = 100
+##> Relative safety margin of the envelope expansion (spherical degrees vs. geodesic distance)
+envelope_margin = 1.01
+
+
+def time_binned_envelopes(lat: np.ndarray,
+                          lon: np.ndarray,
+                          valid: np.ndarray,
+                          bin_size: int = default_bin_size) -> dict:
+    """Bounding box of every ship per time bin.
+
+    Args:
+        lat (np.ndarray): (n, T) latitudes in degrees
+        lon (np.ndarray): (n, T) longitudes in degrees
+        valid (np.ndarray): (n, T) True where the position is known
+        bin_size (int, optional): time steps per bin. Defaults to default_bin_size.
+
+    Returns:
+        dict: lat_min, lat_max, lon_min, lon_max (n, B) in degrees (NaN where inactive)
+            and active (n, B), with B = ceil(T / bin_size)
+    """
+    n, T = valid.shape
+    bins = -(-T // bin_size)
+    pad = bins * bin_size - T
+
+    # positions that are not finite are not part of any envelope
+    valid = valid & np.isfinite(lat) & np.isfinite(lon)
+
+    def _binned(values: np.ndarray, fill: float) -> np.ndarray:
+        values = np.where(valid, values, fill)
+        values = np.pad(values, ((0, 0), (0, pad)), constant_values=fill)
+        return values.reshape(n, bins, bin_size)
+
+    active = np.pad(valid, ((0, 0), (0, pad))).reshape(n, bins, bin_size).any(axis=2)
+
+    envelopes = {"lat_min": _binned(lat, np.inf).min(axis=2),
+                 "lat_max": _binned(lat, -np.inf).max(axis=2),
+                 "lon_min": _binned(lon, np.inf).min(axis=2),
+                 "lon_max": _binned(lon, -np.inf).max(axis=2)}
+    for key in envelopes:
+        envelopes[key] = np.where(active, envelopes[key], np.nan)
+    envelopes["active"] = active
+
+    return envelopes
+
+
+def _expand(lat_min: np.ndarray,
+            lat_max: np.ndarray,
+            lon_min: np.ndarray,
+            lon_max: np.ndarray,
+            distance: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Grow envelopes by distance (nautical miles) in every direction, conservatively in longitude."""
+    dlat = np.degrees(seamiles_to_meter(distance) * envelope_margin / earth_radius)
+    max_abs_lat = np.minimum(np.maximum(np.abs(lat_min), np.abs(lat_max)) + dlat, 89.9)
+    dlon = dlat / np.cos(np.radians(max_abs_lat))
+
+    return lat_min - dlat, lat_max + dlat, lon_min - dlon, lon_max + dlon
+
+
+def _hash_pairs(lat_min: np.ndarray,
+                lat_max: np.ndarray,
+                lon_min: np.ndarray,
+                lon_max: np.ndarray,
+                cell_size: float) -> np.ndarray:
+    """Unique pairs (a < b) of boxes that overlap a common cell of a regular grid (cell_size degrees)."""
+    iy0, iy1 = np.floor(lat_min / cell_size).astype(np.int64), np.floor(lat_max / cell_size).astype(np.int64)
+    ix0, ix1 = np.floor(lon_min / cell_size).astype(np.int64), np.floor(lon_max / cell_size).astype(np.int64)
+
+    # one entry per (box, covered cell)
+    ny, nx = iy1 - iy0 + 1, ix1 - ix0 + 1
+    counts = ny * nx
+    box = np.repeat(np.arange(len(counts)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cy = iy0[box] + offset // nx[box]
+    cx = ix0[box] + offset % nx[box]
+
+    order = np.lexsort((box, cx, cy))
+    box, cy, cx = box[order], cy[order], cx[order]
+    starts = np.flatnonzero(np.r_[True, (cy[1:] != cy[:-1]) | (cx[1:] != cx[:-1])])
+    stops = np.r_[starts[1:], len(box)]
+
+    pairs = []
+    for start, stop in zip(starts, stops):
+        if stop - start < 2:
+            continue
+        a, b = np.triu_indices(stop - start, k=1)
+        pairs.append(np.column_stack([box[start + a], box[start + b]]))
+
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def candidate_pairs(envelopes: dict, max_distance: float) -> list[np.ndarray]:
+    """Ship pairs per time bin whose envelopes come within max_distance of each other.
+
+    Every pair of ships that is within max_distance at some time step of a bin is a
+    candidate of that bin. The bins are swept in time order, only the ships active in
+    a bin are hashed into a grid of cells at least as large as the expanded envelopes.
+
+    Args:
+        envelopes (dict): result of time_binned_envelopes()
+        max_distance (float): range in nautical miles, e.g. ASSESSMENT_RANGE
+
+    Returns:
+        list[np.ndarray]: per bin (m, 2) ship indices (a < b)
+    """
+    lat_min, lat_max, lon_min, lon_max = _expand(envelopes["lat_min"], envelopes["lat_max"],
+                                                 envelopes["lon_min"], envelopes["lon_max"],
+                                                 max_distance / 2)
+
+    candidates = []
+    for b in range(envelopes["active"].shape[1]):
+        ships = np.flatnonzero(envelopes["active"][:, b])
+        if len(ships) < 2:
+            candidates.append(np.empty((0, 2), dtype=np.int64))
+            continue
+
+        y0, y1 = lat_min[ships, b], lat_max[ships, b]
+        x0, x1 = lon_min[ships, b], lon_max[ships, b]
+        cell_size = max(np.max(y1 - y0), np.max(x1 - x0), 1e-9)
+
+        pairs = _hash_pairs(y0, y1, x0, x1, cell_size)
+
+        # exact intersection of the expanded envelopes
+        i, j = pairs[:, 0], pairs[:, 1]
+        overlap = (y0[i] <= y1[j]) & (y0[j] <= y1[i]) & (x0[i] <= x1[j]) & (x0[j] <= x1[i])
+        candidates.append(ships[pairs[overlap]])
+
+    return candidates
+
+
+def candidate_mask(lat: np.ndarray,
+                   lon: np.ndarray,
+                   valid: np.ndarray,
+                   max_distance: float,
+                   bin_size: int = default_bin_size) -> np.ndarray:
+    """Ships x time steps that can be within max_distance of another ship.
+
+    A ship without any candidate pair in a time bin has no neighbour within
+    max_distance at any time step of the bin, its states can be skipped.
+
+    Args:
+        lat (np.ndarray): (n, T) latitudes in degrees
+        lon (np.ndarray): (n, T) longitudes in degrees
+        valid (np.ndarray): (n, T) True where the position is known
+        max_distance (float): range in nautical miles
+        bin_size (int, optional): time steps per bin. Defaults to default_bin_size.
+
+    Returns:
+        np.ndarray: (n, T) bool, a subset of valid
+    """
+    n, T = valid.shape
+    envelopes = time_binned_envelopes(lat, lon, valid, bin_size)
+
+    in_pair = np.zeros(envelopes["active"].shape, dtype=bool)
+    for b, pairs in enumerate(candidate_pairs(envelopes, max_distance)):
+        in_pair[pairs.ravel(), b] = True
+
+    return valid & np.repeat(in_pair, bin_size, axis=1)[:, :T]
@@ -6,9 +6,11 @@ This includes:
         __get_geodisc_distance(): Get distance between two geo points using geodisc 
         __get_greatcircle_distance(): Get distance between two geo points using great circle
         __get_haversine_distance(): Get distance between two geo points using haversine
+        _meters_to_unit(): Convert distances in meters to the chosen unit
         
     + Public Methods:
         get_geo_distance(): Get distance between two geo points using the chosen method
+        get_geo_distances(): Element wise distances between arrays of geo points
         
     + Classes:
 
@@ -41,16 +43,21 @@ from .macros import *#earth_radius, accepted_distance_units
 from typing import List, Optional
 from geopy.distance import geodesic as gd
 from geopy.distance import great_circle as grc
-from shapely import Polygon, within
+from shapely import Polygon, contains_xy
 from shapely.geometry import Point
 from math import cos, sin, asin, sqrt
 from .convert import deg_to_rad, meter_to_seamiles, meter_to_miles
 from vincenty import vincenty 
+import pyproj
 from movingpandas import Trajectory
 import numpy as np
 from .ship import CAPTN_POINT, is_valid_latitude, is_valid_longitude
 
 
+##> Ellipsoid of the array distances
+_geod = pyproj.Geod(ellps=projection)
+
+
 # import math
 # from convert import deg_to_rad, rad_to_deg
 # from point_in_polygon import point_in_polygon
@@ -301,7 +308,7 @@ def _get_vincenty_distance(a: tuple[float, float],
 def get_geo_distance(a: tuple[float, float] | Point | CAPTN_POINT, 
                      b: tuple[float, float] | Point | CAPTN_POINT,
                      distance_method:   str = accepted_distance_methods['vicenty'], 
-                    #  distance_unit:     str = accepted_distance_units['kilo_meter']) -> float:
+                     distance_unit:     str = accepted_distance_units['kilo_meter']) -> float:
     """Get the shortest path between two points defined in (latitude, longitude) using the Haversine formula
 
     Args:
@@ -361,12 +368,102 @@ def get_geo_distance(a: tuple[float, float] | Point | CAPTN_POINT,
         distance = _get_greatcircle_distance(a=a, b=b, distance_unit=distance_unit)
     elif distance_method == accepted_distance_methods['geodisc']:
         distance = _get_geodisc_distance(a=a, b=b, distance_unit=distance_unit)
+    elif distance_method == accepted_distance_methods['equirectangular']:
+        distance = float(get_geo_distances(a[0], a[1], b[0], b[1],
+                                           distance_method=distance_method,
+                                           distance_unit=distance_unit)[0])
     else:
         raise KeyError("Unrecognised or unimplemented distance method")
     
     assert distance is not None
     return distance
+
+
+def _meters_to_unit(distance: np.ndarray, distance_unit: str) -> np.ndarray:
+    """Convert distances in meters to one of the accepted_distance_units"""
+    if distance_unit == accepted_distance_units['kilo_meter']:
+        return distance / 1000
+    elif distance_unit == accepted_distance_units['meter']:
+        return distance
+    elif distance_unit == accepted_distance_units['nautical_mile']:
+        return meter_to_seamiles(distance)
+    elif distance_unit == accepted_distance_units['mile']:
+        return meter_to_miles(distance)
+
+    raise ValueError(f"Accepted distance units are {accepted_distance_units}")
+
+
+def get_geo_distances(lat1: np.ndarray,
+                      lon1: np.ndarray,
+                      lat2: np.ndarray,
+                      lon2: np.ndarray,
+                      distance_method:   str = accepted_distance_methods['vicenty'],
+                      distance_unit:     str = accepted_distance_units['kilo_meter']) -> np.ndarray:
+    """Element wise distances between arrays of points, the array version of get_geo_distance().
+    The arguments broadcast against each other, method and unit are validated once per call.
+
+    Methods:
+        vicenty, geodisc: geodesic on the WGS84 ellipsoid (pyproj), agrees with Vincenty's 
+            formulae to below a millimeter
+        great_circle, haversine: great circle on a sphere of earth_radius
+        equirectangular: local flat earth approximation around the mean latitude of each pair, 
+            fastest, for fjord scale distances (error below 0.1 % up to ~50 km)
+
+    Args:
+        lat1 (np.ndarray): latitudes of the first locations in degrees
+        lon1 (np.ndarray): longitudes of the first locations in degrees
+        lat2 (np.ndarray): latitudes of the second locations in degrees
+        lon2 (np.ndarray): longitudes of the second locations in degrees
+        distance_method (str, optional): selected distance method for the calculation. Defaults to accepted_distance_methods['vicenty'].
+        distance_unit (str, optional): selected distance unit for the output. Defaults to accepted_distance_units['kilo_meter'].
+
+    Raises:
+        ValueError: Non recognized distance unit
+        ValueError: Non recognized distance method
+        ValueError: Latitudes or longitudes out of range (NaN values are passed through as NaN distances)
+
+    Returns:
+        np.ndarray: Distances in the chosen unit
+    """
+    ##> Validate optional keys
+    distance_unit = distance_unit.lower()
+    if distance_unit not in accepted_distance_units.values(): 
+        raise ValueError(f"Accepted distance units are {accepted_distance_units}")
     
+    distance_method = distance_method.lower()
+    if distance_method not in accepted_distance_methods.values(): 
+        raise ValueError(f"Accepted distance methods are {accepted_distance_methods}")
+
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2)])
+
+    ##> Check the validity of Latitude, Longitude once per array
+    with np.errstate(invalid='ignore'):
+        for lat in (lat1, lat2):
+            if np.any((lat < latitude_range.min) | (lat > latitude_range.max)):
+                raise ValueError(f"Non-valid latitude. Expected values in range [{latitude_range.min}, {latitude_range.max}]")
+        for lon in (lon1, lon2):
+            if np.any((lon < longitude_range.min) | (lon > longitude_range.max)):
+                raise ValueError(f"Non-valid longitude. Expected values in range [{longitude_range.min}, {longitude_range.max}]")
+
+    if distance_method in (accepted_distance_methods['vicenty'], accepted_distance_methods['geodisc']):
+        distance = _geod.inv(lon1, lat1, lon2, lat2)[2]
+        distance = np.where(np.isfinite(lat1 + lon1 + lat2 + lon2), distance, np.nan)
+
+    elif distance_method in (accepted_distance_methods['haversine'], accepted_distance_methods['great_circle']):
+        la_a, la_b = np.radians(lat1), np.radians(lat2)
+        delta_la = la_b - la_a
+        delta_lo = np.radians(lon2 - lon1)
+        distance = np.sin(delta_la / 2)**2 + np.cos(la_a) * np.cos(la_b) * np.sin(delta_lo / 2)**2
+        distance = 2 * np.arcsin(np.sqrt(np.clip(distance, 0, 1))) * earth_radius
+
+    else:
+        # equirectangular
+        x = np.radians((lon2 - lon1 + 180) % 360 - 180) * np.cos(np.radians((lat1 + lat2) / 2))
+        y = np.radians(lat2 - lat1)
+        distance = np.hypot(x, y) * earth_radius
+
+    return _meters_to_unit(distance, distance_unit)
 
 
 def exceeds_geo_fence(position: CAPTN_POINT, geo_fence: Polygon) -> bool:
@@ -387,7 +484,8 @@ def exceeds_geo_fence(position: CAPTN_POINT, geo_fence: Polygon) -> bool:
     lat = pt.x
     lon = pt.y
 
-    return not within(Point(lon,lat),geo_fence)
+    # point in polygon test without a shapely Point, fast on a prepared geo_fence
+    return not contains_xy(geo_fence, lon, lat)
 
 
 def traj_calculate_distance(traj: Trajectory,
@@ -415,22 +513,14 @@ def traj_calculate_distance(traj: Trajectory,
     
     # Inistialise the result
     traj_dist = np.zeros(len(traj_df['lat']))
-    
-    # Loop over the dataframe and compute the distances
-    for i, (index, row) in enumerate(traj_df.iterrows()):
-        
-        # Exit the loop before processing the last row
-        if i == len(traj_df) - 1:
-            break  
-        # print(f"{i}: {index}: {row['epoch']}")
-        point_1 = (traj_df['lat'].iloc[i], traj_df['lon'].iloc[i])
-        point_2 = (traj_df['lat'].iloc[i+1], traj_df['lon'].iloc[i+1])
-        
-        # Get the distance between two consequent locations in nautical miles
-        traj_dist[i + 1] = get_geo_distance(point_1, point_2, 
-                                            distance_method=  distance_method,
-                                            distance_unit= distance_unit)
-        # END FOR
+
+    # Distances between consequent locations, all at once
+    lat = traj_df['lat'].to_numpy(dtype=np.float64)
+    lon = traj_df['lon'].to_numpy(dtype=np.float64)
+    if len(lat) > 1:
+        traj_dist[1:] = get_geo_distances(lat[:-1], lon[:-1], lat[1:], lon[1:],
+                                          distance_method=  distance_method,
+                                          distance_unit= distance_unit)
     return traj_dist.tolist()
     
     
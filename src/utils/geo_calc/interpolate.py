@@ -32,10 +32,18 @@ ToDos:
 
 """
 
+import weakref
+
 from movingpandas import Trajectory
 from scipy.interpolate import PchipInterpolator
 import numpy as np
 
+# Features to consider in the interpolation
+PCHIP_COLUMNS = ['lat', 'lon', 'speed', 'turn']
+
+# (id(traj), drop_duplicates) -> (weakref to traj, number of rows, (xi, interpolator))
+_PCHIP_CACHE = {}
+
 
 def is_strictly_monotonic_increasing(array):
   """
@@ -66,6 +74,88 @@ def is_monotonic_increasing(array):
   return np.all(diff >= 0)
 
 
+def _fit_pchip(traj: Trajectory, drop_duplicates: bool = True) -> tuple[np.ndarray, PchipInterpolator]:
+    """Fit a PCHIP interpolator over the PCHIP_COLUMNS of a trajectory, indexed by epoch."""
+    
+    # Get the dataframe from the trajectory
+    traj_df = traj.df
+    # Sort by epoch
+    traj_df_sorted = traj_df.sort_values(by='epoch')
+    
+    # Remove rows with duplicate epochs and keep only the first
+    if drop_duplicates: traj_df_sorted.drop_duplicates('epoch', keep='first', inplace=True)
+    
+    xi = traj_df_sorted['epoch'].to_numpy()    
+    yi = traj_df_sorted[PCHIP_COLUMNS].to_numpy()
+    
+    # Create a PCHIP interpolator
+    return xi, PchipInterpolator(xi, yi)
+
+
+def get_pchip_interpolator(traj: Trajectory, drop_duplicates = True) -> tuple[np.ndarray, PchipInterpolator]:
+    """
+    Get the PCHIP interpolator of a trajectory. The fit is done once and cached for 
+    as long as the trajectory object lives and the number of its rows does not change.
+
+    Args:
+        traj (Trajectory): Moving pandas trajectory with the columns epoch, lat, lon, speed, turn
+        drop_duplicates (bool, optional): If true drop the rows with duplicate epochs. Defaults to True
+
+    Returns:
+        np.ndarray: Sorted epochs the interpolator was fitted on
+        PchipInterpolator: Interpolator returning the PCHIP_COLUMNS for given epochs
+    """
+    key = (id(traj), drop_duplicates)
+    entry = _PCHIP_CACHE.get(key)
+    
+    if (entry is not None) and (entry[0]() is traj) and (entry[1] == len(traj.df)):
+        return entry[2]
+    
+    fit = _fit_pchip(traj, drop_duplicates)
+    
+    # drop the cache entry once the trajectory is garbage collected
+    if entry is None:
+        weakref.finalize(traj, _PCHIP_CACHE.pop, key, None)
+    _PCHIP_CACHE[key] = (weakref.ref(traj), len(traj.df), fit)
+    
+    return fit
+
+
+def clear_pchip_cache() -> None:
+    """Drop all cached PCHIP interpolators, e.g. after modifying trajectories in place."""
+    _PCHIP_CACHE.clear()
+
+
+def pchip_traj_interpolate(traj: Trajectory, t: np.ndarray, drop_duplicates = True) -> dict:
+    """
+    Interpolate a trajectory at all times t (in Epoch timestamps) inside the trajectory's span
+    with one vectorized call of the cached PCHIP interpolator.
+
+    Args:
+        traj (Trajectory): Moving pandas trajectory with the columns epoch, lat, lon, speed, turn
+        t (np.ndarray): Epoch time stamps to interpolate at. Times outside the span of the
+            trajectory are dropped
+        drop_duplicates (bool, optional): If true drop the rows with duplicate epochs. Defaults to True
+
+    Returns:
+        dict: arrays for 'epoch' (the times inside the span) and each of the PCHIP_COLUMNS
+    """
+    xi, interpolator = get_pchip_interpolator(traj, drop_duplicates)
+    
+    t = np.asarray(t, dtype=np.float64)
+    t = t[(t >= xi[0]) & (t <= xi[-1])]
+    
+    y = interpolator(t)
+    
+    traj_data_interp = {'epoch': t, 
+                        PCHIP_COLUMNS[0]: np.round(y[:, 0], 6), 
+                        PCHIP_COLUMNS[1]: np.round(y[:, 1], 6), 
+                        PCHIP_COLUMNS[2]: y[:, 2], 
+                        PCHIP_COLUMNS[3]: y[:, -1]
+                        }
+    return traj_data_interp
+
+
 def pchip_traj_interpolate_at(traj: Trajectory, t: int, drop_duplicates = True) -> dict:
     """
     Interpolate a trajectory at a time t (in Epoch timestamps) 
@@ -89,33 +179,17 @@ def pchip_traj_interpolate_at(traj: Trajectory, t: int, drop_duplicates = True)
         TrajData: _description_
     """
     
-    # Get the features to consider in the interpolation
-    columns = ['lat', 'lon', 'speed', 'turn']
-    
-    # Get the dataframe from the trajectory
-    traj_df = traj.df
-    # Sort by epoch
-    traj_df_sorted = traj_df.sort_values(by='epoch')
-    
-    # Remove rows with duplicate epochs and keep only the first
-    if drop_duplicates: traj_df_sorted.drop_duplicates('epoch', keep='first', inplace=True)
-    
-    xi = traj_df_sorted['epoch'].to_numpy()    
-    yi = traj_df_sorted[columns].to_numpy()
-    
-    # y = _pchip_interpolate_at(xi, yi, t)
-    
-    # Create a PCHIP interpolator
-    interpolator = PchipInterpolator(xi, yi)
+    # Get the cached PCHIP interpolator of the trajectory
+    _, interpolator = get_pchip_interpolator(traj, drop_duplicates)
 
     # Interpolate y at x_i
     y = interpolator(t)
 
     
     traj_data_interp = {'epoch': t, 
-                        columns[0]: round(y[0], 6), 
-                        columns[1]: round(y[1], 6), 
-                        columns[2]: y[2], 
-                        columns[3]: y[-1]
+                        PCHIP_COLUMNS[0]: round(y[0], 6), 
+                        PCHIP_COLUMNS[1]: round(y[1], 6), 
+                        PCHIP_COLUMNS[2]: y[2], 
+                        PCHIP_COLUMNS[3]: y[-1]
                         }
-    return traj_data_interp
\ No newline at end of file
+    return traj_data_interp
@@ -0,0 +1,132 @@
+"""Vectorized kinematics of sampled trajectories.
+
+This includes:
+    - Private Methods:
+        _segment_starts(): Mark the first row of each segment
+        _fill_first(): Copy the value of the second row of each segment to its first row
+
+    + Public Methods:
+        calc_kinematics(): calc_speed, direction, angular_difference and calc_acc for all rows at once
+
+    + Classes:
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+    Replaces the per trajectory movingpandas add_speed, add_direction,
+    add_angular_difference and add_acceleration calls with numpy arrays.
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import numpy as np
+
+from .macros import earth_radius
+
+
+def _segment_starts(segment_ids: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows that start a new segment (the first row always does)."""
+    starts = np.ones(len(segment_ids), dtype=bool)
+    starts[1:] = segment_ids[1:] != segment_ids[:-1]
+    return starts
+
+
+def _fill_first(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Copy the value of the second row of each segment to its first row, like movingpandas.
+    Segments with a single row are set to NaN.
+    """
+    first = np.flatnonzero(starts)
+    second = first + 1
+
+    single = (second >= len(values)) | np.append(starts[1:], True)[first]
+    values[first[~single]] = values[second[~single]]
+    values[first[single]] = np.nan
+    return values
+
+
+def calc_kinematics(lat: np.ndarray,
+                    lon: np.ndarray,
+                    t: np.ndarray,
+                    segment_ids: np.ndarray = None) -> dict:
+    """Calculate speed, direction, angular difference and acceleration of sampled trajectories.
+
+    All rows are handled in one pass; values are never taken across two segments.
+    The semantics follow movingpandas: the value of a row is calculated from the
+    previous row, the first row of a segment takes the value of the second row
+    (angular_difference: 0).
+
+    Args:
+        lat (np.ndarray): Geographical latitude in degrees
+        lon (np.ndarray): Geographical longitude in degrees
+        t (np.ndarray): Time stamps in seconds, increasing within each segment
+        segment_ids (np.ndarray, optional): Segment (trajectory) id per row, rows of a segment
+            must be consecutive. Defaults to None (one segment)
+
+    Returns:
+        dict:
+            calc_speed (np.ndarray): haversine speed in knots (nm/h)
+            direction (np.ndarray): forward azimuth in degrees [0, 360)
+            angular_difference (np.ndarray): absolute change of direction in degrees [0, 180]
+            calc_acc (np.ndarray): change of speed in nm/h^2
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)
+
+    if segment_ids is None:
+        segment_ids = np.zeros(len(lat))
+    starts = _segment_starts(np.asarray(segment_ids))
+
+    # shared intermediates between consecutive rows
+    cos_lat = np.cos(lat)
+    sin_lat = np.sin(lat)
+    dlat = np.diff(lat, prepend=np.nan)
+    dlon = np.diff(lon, prepend=np.nan)
+    dt_h = np.diff(t, prepend=np.nan) / 3600
+    cos_lat_prev = np.roll(cos_lat, 1)
+    sin_lat_prev = np.roll(sin_lat, 1)
+
+    dlat[starts] = np.nan
+    dlon[starts] = np.nan
+    dt_h[starts] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # haversine distance in nautical miles
+        a = np.sin(dlat / 2)**2 + cos_lat_prev * cos_lat * np.sin(dlon / 2)**2
+        distance = 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))) * earth_radius / 1852
+
+        # forward azimuth from the previous to the current row
+        x = np.sin(dlon) * cos_lat
+        y = cos_lat_prev * sin_lat - sin_lat_prev * cos_lat * np.cos(dlon)
+        direction = (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+        speed = _fill_first(distance / dt_h, starts)
+        direction = _fill_first(direction, starts)
+
+        angular_difference = np.abs(np.diff(direction, prepend=np.nan))
+        angular_difference = np.where(angular_difference > 180,
+                                      360 - angular_difference,
+                                      angular_difference)
+        angular_difference[starts] = 0.0
+
+        acceleration = _fill_first(np.diff(speed, prepend=np.nan) / dt_h, starts)
+
+    return {"calc_speed": speed,
+            "direction": direction,
+            "angular_difference": angular_difference,
+            "calc_acc": acceleration}
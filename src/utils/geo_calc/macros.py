@@ -30,7 +30,8 @@ longitude_range = dotsi.Dict(__longitude_range)
 __accepted_distance_methods = {'geodisc'      : 'geodisc',
                                'great_circle' : 'great_circle',
                                'haversine'    : 'haversine',
-                               'vicenty'      : 'vicenty'}
+                               'vicenty'      : 'vicenty',
+                               'equirectangular': 'equirectangular'}
 accepted_distance_methods = dotsi.Dict(__accepted_distance_methods)
 
 ##> Default values used in cpa
@@ -48,6 +49,25 @@ __s_interaction_types = {'diverging'  : -1,
                         }
 s_interaction_types = dotsi.Dict(__s_interaction_types)
 
+##> Keys for COLREG situations of a ship pair used in metrics.get_colreg_situations()
+__s_colreg_situations = {'none'       : 0,
+                         'head_on'    : 1,    # Rule 14
+                         'crossing'   : 2,    # Rule 15
+                         'overtaking' : 3     # Rule 13
+                        }
+s_colreg_situations = dotsi.Dict(__s_colreg_situations)
+
+##> Keys for COLREG roles of a ship in a situation used in metrics.get_colreg_situations()
+__s_colreg_roles = {'none'     : 0,
+                    'give_way' : 1,
+                    'stand_on' : 2
+                   }
+s_colreg_roles = dotsi.Dict(__s_colreg_roles)
+
+##> COLREG sectors in degrees relative to the heading
+colreg_stern_sector = 112.5     # Rule 13: more than 22.5 degrees abaft the beam
+colreg_head_on_tolerance = 6.0  # Rule 14: ahead and reciprocal course within this tolerance
+
 
 ##> The used ellipsoidal Projection
 projection = "WGS84"
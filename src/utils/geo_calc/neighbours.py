@@ -0,0 +1,130 @@
+"""Spatial indices to select the neighbouring ships of a time step.
+
+This includes:
+    - Private Methods:
+
+    + Public Methods:
+        to_unit_vectors(): Geographical positions as points on the unit sphere
+        chord_length(): Chord length on the unit sphere of a great circle distance
+        nearest_neighbours(): k nearest neighbours of every ship
+        nearest_neighbour_pairs(): Unique ship pairs that are within the k nearest neighbours of one ship
+
+    + Classes:
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .macros import earth_radius
+from .convert import seamiles_to_meter
+
+
+def to_unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Geographical positions in degrees as (n, 3) points on the unit sphere.
+
+    The euclidean (chord) distance between two such points is a monotonic function
+    of their great circle distance, so a KD-tree over them ranks neighbours like the
+    haversine metric, without projection distortion.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_length(distance_nm: float) -> float:
+    """Chord length on the unit sphere of a great circle distance in nautical miles."""
+    return 2 * np.sin(seamiles_to_meter(distance_nm) / (2 * earth_radius))
+
+
+def nearest_neighbours(lat: np.ndarray,
+                       lon: np.ndarray,
+                       k: int,
+                       max_distance: float = None) -> tuple[np.ndarray, np.ndarray]:
+    """k nearest neighbours of every position (the position itself excluded).
+
+    Args:
+        lat (np.ndarray): latitudes in degrees
+        lon (np.ndarray): longitudes in degrees
+        k (int): number of neighbours per position
+        max_distance (float, optional): only neighbours within this great circle distance
+            in nautical miles. Defaults to None (no limit).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (i, j) position indices, j is one of the k nearest
+            neighbours of i, ordered by i and increasing distance
+    """
+    n = len(lat)
+    if n < 2 or k < 1:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    points = to_unit_vectors(lat, lon)
+    tree = cKDTree(points)
+
+    upper_bound = np.inf if max_distance is None else chord_length(max_distance)
+    # the nearest hit of each query is the position itself
+    _, j = tree.query(points, k=min(k + 1, n), distance_upper_bound=upper_bound)
+    j = j.reshape(n, -1)
+    i = np.repeat(np.arange(n), j.shape[1]).reshape(n, -1)
+
+    # missing neighbours (out of range) are reported with index n
+    keep = (j < n) & (j != i)
+    # identical positions may rank another ship before the position itself
+    i, j = i[keep], j[keep]
+    counts = np.bincount(i, minlength=n)
+    over = counts > k
+    if over.any():
+        rank = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = rank < k
+        i, j = i[keep], j[keep]
+
+    return i, j
+
+
+def nearest_neighbour_pairs(lat: np.ndarray,
+                            lon: np.ndarray,
+                            k: int,
+                            max_distance: float = None) -> np.ndarray:
+    """Unique unordered pairs (a, b), a < b, where b is one of the k nearest neighbours of a
+    or a is one of the k nearest neighbours of b.
+
+    The pairs are complete for the k nearest neighbours by the spherical (chord) distance,
+    with O(n * k) pairs instead of all n * (n - 1) / 2 combinations. Rankings by another
+    metric (e.g. WGS84 distances) can differ near ties, query a larger k and filter
+    the pairs by that metric.
+
+    Args:
+        lat (np.ndarray): latitudes in degrees
+        lon (np.ndarray): longitudes in degrees
+        k (int): number of neighbours per position
+        max_distance (float, optional): only pairs within this great circle distance
+            in nautical miles on the sphere of earth_radius. Defaults to None (no limit).
+
+    Returns:
+        np.ndarray: (m, 2) position indices
+    """
+    i, j = nearest_neighbours(lat, lon, k, max_distance)
+    pairs = np.column_stack([np.minimum(i, j), np.maximum(i, j)])
+
+    return np.unique(pairs, axis=0) if len(pairs) else pairs.reshape(0, 2)
@@ -0,0 +1,131 @@
+"""Vectorized propagation of positions along their course.
+
+This includes:
+    - Private Methods:
+        _unmoved(): Keep the start positions of the positions that did not move
+
+    + Public Methods:
+        destination(): Destination of arrays of positions after travelling a distance on a course
+        dead_reckoning(): Positions of arrays of ships after moving with speed and course for a time
+
+    + Classes:
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+    Replaces the scalar geopy great_circle().destination() calls of cpa.__step.
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import numpy as np
+import pyproj
+
+from .macros import earth_radius, projection
+from .convert import seamiles_to_meter
+
+
+##> Accepted earth models of the propagation
+propagation_models = ("sphere", "ellipsoid")
+
+##> Ellipsoid of the ellipsoidal propagation
+_geod = pyproj.Geod(ellps=projection)
+
+
+def _unmoved(latitude, longitude, distance, lat_new, lon_new) -> tuple[np.ndarray, np.ndarray]:
+    """Start positions where distance is 0, the destinations otherwise.
+
+    The longitude is only wrapped where it leaves [-180, 180), round trips of the 
+    trigonometry and the wrap would move unmoved positions by ~1e-15 degrees.
+    """
+    lon_new = np.where((lon_new < -180) | (lon_new >= 180), (lon_new + 540) % 360 - 180, lon_new)
+    unmoved = np.asarray(distance) == 0
+
+    return np.where(unmoved, latitude, lat_new), np.where(unmoved, longitude, lon_new)
+
+
+def destination(latitude: np.ndarray,
+                longitude: np.ndarray,
+                course: np.ndarray,
+                distance: np.ndarray,
+                model: str = "sphere") -> tuple[np.ndarray, np.ndarray]:
+    """Destination after travelling a distance from the start position with the initial course.
+    All arguments broadcast against each other, no objects are created per position.
+
+    Args:
+        latitude (np.ndarray): start latitude in degrees
+        longitude (np.ndarray): start longitude in degrees
+        course (np.ndarray): initial course (azimuth) in degrees
+        distance (np.ndarray): travelled distance in meters
+        model (str, optional): "sphere" (great circle on a sphere of earth_radius, same as
+            geopy's great_circle().destination()) or "ellipsoid" (geodesic on the WGS84
+            ellipsoid). Defaults to "sphere".
+
+    Raises:
+        ValueError: Non recognized model
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: latitude, longitude in degrees, longitude in [-180, 180),
+            the start position for a distance of 0
+    """
+    if model == "sphere":
+        lat = np.radians(latitude)
+        lon = np.radians(longitude)
+        course = np.radians(course)
+        d = np.divide(distance, earth_radius)
+
+        sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+        sin_d, cos_d = np.sin(d), np.cos(d)
+
+        lat_new = np.arcsin(sin_lat * cos_d + cos_lat * sin_d * np.cos(course))
+        lon_new = lon + np.arctan2(np.sin(course) * sin_d * cos_lat,
+                                   cos_d - sin_lat * np.sin(lat_new))
+
+        return _unmoved(latitude, longitude, distance, np.degrees(lat_new), np.degrees(lon_new))
+
+    if model == "ellipsoid":
+        latitude, longitude, course, distance = np.broadcast_arrays(
+            *[np.asarray(v, dtype=np.float64) for v in (latitude, longitude, course, distance)])
+        lon_new, lat_new, _ = _geod.fwd(longitude, latitude, course, distance)
+
+        return _unmoved(latitude, longitude, distance, np.asarray(lat_new), np.asarray(lon_new))
+
+    raise ValueError(f"Accepted propagation models are {propagation_models}")
+
+
+def dead_reckoning(latitude: np.ndarray,
+                   longitude: np.ndarray,
+                   speed: np.ndarray,
+                   course: np.ndarray,
+                   time: np.ndarray,
+                   model: str = "sphere") -> tuple[np.ndarray, np.ndarray]:
+    """Positions of ships that keep their speed and course for the given time.
+
+    Args:
+        latitude (np.ndarray): latitude in degrees
+        longitude (np.ndarray): longitude in degrees
+        speed (np.ndarray): speed over ground in knots
+        course (np.ndarray): course over ground in degrees
+        time (np.ndarray): time in seconds
+        model (str, optional): earth model, see destination(). Defaults to "sphere".
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: latitude, longitude in degrees
+    """
+    distance = seamiles_to_meter(np.asarray(speed, dtype=np.float64) * np.asarray(time, dtype=np.float64) / 3600)
+    return destination(latitude, longitude, course, distance, model=model)
@@ -0,0 +1,330 @@
+"""Precomputed geo rasters for fast point lookups against map geometries.
+
+This includes:
+    - Private Methods:
+        _local_geometry(): Project a geometry onto a local tangent plane
+
+    + Public Methods:
+        local_distance(): Exact distance of points to a geometry in meters
+        geometry_hash(): Hash of a geometry to identify the geometry of a persisted raster
+        get_geo_raster(): Load a raster from disk or build and persist it
+
+    + Classes:
+        GeoRaster: Mask and boundary distance of a geometry on a regular lat/lon grid
+
+
+Authors:
+    Ghassan Al-Falouji <gaf@informatik.uni-kiel.de>
+    Lukas Haschke <lha@informatik.uni-kiel.de>
+
+Project:
+    CAPTN FördeAreal
+
+License:
+    MIT
+
+Creation date:
+    July 2023
+
+Modifications:
+
+Known Bugs:
+
+ToDos:
+
+"""
+
+import os
+import math
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+from shapely import Polygon, MultiPolygon
+from scipy.ndimage import distance_transform_edt
+
+from .macros import earth_radius
+from .convert import geographical_to_local
+from .coastline import CoastlineIndex
+
+
+##> Default raster resolution in meters
+default_resolution = 25.0
+##> Cells around the geometry bounds that are part of the raster
+default_margin_cells = 10
+
+
+@dataclass
+class GeoRaster:
+    """Mask and distance to the boundary of a geometry on a regular lat/lon grid.
+
+    Cell (i, j) covers latitudes lat0 + [i, i+1) * dlat and longitudes lon0 + [j, j+1) * dlon.
+
+    Args:
+        lat0 (float): southern edge of the raster in degrees
+        lon0 (float): western edge of the raster in degrees
+        dlat (float): cell height in degrees
+        dlon (float): cell width in degrees
+        resolution (float): cell size in meters
+        mask (np.ndarray): True where the cell centre lies within the polygon
+        distance (np.ndarray): distance of the cell centre to the boundary in meters
+        geometry_hash (str, optional): geometry_hash() of the rasterized geometry. Defaults to "".
+
+    Examples:
+        water = GeoRaster.from_geometry(water_area, resolution=25)
+        shore = GeoRaster.from_geometry(coastline, resolution=25)
+        shore.save("kiel_fjord_coastline.npz")
+        in_water = water.contains(lat, lon, polygon=water_area)
+        distance = shore.distance_at(lat, lon, geometry=coastline)
+    """
+
+    lat0: float
+    lon0: float
+    dlat: float
+    dlon: float
+    resolution: float
+    mask: np.ndarray
+    distance: np.ndarray
+    geometry_hash: str = ""
+
+    @classmethod
+    def from_geometry(cls,
+                      geometry,
+                      resolution: float = default_resolution,
+                      margin_cells: int = default_margin_cells) -> "GeoRaster":
+        """Rasterize a geometry (lon/lat, EPSG:4326) and compute the Euclidean distance 
+        transform to its boundary (polygons) or to itself (lines, e.g. a coastline).
+
+        Args:
+            geometry (Polygon | MultiPolygon | LineString | MultiLineString): geometry in (longitude, latitude)
+            resolution (float, optional): Cell size in meters. Defaults to default_resolution.
+            margin_cells (int, optional): Cells added around the geometry bounds. Defaults to default_margin_cells.
+
+        Returns:
+            GeoRaster: the raster, the mask is all False for lines
+        """
+        lon_min, lat_min, lon_max, lat_max = geometry.bounds
+        lat_mid = (lat_min + lat_max) / 2
+
+        dlat = math.degrees(resolution / earth_radius)
+        dlon = math.degrees(resolution / (earth_radius * math.cos(math.radians(lat_mid))))
+
+        lat0 = lat_min - margin_cells * dlat
+        lon0 = lon_min - margin_cells * dlon
+        ny = int(math.ceil((lat_max - lat0) / dlat)) + margin_cells
+        nx = int(math.ceil((lon_max - lon0) / dlon)) + margin_cells
+
+        if geometry.geom_type in ("Polygon", "MultiPolygon"):
+            # cell centres
+            lats = lat0 + (np.arange(ny) + 0.5) * dlat
+            lons = lon0 + (np.arange(nx) + 0.5) * dlon
+            lon_grid, lat_grid = np.meshgrid(lons, lats)
+
+            shapely.prepare(geometry)
+            mask = shapely.contains_xy(geometry, lon_grid, lat_grid)
+            boundary = geometry.boundary
+        else:
+            mask = np.zeros((ny, nx), dtype=bool)
+            boundary = geometry
+
+        # cells the boundary passes through, from vertices at most half a cell apart
+        coords = shapely.get_coordinates(
+            shapely.segmentize(boundary, max_segment_length=min(dlat, dlon) / 2))
+        rows = np.clip(((coords[:, 1] - lat0) / dlat).astype(np.int64), 0, ny - 1)
+        cols = np.clip(((coords[:, 0] - lon0) / dlon).astype(np.int64), 0, nx - 1)
+        on_boundary = np.zeros((ny, nx), dtype=bool)
+        on_boundary[rows, cols] = True
+
+        # distance of each cell centre to the nearest boundary cell centre
+        distance = distance_transform_edt(~on_boundary, sampling=resolution)
+
+        return cls(lat0=lat0, lon0=lon0, dlat=dlat, dlon=dlon,
+                   resolution=resolution,
+                   mask=mask,
+                   distance=distance.astype(np.float32),
+                   geometry_hash=geometry_hash(geometry))
+
+    @classmethod
+    def load(cls, path: str) -> "GeoRaster":
+        """Load a raster stored with save(), rasters without geometry_hash get ""."""
+        with np.load(path) as data:
+            return cls(lat0=float(data["lat0"]), lon0=float(data["lon0"]),
+                       dlat=float(data["dlat"]), dlon=float(data["dlon"]),
+                       resolution=float(data["resolution"]),
+                       mask=data["mask"],
+                       distance=data["distance"],
+                       geometry_hash=str(data["geometry_hash"]) if "geometry_hash" in data.files else "")
+
+    def save(self, path: str) -> None:
+        """Persist the raster as compressed .npz file."""
+        np.savez_compressed(path,
+                            lat0=self.lat0, lon0=self.lon0,
+                            dlat=self.dlat, dlon=self.dlon,
+                            resolution=self.resolution,
+                            mask=self.mask,
+                            distance=self.distance,
+                            geometry_hash=self.geometry_hash)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.mask.shape
+
+    def _fractional_index(self, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Fractional (row, column) in cell centre coordinates and whether the point is on the raster."""
+        fy = (np.asarray(lat, dtype=np.float64) - self.lat0) / self.dlat - 0.5
+        fx = (np.asarray(lon, dtype=np.float64) - self.lon0) / self.dlon - 0.5
+        ny, nx = self.shape
+        on_raster = (fy >= 0) & (fy <= ny - 1) & (fx >= 0) & (fx <= nx - 1)
+        return fy, fx, on_raster
+
+    def _sample(self, lat: np.ndarray, lon: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest cell mask and bilinear distance, NaN/False off the raster."""
+        fy, fx, on_raster = self._fractional_index(lat, lon)
+        ny, nx = self.shape
+
+        fy = np.clip(np.nan_to_num(fy), 0, ny - 1)
+        fx = np.clip(np.nan_to_num(fx), 0, nx - 1)
+        y0 = np.minimum(np.floor(fy).astype(np.int64), ny - 2)
+        x0 = np.minimum(np.floor(fx).astype(np.int64), nx - 2)
+        wy = fy - y0
+        wx = fx - x0
+
+        d = self.distance
+        distance = ((1 - wy) * (1 - wx) * d[y0, x0] + (1 - wy) * wx * d[y0, x0 + 1] +
+                    wy * (1 - wx) * d[y0 + 1, x0] + wy * wx * d[y0 + 1, x0 + 1])
+        distance = np.where(on_raster, distance, np.nan)
+
+        mask = self.mask[np.rint(fy).astype(np.int64), np.rint(fx).astype(np.int64)] & on_raster
+
+        return mask, distance, on_raster
+
+    def _near_boundary(self, distance: np.ndarray, on_raster: np.ndarray, fallback_cells: float) -> np.ndarray:
+        return (~on_raster) | (distance < fallback_cells * self.resolution)
+
+    def contains(self,
+                 lat: np.ndarray,
+                 lon: np.ndarray,
+                 polygon: Polygon | MultiPolygon = None,
+                 fallback_cells: float = 2) -> np.ndarray:
+        """Whether the points lie within the rasterized polygon.
+
+        Args:
+            lat (np.ndarray): latitudes in degrees
+            lon (np.ndarray): longitudes in degrees
+            polygon (Polygon | MultiPolygon, optional): exact geometry, tested for points
+                within fallback_cells of the boundary or off the raster. Defaults to None.
+            fallback_cells (float, optional): Width of the exact band in cells. Defaults to 2.
+
+        Returns:
+            np.ndarray: bool per point
+        """
+        mask, distance, on_raster = self._sample(lat, lon)
+
+        if polygon is not None:
+            exact = self._near_boundary(distance, on_raster, fallback_cells)
+            if exact.any():
+                shapely.prepare(polygon)
+                mask[exact] = shapely.contains_xy(polygon,
+                                                  np.asarray(lon)[exact],
+                                                  np.asarray(lat)[exact])
+        return mask
+
+    def distance_at(self,
+                    lat: np.ndarray,
+                    lon: np.ndarray,
+                    geometry = None,
+                    fallback_cells: float = 2) -> np.ndarray:
+        """Distance of the points to the rasterized geometry in meters (bilinear lookup 
+        of the boundary distance), 0 for points inside a rasterized polygon.
+
+        Args:
+            lat (np.ndarray): latitudes in degrees
+            lon (np.ndarray): longitudes in degrees
+            geometry (optional): exact geometry (the polygon or its coastline) or its CoastlineIndex,
+                measured for points within fallback_cells of the boundary or off the raster. Defaults to None.
+            fallback_cells (float, optional): Width of the exact band in cells. Defaults to 2.
+
+        Returns:
+            np.ndarray: distance in meters per point (NaN off the raster without geometry)
+        """
+        mask, distance, on_raster = self._sample(lat, lon)
+        exact = self._near_boundary(distance, on_raster, fallback_cells)
+        distance[mask] = 0
+
+        if geometry is not None:
+            if exact.any() and isinstance(geometry, CoastlineIndex):
+                distance[exact] = geometry.distance(np.asarray(lat)[exact],
+                                                    np.asarray(lon)[exact])
+            elif exact.any():
+                distance[exact] = local_distance(np.asarray(lat)[exact],
+                                                 np.asarray(lon)[exact],
+                                                 geometry)
+        return distance
+
+
+def local_distance(lat: np.ndarray, lon: np.ndarray, geometry) -> np.ndarray:
+    """Exact distance in meters of points to a (lon, lat) geometry, measured on the local
+    tangent plane around the geometry's centroid. Polygons are measured to their boundary,
+    points inside them have a distance of 0.
+
+    Args:
+        lat (np.ndarray): latitudes in degrees
+        lon (np.ndarray): longitudes in degrees
+        geometry: shapely geometry in (longitude, latitude)
+
+    Returns:
+        np.ndarray: distance in meters per point
+    """
+    inside = np.zeros(np.shape(lat), dtype=bool)
+    if geometry.geom_type in ("Polygon", "MultiPolygon"):
+        inside = shapely.contains_xy(geometry, lon, lat)
+        geometry = geometry.boundary
+
+    centroid = geometry.centroid
+    local = _local_geometry(geometry, centroid.y, centroid.x)
+    x, y = geographical_to_local(lat, lon, centroid.y, centroid.x)
+
+    return np.where(inside, 0.0, shapely.distance(local, shapely.points(x, y)))
+
+
+def _local_geometry(geometry, latitude0: float, longitude0: float):
+    """Project a (lon, lat) geometry onto the local tangent plane around (latitude0, longitude0)."""
+
+    def _to_local(coords: np.ndarray) -> np.ndarray:
+        x, y = geographical_to_local(coords[:, 1], coords[:, 0], latitude0, longitude0)
+        return np.column_stack([x, y])
+
+    return shapely.transform(geometry, _to_local)
+
+
+def geometry_hash(geometry) -> str:
+    """SHA-1 of the WKB of a geometry, identical for identical coordinates."""
+    return hashlib.sha1(shapely.to_wkb(geometry)).hexdigest()
+
+
+def get_geo_raster(path: str,
+                   geometry,
+                   resolution: float = default_resolution) -> GeoRaster:
+    """Load the raster persisted at path, or build it from the geometry and persist it.
+
+    The persisted raster is rebuilt if it was built with another resolution or
+    from another geometry (see geometry_hash()), e.g. after a map update.
+
+    Args:
+        path (str): .npz file of the raster
+        geometry: polygon or line to rasterize if path does not exist or does not match
+        resolution (float, optional): Cell size in meters. Defaults to default_resolution.
+
+    Returns:
+        GeoRaster: the raster
+    """
+    if os.path.isfile(path):
+        raster = GeoRaster.load(path)
+        if math.isclose(raster.resolution, resolution) and raster.geometry_hash == geometry_hash(geometry):
+            return raster
+
+    raster = GeoRaster.from_geometry(geometry, resolution=resolution)
+    raster.save(path)
+
+    return raster
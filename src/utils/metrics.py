@@ -38,7 +38,9 @@ ToDos:
 import math
 
 import pyproj
-from utils.geo_calc.macros import projection
+from utils.geo_calc.macros import projection, s_colreg_situations, s_colreg_roles
+from utils.geo_calc.macros import colreg_stern_sector, colreg_head_on_tolerance
+from utils.geo_calc.convert import meter_to_seamiles
 from geomag import declination
 
 import numpy as np
@@ -55,7 +57,8 @@ import matplotlib.pyplot as plt
 from typing import Union
 
 
-
+##> Ellipsoid shared by the bearing and distance calculations
+_geod = pyproj.Geod(ellps= projection)
 
 
 def get_declination(lat: float, lon: float) -> float:
@@ -81,11 +84,8 @@ def get_declination(lat: float, lon: float) -> float:
 
 def abs_bearing_and_distance(lat1, lon1, lat2, lon2):
 
-    # Initialize the projection object with the WGS 84 ellipsoid parameters
-    p = pyproj.Geod(ellps= projection)
-
     # Calculate the initial bearing from ship 1 to ship 2
-    abs_bearing_12, abs_bearing_21, distance = p.inv(lon1, lat1, lon2, lat2)
+    abs_bearing_12, abs_bearing_21, distance = _geod.inv(lon1, lat1, lon2, lat2)
     abs_bearing_12 = (abs_bearing_12 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
     abs_bearing_21 = (abs_bearing_21 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
 
@@ -141,11 +141,8 @@ def get_abs_bearings(lat1: float, lon1: float, lat2: float, lon2: float) -> dict
                 
     """
 
-    # Initialize the projection object with the WGS 84 ellipsoid parameters
-    p = pyproj.Geod(ellps= projection)
-
     # Calculate the initial bearing from ship 1 to ship 2
-    abs_bearing_12, abs_bearing_21, _ = p.inv(lon1, lat1, lon2, lat2)
+    abs_bearing_12, abs_bearing_21, _ = _geod.inv(lon1, lat1, lon2, lat2)
     abs_bearing_12 = (abs_bearing_12 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
     abs_bearing_21 = (abs_bearing_21 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
 
@@ -210,4 +207,144 @@ def relative_speed(speed1: float, course1: float, speed2: float, course2: float)
     # Calculate the magnitude of the relative speed
     relative_speed = math.sqrt(relative_north_component ** 2 + relative_perpendicular_component ** 2)
 
-    return relative_speed
\ No newline at end of file
+    return relative_speed
+
+
+def relative_speeds(speed1: np.ndarray, course1: np.ndarray, speed2: np.ndarray, course2: np.ndarray) -> np.ndarray:
+    """Array version of relative_speed()
+
+    Args:
+        speed1 (np.ndarray): Speeds of the first ships
+        course1 (np.ndarray): Courses over ground of the first ships in degrees
+        speed2 (np.ndarray): Speeds of the second ships
+        course2 (np.ndarray): Courses over ground of the second ships in degrees
+
+    Returns:
+        np.ndarray: relative speeds in the unit of the speeds
+    """
+    course1_rad = np.radians(course1)
+    course2_rad = np.radians(course2)
+
+    relative_north_component = speed2 * np.cos(course2_rad) - speed1 * np.cos(course1_rad)
+    relative_perpendicular_component = speed2 * np.sin(course2_rad) - speed1 * np.sin(course1_rad)
+
+    return np.hypot(relative_north_component, relative_perpendicular_component)
+
+
+def get_pair_metrics(lat1: np.ndarray, lon1: np.ndarray, heading1: np.ndarray, speed1: np.ndarray,
+                     lat2: np.ndarray, lon2: np.ndarray, heading2: np.ndarray, speed2: np.ndarray) -> dict:
+    """Bearings, distance and relative speed of arrays of ship pairs with a single Geod.inv call.
+    Same values as get_abs_bearings(), get_rel_bearings() and relative_speed() per pair.
+
+    Args:
+        lat1 (np.ndarray): Geographical latitudes of the first ships in degree
+        lon1 (np.ndarray): Geographical longitudes of the first ships in degree
+        heading1 (np.ndarray): Headings (COG) of the first ships in degrees
+        speed1 (np.ndarray): Speeds of the first ships in knots
+        lat2 (np.ndarray): Geographical latitudes of the second ships in degree
+        lon2 (np.ndarray): Geographical longitudes of the second ships in degree
+        heading2 (np.ndarray): Headings (COG) of the second ships in degrees
+        speed2 (np.ndarray): Speeds of the second ships in knots
+
+    Returns:
+        dict:
+            abs_bearing_12, abs_bearing_21 (keys)
+                val (np.ndarray): Bearing angles in degrees of ship 1 to 2 and 2 to 1
+            rel_bearing_12, rel_bearing_21 (keys)
+                val (np.ndarray): Bearing angles in degrees relative to the heading of ship 1 and 2
+            distance (key)
+                val (np.ndarray): Geodesic distance in nautical miles
+            rel_speed (key)
+                val (np.ndarray): Relative speed in knots
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2)])
+
+    abs_bearing_12, abs_bearing_21, distance = _geod.inv(lon1, lat1, lon2, lat2)
+    abs_bearing_12 = (abs_bearing_12 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
+    abs_bearing_21 = (abs_bearing_21 + 360) % 360  # Ensure the bearing is within [0, 360] degrees
+
+    return {'abs_bearing_12': abs_bearing_12,
+            'abs_bearing_21': abs_bearing_21,
+            'rel_bearing_12': (abs_bearing_12 - heading1) % 360,
+            'rel_bearing_21': (abs_bearing_21 - heading2) % 360,
+            'distance': meter_to_seamiles(distance),
+            'rel_speed': relative_speeds(speed1, heading1, speed2, heading2)}
+
+
+def get_colreg_situations(rel_bearing_12: np.ndarray, rel_bearing_21: np.ndarray,
+                          course1: np.ndarray, course2: np.ndarray,
+                          speed1: np.ndarray, speed2: np.ndarray,
+                          tcpa: np.ndarray = None,
+                          min_speed: float = 0.5,
+                          head_on_tolerance: float = colreg_head_on_tolerance) -> dict:
+    """COLREG situation of arrays of ship pairs and the role of both ships.
+
+    Only pairs where both ships are underway (min_speed) and, with tcpa, that
+    converge are classified, in the order:
+        head-on (Rule 14): both ships ahead of each other within head_on_tolerance
+            on reciprocal courses, both give way
+        overtaking (Rule 13): the faster ship approaches from more than 22.5 degrees
+            abaft the beam of the other, the overtaking ship gives way
+        crossing (Rule 15): neither ship abaft the other's beam, the ship that has
+            the other on its starboard side gives way
+
+    Args:
+        rel_bearing_12 (np.ndarray): Bearings of ship 2 relative to the heading of ship 1 in degrees
+        rel_bearing_21 (np.ndarray): Bearings of ship 1 relative to the heading of ship 2 in degrees
+        course1 (np.ndarray): Courses over ground of the first ships in degrees
+        course2 (np.ndarray): Courses over ground of the second ships in degrees
+        speed1 (np.ndarray): Speeds of the first ships in knots
+        speed2 (np.ndarray): Speeds of the second ships in knots
+        tcpa (np.ndarray, optional): Time to the CPA in seconds, pairs with tcpa <= 0
+            are not classified. Defaults to None (all pairs).
+        min_speed (float, optional): Speed in knots below which a ship is not underway. Defaults to 0.5.
+        head_on_tolerance (float, optional): Tolerance in degrees of the head-on sector and
+            the reciprocal courses. Defaults to colreg_head_on_tolerance.
+
+    Returns:
+        dict:
+            situation (key)
+                val (np.ndarray): s_colreg_situations per pair
+            role_1, role_2 (keys)
+                val (np.ndarray): s_colreg_roles of ship 1 and 2 per pair
+    """
+    rel_bearing_12, rel_bearing_21, course1, course2, speed1, speed2 = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(v, dtype=np.float64))
+          for v in (rel_bearing_12, rel_bearing_21, course1, course2, speed1, speed2)])
+
+    def _ahead(bearing):
+        return (bearing <= head_on_tolerance) | (bearing >= 360 - head_on_tolerance)
+
+    def _abaft(bearing):
+        return (bearing > colreg_stern_sector) & (bearing < 360 - colreg_stern_sector)
+
+    risk = (speed1 >= min_speed) & (speed2 >= min_speed)
+    if tcpa is not None:
+        risk &= np.asarray(tcpa, dtype=np.float64) > 0
+
+    # 0 for reciprocal courses
+    course_difference = np.abs((course1 - course2) % 360 - 180)
+
+    head_on = risk & _ahead(rel_bearing_12) & _ahead(rel_bearing_21) & (course_difference <= head_on_tolerance)
+    behind_1, behind_2 = _abaft(rel_bearing_21), _abaft(rel_bearing_12)
+    overtaking_1 = risk & ~head_on & behind_1 & ~behind_2 & (speed1 > speed2)  # ship 1 overtakes ship 2
+    overtaking_2 = risk & ~head_on & behind_2 & ~behind_1 & (speed2 > speed1)  # ship 2 overtakes ship 1
+    crossing = risk & ~head_on & ~behind_1 & ~behind_2
+    starboard_12 = (rel_bearing_12 > 0) & (rel_bearing_12 < 180)                # ship 2 on the starboard side of ship 1
+
+    situation = np.full(len(risk), s_colreg_situations.none, dtype=np.int64)
+    situation[head_on] = s_colreg_situations.head_on
+    situation[crossing] = s_colreg_situations.crossing
+    situation[overtaking_1 | overtaking_2] = s_colreg_situations.overtaking
+
+    give_way_1 = head_on | overtaking_1 | (crossing & starboard_12)
+    give_way_2 = head_on | overtaking_2 | (crossing & ~starboard_12)
+    classified = situation != s_colreg_situations.none
+
+    role_1 = np.where(give_way_1, s_colreg_roles.give_way,
+                      np.where(classified, s_colreg_roles.stand_on, s_colreg_roles.none))
+    role_2 = np.where(give_way_2, s_colreg_roles.give_way,
+                      np.where(classified, s_colreg_roles.stand_on, s_colreg_roles.none))
+
+    return {'situation': situation, 'role_1': role_1, 'role_2': role_2}